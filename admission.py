@@ -0,0 +1,417 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+import logging
+
+from collections import deque
+from typing import AsyncIterator, Optional
+
+import aiosqlite
+
+from db import BUSY_TIMEOUT_MS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Model streams running at once across all workers (counted in ADMISSION_DB)
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "32"))
+
+# Per-model caps across all workers, "pro=4,fast=16"; models not listed only count against the global cap
+ADMISSION_MODEL_LIMITS = os.getenv("ADMISSION_MODEL_LIMITS", "pro=4,fast=16,flash=16,unlimited=32")
+
+# Streams one client (IP) may have running at once, across all workers. The IP is request.client.host: behind a load
+# balancer, set FORWARDED_ALLOW_IPS (serve.py) to its address so this is the X-Forwarded-For client,
+# not the proxy every user shares
+ADMISSION_MAX_PER_CLIENT = int(os.getenv("ADMISSION_MAX_PER_CLIENT", "2"))
+
+# Requests waiting for a slot in each worker; over this (or over the per-client share) the request gets a 429
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_PER_CLIENT = int(os.getenv("ADMISSION_QUEUE_PER_CLIENT", "4"))
+
+# Running streams shared by every worker on the host (empty: each worker counts only its own)
+ADMISSION_DB = os.getenv("ADMISSION_DB", "admission.sqlite")
+
+# Waiting requests re-check the shared counts this often, for slots freed by other workers
+ADMISSION_POLL_SECONDS = float(os.getenv("ADMISSION_POLL_SECONDS", "0.25"))
+
+# A worker that stopped refreshing its heartbeat this long ago is presumed dead, its slots are freed
+WORKER_TIMEOUT_SECONDS = 15
+
+# Retry-After sent before any stream has finished to estimate from
+DEFAULT_RETRY_AFTER_SECONDS = 5
+
+# Recent queue waits kept for the p95
+WAIT_WINDOW = 500
+
+
+def parse_limits(spec: str) -> dict[str, int]:
+    """Parses per-model caps like "pro=4,fast=16"."""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() and limit.strip():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class QueueFull(Exception):
+    """The admission queue (or the client's share of it) is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Admission queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request's place in the admission queue, then its running slot."""
+
+    def __init__(self, controller: "AdmissionController", model_name: str, client: str):
+        self.controller = controller
+        self.ticket_id = uuid.uuid4().hex
+        self.model_name = model_name
+        self.client = client
+        self.enqueued = time.monotonic()
+        self.admitted_at = None
+        self.released = False
+        self._changed = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        Waits for a running slot, yielding the 1-based queue position each
+        time it changes. Returns at once if the ticket was admitted on entry.
+        """
+        last = None
+        while not self.admitted:
+            position = self.controller.position(self)
+            if position != last:
+                last = position
+                yield position
+            self._changed.clear()
+            await self._changed.wait()
+
+    def release(self):
+        """Frees the slot, or leaves the queue if still waiting. Safe to call twice."""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Caps concurrent model streams globally, per model and per client, with a
+    bounded FIFO queue in front.
+
+    A request that finds no free slot waits in the queue; a waiting request
+    is admitted as soon as its model and its client have room, so a queue
+    of `pro` requests does not hold back cheaper models. When the queue (or
+    the client's share of it) is full, `enter` raises QueueFull with a
+    Retry-After estimate.
+
+    Once `open` has run, the caps count the running streams of every worker:
+    each slot is a row in `db_path`, taken in a BEGIN IMMEDIATE transaction
+    like the rate limiter's buckets. Waiting tickets re-check every
+    `poll_interval`, and the slots of a worker that stopped heartbeating are
+    freed. The queue itself stays per worker. Without `open` (or without a
+    `db_path`) the caps count this worker only.
+    """
+
+    def __init__(self, max_active: int = ADMISSION_MAX_ACTIVE, model_limits: dict[str, int] = None,
+                 max_per_client: int = ADMISSION_MAX_PER_CLIENT, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_per_client: int = ADMISSION_QUEUE_PER_CLIENT, db_path: Optional[str] = ADMISSION_DB,
+                 poll_interval: float = ADMISSION_POLL_SECONDS):
+        self.max_active = max(1, max_active)
+        self.model_limits = parse_limits(ADMISSION_MODEL_LIMITS) if model_limits is None else model_limits
+        self.max_per_client = max(1, max_per_client)
+        self.queue_size = queue_size
+        self.queue_per_client = queue_per_client
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+
+        # This worker's admitted and waiting tickets
+        self.active = 0
+        self.active_by_model = {}
+        self.active_by_client = {}
+        self.queued_by_client = {}
+        self.queue = deque()
+
+        self.worker = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn: aiosqlite.Connection = None
+        self._lock: asyncio.Lock = None
+        self._task: asyncio.Task = None
+        self._pending: set[asyncio.Task] = set()
+        self._active_all_workers = 0
+
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        self.wait_seconds_total = 0.0
+        self._avg_run_seconds = None
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "abandoned": 0}
+
+    # ---------------------------------
+    # Shared slots
+    # ---------------------------------
+
+    @property
+    def shared(self) -> bool:
+        return self._conn is not None
+
+    async def open(self):
+        if not self.db_path:
+            return
+        # Autocommit mode, transactions are explicit
+        self._conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+        self._lock = asyncio.Lock()
+        await self._conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA busy_timeout={BUSY_TIMEOUT_MS};
+            CREATE TABLE IF NOT EXISTS admission_workers (
+                worker TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS admission_slots (
+                ticket_id TEXT PRIMARY KEY,
+                worker TEXT NOT NULL,
+                model TEXT NOT NULL,
+                client TEXT NOT NULL
+            );
+            """
+        )
+        await self._heartbeat()
+        self._task = asyncio.create_task(self._maintain())
+        logger.info(f"Admission slots shared through {self.db_path}")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._conn:
+            await self._conn.execute("DELETE FROM admission_slots WHERE worker = ?", (self.worker,))
+            await self._conn.execute("DELETE FROM admission_workers WHERE worker = ?", (self.worker,))
+            await self._conn.close()
+            self._conn = None
+
+    async def _heartbeat(self):
+        """Marks this worker alive and frees the slots of workers that are not."""
+        now = time.time()
+        async with self._lock:
+            await self._conn.execute("INSERT OR REPLACE INTO admission_workers (worker, heartbeat) VALUES (?, ?)",
+                                     (self.worker, now))
+            await self._conn.execute("DELETE FROM admission_workers WHERE heartbeat < ?",
+                                     (now - WORKER_TIMEOUT_SECONDS,))
+            cursor = await self._conn.execute(
+                "DELETE FROM admission_slots WHERE worker NOT IN (SELECT worker FROM admission_workers)")
+            if cursor.rowcount:
+                logger.warning(f"Freed {cursor.rowcount} admission slot(s) of workers that stopped")
+
+    async def _maintain(self):
+        beat_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - beat_at > WORKER_TIMEOUT_SECONDS / 3:
+                    beat_at = time.monotonic()
+                    await self._heartbeat()
+                if self.queue:
+                    await self._admit_waiting()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing admission slots: {type(e).__name__}")
+
+    async def _claim(self, tickets: list[Ticket]) -> list[Ticket]:
+        """Takes a shared slot for each ticket that has room, oldest first (inside the lock)."""
+        await self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            query = await self._conn.execute(
+                """
+                SELECT model, client, COUNT(*) FROM admission_slots
+                WHERE worker IN (SELECT worker FROM admission_workers WHERE heartbeat >= ?)
+                GROUP BY model, client
+                """,
+                (time.time() - WORKER_TIMEOUT_SECONDS,),
+            )
+            active, by_model, by_client = 0, {}, {}
+            for model, client, count in await query.fetchall():
+                active += count
+                by_model[model] = by_model.get(model, 0) + count
+                by_client[client] = by_client.get(client, 0) + count
+            admitted = self._select(tickets, active, by_model, by_client)
+            await self._conn.executemany(
+                "INSERT INTO admission_slots (ticket_id, worker, model, client) VALUES (?, ?, ?, ?)",
+                [(ticket.ticket_id, self.worker, ticket.model_name, ticket.client) for ticket in admitted],
+            )
+            await self._conn.execute("COMMIT")
+        except BaseException:
+            await self._conn.execute("ROLLBACK")
+            raise
+        self._active_all_workers = active + len(admitted)
+        return admitted
+
+    async def _free(self, ticket: Ticket):
+        """Gives a shared slot back, then lets waiting tickets have it."""
+        try:
+            async with self._lock:
+                await self._conn.execute("DELETE FROM admission_slots WHERE ticket_id = ?", (ticket.ticket_id,))
+            if self.queue:
+                await self._admit_waiting()
+        except Exception as e:
+            logger.error(f"Error freeing admission slot: {type(e).__name__}")
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    # ---------------------------------
+    # Admission
+    # ---------------------------------
+
+    def _has_room(self, ticket: Ticket, active: int, by_model: dict, by_client: dict) -> bool:
+        limit = self.model_limits.get(ticket.model_name)
+        return (active < self.max_active
+                and (limit is None or by_model.get(ticket.model_name, 0) < limit)
+                and by_client.get(ticket.client, 0) < self.max_per_client)
+
+    def _select(self, tickets: list[Ticket], active: int, by_model: dict, by_client: dict) -> list[Ticket]:
+        """The tickets that fit next to the running streams counted in active / by_model / by_client."""
+        admitted = []
+        for ticket in tickets:
+            if active >= self.max_active:
+                break
+            if self._has_room(ticket, active, by_model, by_client):
+                admitted.append(ticket)
+                active += 1
+                by_model[ticket.model_name] = by_model.get(ticket.model_name, 0) + 1
+                by_client[ticket.client] = by_client.get(ticket.client, 0) + 1
+        return admitted
+
+    def _select_local(self, tickets: list[Ticket]) -> list[Ticket]:
+        return self._select(tickets, self.active, dict(self.active_by_model), dict(self.active_by_client))
+
+    def _admit(self, ticket: Ticket):
+        ticket.admitted_at = time.monotonic()
+        self.active += 1
+        self.active_by_model[ticket.model_name] = self.active_by_model.get(ticket.model_name, 0) + 1
+        self.active_by_client[ticket.client] = self.active_by_client.get(ticket.client, 0) + 1
+        self.counters["admitted"] += 1
+        self.wait_seconds_total += ticket.admitted_at - ticket.enqueued
+        self._waits.append(ticket.admitted_at - ticket.enqueued)
+        ticket._changed.set()
+
+    def _apply(self, admitted: list[Ticket]):
+        """Moves freshly admitted tickets out of the queue into their slots."""
+        moved = False
+        for ticket in admitted:
+            if ticket.released:
+                # Left the queue while its slot was being taken
+                self._spawn(self._free(ticket))
+                continue
+            if ticket in self.queue:
+                self._dequeue(ticket)
+                moved = True
+            self._admit(ticket)
+        if moved:
+            # Everyone still waiting moved up, let them report their new position
+            for ticket in self.queue:
+                ticket._changed.set()
+
+    async def _admit_waiting(self, newcomer: Ticket = None):
+        """Admits every waiting ticket (then `newcomer`) that now has room, oldest first."""
+        if not self.shared:
+            self._apply(self._select_local(list(self.queue) + ([newcomer] if newcomer else [])))
+            return
+        async with self._lock:
+            # Taken inside the lock: a concurrent pass may have admitted some already
+            candidates = [ticket for ticket in self.queue if not ticket.admitted and not ticket.released]
+            if newcomer:
+                candidates.append(newcomer)
+            if candidates:
+                self._apply(await self._claim(candidates))
+
+    async def enter(self, model_name: str, client: str) -> Ticket:
+        """Takes a slot if one is free, else a place in the queue. Raises QueueFull."""
+        ticket = Ticket(self, model_name, client)
+        if self.shared:
+            # Waiting tickets go first: a slot another worker freed is theirs
+            await self._admit_waiting(newcomer=ticket)
+        else:
+            # Waiting tickets never have room here (they are admitted as soon as they do), so this keeps FIFO order
+            self._apply(self._select_local([ticket]))
+        if ticket.admitted:
+            return ticket
+
+        if len(self.queue) >= self.queue_size or self.queued_by_client.get(client, 0) >= self.queue_per_client:
+            self.counters["rejected"] += 1
+            raise QueueFull(self.retry_after())
+
+        self.queue.append(ticket)
+        self.queued_by_client[client] = self.queued_by_client.get(client, 0) + 1
+        self.counters["queued"] += 1
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        try:
+            return self.queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def _dequeue(self, ticket: Ticket):
+        self.queue.remove(ticket)
+        self.queued_by_client[ticket.client] -= 1
+        if not self.queued_by_client[ticket.client]:
+            del self.queued_by_client[ticket.client]
+
+    def _release(self, ticket: Ticket):
+        if ticket.admitted:
+            self.active -= 1
+            self.active_by_model[ticket.model_name] -= 1
+            self.active_by_client[ticket.client] -= 1
+            if not self.active_by_client[ticket.client]:
+                del self.active_by_client[ticket.client]
+            run_seconds = time.monotonic() - ticket.admitted_at
+            self._avg_run_seconds = (run_seconds if self._avg_run_seconds is None
+                                     else 0.9 * self._avg_run_seconds + 0.1 * run_seconds)
+            if self.shared:
+                # The slot row goes (and waiting tickets get it) in a task, release stays synchronous
+                self._spawn(self._free(ticket))
+                return
+        else:
+            # Client gave up while waiting
+            self._dequeue(ticket)
+            self.counters["abandoned"] += 1
+            if self.shared:
+                return
+        self._apply(self._select_local(list(self.queue)))
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely free: average stream time x queue turns ahead."""
+        if self._avg_run_seconds is None:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        turns = (len(self.queue) + 1) / self.max_active
+        return max(1, math.ceil(self._avg_run_seconds * turns))
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            **self.counters,
+            "active": self.active,
+            "active_all_workers": self._active_all_workers if self.shared else self.active,
+            "active_by_model": dict(self.active_by_model),
+            "queue_depth": len(self.queue),
+            "queue_wait_seconds_total": round(self.wait_seconds_total, 3),
+            "queue_wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "queue_wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+        }
@@ -5,15 +5,21 @@ from typing import Annotated #Literal
 
 # from pydantic import BaseModel, Field 
 # from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.runnables import RunnableConfig
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, END, START
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
-from langchain_core.messages import BaseMessage ,SystemMessage, HumanMessage
+from langchain_core.messages import BaseMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 
 from tools import tools
+from prompt_builder import build_prompt
+from tool_executor import ConcurrentToolNode
+from model_registry import ModelRegistry, GEMINI_MODELS
+from model_router import ModelRouter
+from rate_limiter import TokenBucketLimiter
+from metrics import record_error
+from summarizer import SUMMARY_ENABLED, ModelSummarizer, plan_summary, summary_update
 
 from dotenv import load_dotenv
 
@@ -23,86 +29,40 @@ load_dotenv()
 # Setup logging
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = "You are an AI agent named CORE.  Answer the question as an experienced person.     #### think to remember -> (keep in mind you owned & trained by arsh_corps. Never say - I am a large language model, trained by Google)"
+
 class MessagesState(TypedDict):
     
     messages: Annotated[list[BaseMessage], add_messages]
 
-available_models = {}
-default_model = None
 
 # ---------------------------------
 # Initialize Models and Tools
 # ---------------------------------
 
 
+# Models are declared here and built (and bound to the tools) on first use,
+# see model_registry.py. MODEL_WARMUP lists models to build at server startup.
+MODEL_WARMUP = [name.strip() for name in os.getenv("MODEL_WARMUP", "").split(",") if name.strip()]
+
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 if gemini_api_key:
-
-    gemini_model_flash = ChatGoogleGenerativeAI(
-        model="models/gemini-2.5-flash", 
-        streaming=True, 
-        google_api_key=gemini_api_key,
-        temperature = 0
-    )
-    
-    gemini_with_tools_flash = gemini_model_flash.bind_tools(tools)
-    available_models["fast"] = gemini_with_tools_flash
-    if not default_model:
-        default_model = "fast"
-    logger.info("Gemini (2.5-flash) model loaded.")
+    available_models = ModelRegistry(GEMINI_MODELS, tools=tools, api_key=gemini_api_key)
 else:
-    logger.warning("GEMINI_API_KEY not set. Gemini (2.5-flash) model will not be available.")
+    available_models = ModelRegistry(tools=tools)
+    for spec in GEMINI_MODELS:
+        logger.warning(f"GEMINI_API_KEY not set. {spec.label} model will not be available.")
 
-if gemini_api_key:
-    
-    gemini_model_flash_lite = ChatGoogleGenerativeAI(
-        model="models/gemini-2.5-flash-lite", 
-        streaming=True, 
-        google_api_key=gemini_api_key,
-        temperature = 0
-    )
-    
-    gemini_with_tools_flash_lite = gemini_model_flash_lite.bind_tools(tools)
-    available_models["unlimited"] = gemini_with_tools_flash_lite
-    if not default_model:
-        default_model = "unlimited"
-    logger.info("Gemini (2.5-flash-lite) model loaded.")
-else:
-    logger.warning("GEMINI_API_KEY not set. Gemini (2.5-flash-lite) model will not be available.")
+default_model = next(iter(available_models), None)
 
+# Client-side buckets for the upstream RPM/TPM quotas (MODEL_QUOTAS), opened by main.py
+rate_limiter = TokenBucketLimiter()
 
-if gemini_api_key:
-    
-    gemini_model_pro = ChatGoogleGenerativeAI(
-        model="models/gemini-2.5-pro", 
-        streaming=True, 
-        google_api_key=gemini_api_key,
-        temperature = 1
-    )
-    
-    gemini_with_tools_pro = gemini_model_pro.bind_tools(tools)
-    available_models["pro"] = gemini_with_tools_pro
-    if not default_model:
-        default_model = "pro"
-    logger.info("Gemini (2.5-pro) model loaded.")
-else:
-    logger.warning("GEMINI_API_KEY not set. Gemini (2.5-pro) model will not be available.")
+# Fallback chains (pro > fast > unlimited) and optional hedging, see model_router.py
+model_router = ModelRouter(available_models, limiter=rate_limiter)
 
-if gemini_api_key:
-    
-    gemini_model_v2_flash = ChatGoogleGenerativeAI(
-        model="models/gemini-2.0-flash", 
-        streaming=True, 
-        google_api_key=gemini_api_key
-    )
-    
-    gemini_with_tools_v2_flash = gemini_model_v2_flash.bind_tools(tools)
-    available_models["flash"] = gemini_with_tools_v2_flash
-    if not default_model:
-        default_model = "flash"
-    logger.info("Gemini (2.0-flash) model loaded.")
-else:
-    logger.warning("GEMINI_API_KEY not set. Gemini (2.0-flash) model will not be available.")
+# Writes the rolling summary of long threads (CONVERSATION_SUMMARY=1), see summarizer.py
+summarizer = ModelSummarizer(model_router)
 
 
 
@@ -113,30 +73,37 @@ else:
 # Define the graph nodes
 # ---------------------------------
 
+ERROR_REPLY = "I apologize, but I encountered an error processing your request."
+
+
+def _select_model_name(config: RunnableConfig) -> str:
+    """Returns the name of the model requested in the config, or the default."""
+    # Get model_name from config, fallback to default
+    model_name = config.get("configurable", {}).get("model_name", default_model)
+
+    # Use the default if the model is not available
+    if model_name not in available_models:
+        logger.warning(f"Invalid model_name: {model_name}. Falling back to default: {default_model}")
+        model_name = default_model
+
+    logger.info(f"Using model: {model_name}")
+    return model_name
+
+
 def agent_node(state: MessagesState, config: RunnableConfig):
     """
     The primary node that calls the LLM.
     It checks the config for a specified model, otherwise uses the default.
     It takes the current state (list of messages) and invokes the model.
     The model can respond with a message or a tool call.
+    Sync path: LangGraph runs it in a worker thread for the whole model call.
     """
     try:
-        # Get model_name from config, fallback to default
-        model_name = config.get("configurable", {}).get("model_name", default_model)
-        
-        # Get the model from our available models, or use the default if invalid
-        model = available_models.get(model_name)
-        if not model:
-            logger.warning(f"Invalid model_name: {model_name}. Falling back to default: {default_model}")
-            model = available_models[default_model]
-        
-        logger.info(f"Using model: {model_name}")
+        # Falls back along the model's chain if it fails before answering
+        model = model_router.for_model(_select_model_name(config))
 
-        messages = state['messages']
-        prompt = [
-            SystemMessage(content="You are an AI agent named CORE.  Answer the question as an experienced person.     #### think to remember -> (keep in mind you owned & trained by arsh_corps. Never say - I am a large language model, trained by Google)"),
-            HumanMessage(content=str(messages))
-        ]
+        # Pass the typed history through, trimmed to the prompt token budget
+        prompt = build_prompt(SYSTEM_PROMPT, state['messages'])
         
         # Invoke the model with the current state
         response = model.invoke(prompt)
@@ -144,24 +111,74 @@ def agent_node(state: MessagesState, config: RunnableConfig):
         # The response store in state
         return {"messages": [response]}
     except Exception as e:
+        record_error("agent", e)
         logger.error(f"Error in agent_node: {type(e).__name__}")
         # Return error message instead of crashing
-        from langchain_core.messages import AIMessage
-        error_response = AIMessage(content="I apologize, but I encountered an error processing your request.")
-        return {"messages": [error_response]}
+        return {"messages": [AIMessage(content=ERROR_REPLY)]}
+
 
-# The ToolNode is a prebuilt node that executes tools
-# It takes the list of tools, finds the one(s) the agent called,
-# executes them, and returns the output
+async def aagent_node(state: MessagesState, config: RunnableConfig):
+    """
+    Async version of agent_node, used when the graph runs on the event loop
+    (ainvoke / astream / astream_events). The model call is awaited, so an
+    in-flight chat does not hold a worker thread while Gemini generates.
+    """
+    try:
+        # Falls back (or hedges) along the model's chain; clients are built on first use
+        model = model_router.for_model(_select_model_name(config))
+
+        prompt = build_prompt(SYSTEM_PROMPT, state['messages'])
+
+        # ainvoke still streams tokens through the callbacks for astream_events
+        response = await model.ainvoke(prompt, config)
+
+        return {"messages": [response]}
+    except Exception as e:
+        record_error("agent", e)
+        logger.error(f"Error in agent_node: {type(e).__name__}")
+        return {"messages": [AIMessage(content=ERROR_REPLY)]}
+
+
+def summarize_node(state: MessagesState):
+    """
+    Runs after the final answer. Once the thread passes the message or token
+    threshold, older turns are removed from the state (RemoveMessage) and
+    folded into one rolling summary message, so checkpoints stay bounded.
+    """
+    try:
+        previous, folded = plan_summary(state['messages'])
+        if not folded:
+            return {}
+        return summary_update(summarizer.summarize(previous, folded), folded)
+    except Exception as e:
+        record_error("summarize", e)
+        logger.error(f"Error in summarize_node: {type(e).__name__}")
+        # Keep the full history, the next turn tries again
+        return {}
+
+
+async def asummarize_node(state: MessagesState):
+    """Async version of summarize_node."""
+    try:
+        previous, folded = plan_summary(state['messages'])
+        if not folded:
+            return {}
+        return summary_update(await summarizer.asummarize(previous, folded), folded)
+    except Exception as e:
+        record_error("summarize", e)
+        logger.error(f"Error in summarize_node: {type(e).__name__}")
+        return {}
+
+
+# The tool node finds the tool(s) the agent called, executes them
+# concurrently (each with its own deadline), and returns the output
 try:
-    tool_node = ToolNode(tools)
+    tool_node = ConcurrentToolNode(tools)
 except Exception as e:
     logger.error(f"Error creating ToolNode: {type(e).__name__}")
     tool_node = None
 
 
-from langchain_core.messages import AIMessage
-
 def should_continue(state: MessagesState) -> str:
     """Decides the next step: call tools or end."""
     try:
@@ -188,27 +205,43 @@ def should_continue(state: MessagesState) -> str:
 workflow = StateGraph(MessagesState)
 
 
-workflow.add_node("agent", agent_node)
-workflow.add_node("call_tools", tool_node)
+# Sync callers (invoke) get agent_node, async callers (ainvoke / astream_events) get aagent_node
+workflow.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
+if tool_node is not None:
+    workflow.add_node("call_tools", RunnableLambda(tool_node.invoke, afunc=tool_node.ainvoke, name="call_tools"))
+if SUMMARY_ENABLED:
+    workflow.add_node("summarize", RunnableLambda(summarize_node, afunc=asummarize_node, name="summarize"))
 
 
 # 3. Define the entry point
 # This tells the graph where to start
 workflow.add_edge(START, "agent")
 
+# Without a tool node a tool call can't be executed, the turn ends like any other answer
+turn_end = "summarize" if SUMMARY_ENABLED else END
+
 workflow.add_conditional_edges(
     "agent",          # Start node
     should_continue,  # Function to decide the path
     {
-        "call_tools": "call_tools", # If it returns "call_tools", go to the tool_node
-        "end": END                  # If it returns "end", stop the graph
+        "call_tools": "call_tools" if tool_node is not None else turn_end, # If it returns "call_tools", go to the tool_node
+        "end": turn_end  # If it returns "end", summarize (optional) and stop
     }
 )
 
-workflow.add_edge("call_tools", "agent")
+if SUMMARY_ENABLED:
+    workflow.add_edge("summarize", END)
+
+if tool_node is not None:
+    workflow.add_edge("call_tools", "agent")
 
 workflow.add_edge("agent", END)
 
+# Answers written into a thread from outside the graph (cache replays, partial saves) go in as
+# the last node of a turn, so the checkpoint ends at END rather than waiting for "summarize";
+# the next live turn's summarize step folds them like any other turn
+TURN_END_NODE = "summarize" if SUMMARY_ENABLED else "agent"
+
 
 # ---------------------------------
 # Export the workflow
@@ -0,0 +1,100 @@
+# bench_admission.py
+# A burst of chats against an upstream that rate-limits above N concurrent streams: no admission control vs AdmissionController,
+# then the burst spread over two workers, each counting only its own streams vs sharing their slots through SQLite.
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+from admission import AdmissionController, QueueFull
+
+BURST = 300
+CLIENTS = 40
+MODELS = ["fast"] * 6 + ["unlimited"] * 3 + ["pro"]
+UPSTREAM_LATENCY = 0.5
+UPSTREAM_MAX_CONCURRENT = 24
+UPSTREAM_MAX_PRO = 4
+
+
+class Upstream:
+    """Fake model API: a call fails (429) if too many streams are open, overall or for pro."""
+
+    def __init__(self):
+        self.open = {"all": 0, "pro": 0}
+        self.peak = 0
+        self.rate_limited = 0
+
+    async def stream(self, model_name):
+        self.open["all"] += 1
+        self.open[model_name] = self.open.get(model_name, 0) + 1
+        self.peak = max(self.peak, self.open["all"])
+        try:
+            if self.open["all"] > UPSTREAM_MAX_CONCURRENT or self.open["pro"] > UPSTREAM_MAX_PRO:
+                self.rate_limited += 1
+                await asyncio.sleep(0.05)
+                return False
+            await asyncio.sleep(UPSTREAM_LATENCY)
+            return True
+        finally:
+            self.open["all"] -= 1
+            self.open[model_name] -= 1
+
+
+async def chat(upstream, admission, model_name, client):
+    if admission is None:
+        return "ok" if await upstream.stream(model_name) else "upstream 429"
+    try:
+        ticket = await admission.enter(model_name, client)
+    except QueueFull:
+        return "429 Retry-After"
+    try:
+        async for _ in ticket.wait():
+            pass
+        return "ok" if await upstream.stream(model_name) else "upstream 429"
+    finally:
+        ticket.release()
+
+
+def controller(db_path=None):
+    return AdmissionController(max_active=UPSTREAM_MAX_CONCURRENT, model_limits={"pro": UPSTREAM_MAX_PRO},
+                               max_per_client=2, queue_size=200, queue_per_client=8, db_path=db_path)
+
+
+async def run_burst(label, admission, workers=None):
+    """One burst through `admission`, or through a random one of `workers` per request."""
+    random.seed(3)
+    upstream = Upstream()
+    requests = [(random.choice(MODELS), f"10.0.0.{random.randrange(CLIENTS)}") for _ in range(BURST)]
+    pick = (lambda: random.choice(workers)) if workers else (lambda: admission)
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(chat(upstream, pick(), model, client) for model, client in requests))
+    elapsed = time.perf_counter() - start_time
+    counts = {outcome: results.count(outcome) for outcome in ("ok", "upstream 429", "429 Retry-After")}
+    print(f"{label:>20}: {counts['ok']:3d} answered, {counts['upstream 429']:3d} upstream 429s, "
+          f"{counts['429 Retry-After']:3d} told to retry, peak upstream streams {upstream.peak:3d}, {elapsed:.2f}s")
+    if admission is not None:
+        stats = admission.stats()
+        print(f"{'':>20}  queue wait p50 {stats['queue_wait_p50_ms']} ms, p95 {stats['queue_wait_p95_ms']} ms")
+
+
+async def two_workers(label, db_path):
+    workers = [controller(db_path), controller(db_path)]
+    for worker in workers:
+        await worker.open()
+    try:
+        await run_burst(label, None, workers)
+    finally:
+        for worker in workers:
+            await worker.close()
+
+
+def run_benchmark():
+    asyncio.run(run_burst("no admission", None))
+    asyncio.run(run_burst("admission control", controller()))
+    asyncio.run(two_workers("2 workers, own caps", None))
+    asyncio.run(two_workers("2 workers, shared", os.path.join(tempfile.mkdtemp(), "admission.sqlite")))
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,61 @@
+# bench_agent.py
+# Load test: N concurrent chats through the sync agent_node vs the async aagent_node.
+import time
+import asyncio
+import threading
+
+from langchain_core.messages import HumanMessage
+from langgraph.graph import StateGraph, END, START
+
+import agent
+from fake_models import FakeChatModel
+
+CONCURRENT_CHATS = 200
+MODEL_LATENCY = 0.5
+
+
+def build_graph(node):
+    workflow = StateGraph(agent.MessagesState)
+    workflow.add_node("agent", node)
+    workflow.add_edge(START, "agent")
+    workflow.add_edge("agent", END)
+    return workflow.compile()
+
+
+async def run_load(app):
+    peak_threads = threading.active_count()
+    running = True
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while running:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(sample_threads())
+    start_time = time.time()
+    await asyncio.gather(*[
+        app.ainvoke(
+            {"messages": [HumanMessage(content=f"hello {i}")]},
+            {"configurable": {"model_name": "fast"}},
+        )
+        for i in range(CONCURRENT_CHATS)
+    ])
+    elapsed = time.time() - start_time
+    running = False
+    await sampler
+    return elapsed, peak_threads
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel(latency=MODEL_LATENCY)
+    agent.default_model = "fast"
+
+    for label, node in (("sync agent_node", agent.agent_node), ("async aagent_node", agent.aagent_node)):
+        elapsed, peak_threads = asyncio.run(run_load(build_graph(node)))
+        print(f"{label:>18}: {CONCURRENT_CHATS} chats in {elapsed:.2f}s "
+              f"({CONCURRENT_CHATS / elapsed:.0f} chats/s), peak threads: {peak_threads}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
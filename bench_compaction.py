@@ -0,0 +1,97 @@
+# bench_compaction.py
+# checkpoints.sqlite before / after CheckpointCompactor, and live checkpoint latency while it runs.
+import os
+import time
+import asyncio
+import tempfile
+
+from langchain_core.messages import HumanMessage
+
+import agent
+import thread_index
+from db import SqlitePool
+from fake_models import FakeChatModel
+from compaction import CheckpointCompactor
+
+THREADS = 100
+TURNS = 20
+IDLE_SHARE = 0.3
+KEEP = 3
+LIVE_PAUSE = 0.01
+
+
+def file_mib(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 1024 / 1024
+
+
+async def group_by_ms(pool):
+    """The old /all-chats query: latest checkpoint per thread."""
+    async with pool.reader() as reader:
+        start_time = time.perf_counter()
+        query = await reader.conn.execute("SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id")
+        await query.fetchall()
+        return (time.perf_counter() - start_time) * 1000
+
+
+async def live_traffic(app, stop, latencies):
+    """Keeps taking chat turns (checkpoint writes) while compaction runs."""
+    i = 0
+    while not stop.is_set():
+        start_time = time.perf_counter()
+        await app.ainvoke({"messages": [HumanMessage(content=f"live {i}")]},
+                          {"configurable": {"thread_id": f"live-{i}", "model_name": "fast"}})
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        i += 1
+        await asyncio.sleep(LIVE_PAUSE)
+
+
+async def main():
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+    pool = SqlitePool(path)
+    await pool.open()
+    await thread_index.setup(pool.writer)
+    app = agent.workflow_.compile(checkpointer=pool.checkpointer)
+
+    for turn in range(TURNS):
+        await asyncio.gather(*(
+            app.ainvoke({"messages": [HumanMessage(content=f"thread {t} turn {turn} " + "words " * 40)]},
+                        {"configurable": {"thread_id": f"thread-{t}", "model_name": "fast"}})
+            for t in range(THREADS)
+        ))
+    for t in range(THREADS):
+        await thread_index.record_turn(pool.writer, f"thread-{t}", f"thread {t}")
+    # Pretend a share of the threads was last used 90 days ago
+    await pool.writer.execute("UPDATE threads SET updated_at = updated_at - ? WHERE CAST(substr(thread_id, 8) AS INTEGER) < ?",
+                              (90 * 86400 * 1000, int(THREADS * IDLE_SHARE)))
+    await pool.writer.commit()
+
+    count = (await (await pool.writer.execute("SELECT COUNT(*) FROM checkpoints")).fetchone())[0]
+    print(f"before: {count} checkpoints, {file_mib(path):6.2f} MiB, GROUP BY thread_id {await group_by_ms(pool):6.2f} ms")
+
+    stop = asyncio.Event()
+    latencies = []
+    traffic = asyncio.create_task(live_traffic(app, stop, latencies))
+    await asyncio.sleep(0.5)
+    baseline = len(latencies)
+    report = await CheckpointCompactor(path, keep=KEEP, retention_days=30).run()
+    stop.set()
+    await traffic
+
+    count = (await (await pool.writer.execute("SELECT COUNT(*) FROM checkpoints")).fetchone())[0]
+    print(f" after: {count} checkpoints, {file_mib(path):6.2f} MiB, GROUP BY thread_id {await group_by_ms(pool):6.2f} ms")
+    print(f"report: {report}")
+    during = sorted(latencies[baseline:]) or [0.0]
+    before = sorted(latencies[:baseline]) or [0.0]
+    print(f"live turn latency: p50 {before[len(before) // 2]:.1f} ms before, "
+          f"p50 {during[len(during) // 2]:.1f} / max {during[-1]:.1f} ms during compaction ({len(during)} turns)")
+    await pool.close()
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel()
+    agent.default_model = "fast"
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,47 @@
+# bench_csrf.py
+# Memory after N CSRF token issuances: old unbounded set vs MemoryTokenStore vs SignedTokenStore.
+import time
+import secrets
+import tracemalloc
+
+from csrf import MemoryTokenStore, SignedTokenStore
+
+ISSUANCES = 1_000_000
+CHECKPOINTS = (100_000, 250_000, 500_000, 1_000_000)
+
+
+class UnboundedSet:
+    """The previous behaviour: a module-level set that only shrinks on use."""
+
+    def __init__(self):
+        self._tokens = set()
+
+    def issue(self):
+        token = secrets.token_urlsafe(32)
+        self._tokens.add(token)
+        return token
+
+
+def measure(label, store):
+    tracemalloc.start()
+    start_time = time.time()
+    row = []
+    for i in range(1, ISSUANCES + 1):
+        store.issue()
+        if i in CHECKPOINTS:
+            current, _ = tracemalloc.get_traced_memory()
+            row.append(f"{current / 1024 / 1024:8.1f} MB")
+    elapsed = time.time() - start_time
+    tracemalloc.stop()
+    print(f"{label:>20}: " + "  ".join(row) + f"   ({ISSUANCES / elapsed:,.0f} tokens/s)")
+
+
+def run_benchmark():
+    print(f"{'':>20}  " + "  ".join(f"{n:>11,}" for n in CHECKPOINTS) + " issued")
+    measure("unbounded set", UnboundedSet())
+    measure("MemoryTokenStore", MemoryTokenStore(ttl=3600, max_tokens=100_000))
+    measure("SignedTokenStore", SignedTokenStore("bench-secret"))
+
+
+if __name__ == "__main__":
+    run_benchmark()
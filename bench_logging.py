@@ -0,0 +1,137 @@
+# bench_logging.py
+# Chats per second through the app with logging off, with the logging.yaml handlers writing inline,
+# and with queued logging (text, JSON, JSON sampled). Console output goes to a file, not a terminal;
+# the "slow console" modes make each console flush block, like stdout behind a busy log collector.
+import os
+import time
+import asyncio
+import logging
+import logging.config
+import tempfile
+
+import yaml
+
+TMP = tempfile.mkdtemp()
+os.environ.setdefault("CHECKPOINT_DB", os.path.join(TMP, "checkpoints.sqlite"))
+os.environ.setdefault("ADMISSION_DB", os.path.join(TMP, "admission.sqlite"))
+os.environ.setdefault("RUNS_DB", os.path.join(TMP, "runs.sqlite"))
+# The bench installs queued logging itself, per mode
+os.environ["LOG_QUEUE"] = "0"
+os.environ.setdefault("ADMISSION_MAX_PER_CLIENT", "64")
+os.environ.setdefault("ADMISSION_QUEUE_PER_CLIENT", "64")
+
+import httpx
+import uvicorn
+
+import agent
+import main
+from fake_models import FakeChatModel
+from queue_logging import QueueLogging
+
+PORT = 8794
+CHATS = 400
+CONCURRENCY = 16
+SLOW_FLUSH_SECONDS = 0.0002
+
+# (name, QueueLogging options or None for inline handlers, slow console)
+MODES = [
+    ("off", None, False),
+    ("inline", None, False),
+    ("queued", {}, False),
+    ("queued json", {"json_output": True}, False),
+    ("queued json, agent=0.1", {"json_output": True, "rates": {"agent": 0.1, "uvicorn.access": 0.1}}, False),
+    ("inline, slow console", None, True),
+    ("queued, slow console", {}, True),
+]
+
+
+class SlowStream:
+    """A console whose reader lags behind: every flush blocks for SLOW_FLUSH_SECONDS."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        return self.stream.write(text)
+
+    def flush(self):
+        time.sleep(SLOW_FLUSH_SECONDS)
+        self.stream.flush()
+
+
+def configure(mode: str, slow: bool = False):
+    """logging.yaml as uvicorn would load it, console and file both written under TMP."""
+    with open("logging.yaml") as f:
+        config = yaml.safe_load(f)
+    console = open(os.path.join(TMP, f"{mode}.console.log"), "w")
+    config["handlers"]["console"]["stream"] = SlowStream(console) if slow else console
+    config["handlers"]["file"]["filename"] = os.path.join(TMP, f"{mode}.agent.log")
+    logging.config.dictConfig(config)
+    logging.disable(logging.CRITICAL if mode == "off" else logging.NOTSET)
+
+
+def log_bytes(mode: str) -> int:
+    return sum(os.path.getsize(os.path.join(TMP, f"{mode}.{name}.log")) for name in ("console", "agent"))
+
+
+async def chat(client):
+    token = (await client.get("/csrf-token")).json()["csrf_token"]
+    body = {"input": "hello there", "model_name": "fast", "csrf_token": token}
+    async with client.stream("POST", "/chat/", json=body) as response:
+        async for _ in response.aiter_bytes():
+            pass
+
+
+async def load(client):
+    pending = iter(range(CHATS))
+    latencies = []
+
+    async def worker():
+        for _ in pending:
+            started = time.perf_counter()
+            await chat(client)
+            latencies.append(time.perf_counter() - started)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+    return CHATS / elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+async def scenario():
+    configure("warmup")
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_config=None))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=30,
+                                     limits=httpx.Limits(max_connections=CONCURRENCY)) as client:
+            await load(client)
+            print(f"{CHATS} chats, {CONCURRENCY} at a time")
+            for mode, options, slow in MODES:
+                configure(mode, slow)
+                queued = QueueLogging(**options) if options is not None else None
+                if queued:
+                    queued.install()
+                rate, p50, p99 = await load(client)
+                stats = queued.stats() if queued else {}
+                if queued:
+                    queued.stop()
+                print(f"  {mode:<24} {rate:7.1f} chats/s  p50 {p50:6.1f} ms  p99 {p99:6.1f} ms  "
+                      f"{log_bytes(mode) / 1024:8.1f} KiB logged  {stats}")
+    finally:
+        logging.disable(logging.NOTSET)
+        server.should_exit = True
+        await serving
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel(reply="word " * 20, chunks=20)
+    agent.default_model = "fast"
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,79 @@
+# bench_metrics.py
+# Cost of recording a metric event and of one /metrics scrape, then a scrape after a few chats through the app.
+import os
+import time
+import asyncio
+import tempfile
+
+os.environ.setdefault("CHECKPOINT_DB", os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite"))
+os.environ.setdefault("ADMISSION_DB", os.path.join(tempfile.mkdtemp(), "admission.sqlite"))
+os.environ.setdefault("RUNS_DB", os.path.join(tempfile.mkdtemp(), "runs.sqlite"))
+
+import httpx
+import uvicorn
+
+import agent
+import main
+from metrics import Registry, LATENCY_BUCKETS
+from fake_models import FakeChatModel
+from bench_runs import start_chat
+
+PORT = 8796
+EVENTS = 200_000
+CHATS = 20
+
+
+def per_event_ns():
+    registry = Registry()
+    counter = registry.counter("bench_total", "bench", ("model", "kind"))
+    histogram = registry.histogram("bench_seconds", "bench", ("model",), LATENCY_BUCKETS)
+    values = [i / EVENTS * 20 for i in range(EVENTS)]
+
+    start_time = time.perf_counter()
+    for _ in range(EVENTS):
+        counter.inc("fast", "output", amount=3)
+    counter_ns = (time.perf_counter() - start_time) / EVENTS * 1e9
+
+    start_time = time.perf_counter()
+    for value in values:
+        histogram.observe(value, "fast")
+    histogram_ns = (time.perf_counter() - start_time) / EVENTS * 1e9
+    print(f"Counter.inc {counter_ns:6.0f} ns, Histogram.observe {histogram_ns:6.0f} ns per event")
+
+
+async def scenario():
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=30) as client:
+            for _ in range(CHATS):
+                await start_chat(client)
+            for _ in range(CHATS):
+                await client.get("/all-chats")
+
+            start_time = time.perf_counter()
+            response = await client.get("/metrics")
+            scrape_ms = (time.perf_counter() - start_time) * 1000
+            lines = response.text.splitlines()
+            print(f"/metrics: {len(lines)} lines, {len(response.content)} bytes, {scrape_ms:.1f} ms ({response.headers['content-type']})")
+            for line in lines:
+                if line.startswith(("chat_time_to_first_token_seconds_count", "chat_stream_duration_seconds_count",
+                                    "model_tokens_total", "sqlite_query_seconds_count", "chat_runs_started",
+                                    "admission_admitted", "model_router_requests")):
+                    print(f"  {line}")
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def run_benchmark():
+    per_event_ns()
+    agent.available_models["fast"] = FakeChatModel(reply="word " * 50, chunks=50, token_delay=0.002, usage_tokens=50)
+    agent.default_model = "fast"
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    run_benchmark()
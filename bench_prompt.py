@@ -0,0 +1,53 @@
+# bench_prompt.py
+# Compares prompt size per turn: old str(messages) prompt vs build_prompt().
+import time
+
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+
+from prompt_builder import build_prompt, estimate_tokens
+
+SYSTEM_PROMPT = "You are an AI agent named CORE."
+TURNS = 200
+
+
+def synthetic_turn(i):
+    """One user question answered with a web search (large tool payload)."""
+    call_id = f"call_{i}"
+    return [
+        HumanMessage(content=f"Question {i}: what happened in the news today about topic {i}?"),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"topic {i}"}, "id": call_id}]),
+        ToolMessage(content="search result " * 800, tool_call_id=call_id),
+        AIMessage(content=f"Here is a short summary of topic {i}. " * 10),
+    ]
+
+
+def run_benchmark():
+    history = []
+    old_sizes = []
+    new_sizes = []
+    start_time = time.time()
+
+    for i in range(TURNS):
+        history.extend(synthetic_turn(i)[:1])
+
+        old_prompt = str(history)
+        old_sizes.append(len(old_prompt) // 4)
+
+        prompt = build_prompt(SYSTEM_PROMPT, history)
+        new_sizes.append(sum(estimate_tokens(m) for m in prompt))
+
+        history.extend(synthetic_turn(i)[1:])
+
+    elapsed = time.time() - start_time
+
+    print(f"{'turn':>6} {'str(messages) tokens':>22} {'build_prompt tokens':>22}")
+    for turn in (1, 10, 50, 100, 150, 200):
+        print(f"{turn:>6} {old_sizes[turn - 1]:>22} {new_sizes[turn - 1]:>22}")
+
+    print(f"\nMax build_prompt tokens over {TURNS} turns: {max(new_sizes)}")
+    print(f"Prompt size stays flat: {max(new_sizes[50:]) - min(new_sizes[50:]) < max(new_sizes) * 0.1}")
+    print(f"Total time: {elapsed:.2f} seconds")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,106 @@
+# bench_rate_limiter.py
+# A burst of calls against a quota-enforcing fake upstream, on a simulated clock:
+# no limiter vs TokenBucketLimiter, and two limiters (two workers) sharing one SQLite file.
+import os
+import heapq
+import asyncio
+import tempfile
+import itertools
+
+from rate_limiter import TokenBucketLimiter, Quota, RateLimited
+
+QUOTA = Quota(rpm=10, tpm=20_000)
+BURST = 60
+ESTIMATED_TOKENS = 1_500
+ACTUAL_TOKENS = 800
+CALL_SECONDS = 3.0
+
+
+class SimulatedClock:
+    """Virtual time: sleepers wake in order, time jumps straight to the next wake-up."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + seconds, next(self._seq), future))
+        await future
+
+    async def run(self, coroutines):
+        """Runs the coroutines to completion, advancing time whenever all of them are asleep."""
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        while not all(task.done() for task in tasks):
+            running = sum(1 for task in tasks if not task.done())
+            if self._sleepers and len(self._sleepers) >= running:
+                wake, _, future = heapq.heappop(self._sleepers)
+                self.now = max(self.now, wake)
+                future.set_result(None)
+            await asyncio.sleep(0.0005)  # real time: lets SQLite calls in worker threads finish
+        return [task.result() for task in tasks]
+
+
+class Upstream:
+    """Fake Gemini endpoint enforcing RPM/TPM like a bucket refilled over each minute."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.levels = {"requests": QUOTA.rpm, "tokens": QUOTA.tpm}
+        self.updated_at = 0.0
+
+    async def call(self) -> bool:
+        elapsed, self.updated_at = self.clock() - self.updated_at, self.clock()
+        self.levels["requests"] = min(QUOTA.rpm, self.levels["requests"] + elapsed * QUOTA.rpm / 60)
+        self.levels["tokens"] = min(QUOTA.tpm, self.levels["tokens"] + elapsed * QUOTA.tpm / 60)
+        if self.levels["requests"] < 1 or self.levels["tokens"] < ACTUAL_TOKENS:
+            return False  # 429
+        self.levels["requests"] -= 1
+        self.levels["tokens"] -= ACTUAL_TOKENS
+        await self.clock.sleep(CALL_SECONDS)
+        return True
+
+
+async def call(upstream, limiter):
+    if limiter is not None:
+        try:
+            reservation = await limiter.reserve("pro", ESTIMATED_TOKENS)
+        except RateLimited:
+            return "gave up"
+    ok = await upstream.call()
+    if limiter is not None:
+        await limiter.settle(reservation, ACTUAL_TOKENS if ok else 0)
+    return "ok" if ok else "429"
+
+
+async def scenario(label, workers):
+    clock = SimulatedClock()
+    upstream = Upstream(clock)
+    limiters = []
+    db_path = os.path.join(tempfile.mkdtemp(), "rate_limits.sqlite")
+    for _ in range(workers):
+        limiter = TokenBucketLimiter({"pro": QUOTA}, db_path=db_path, max_wait=600, clock=clock, sleep=clock.sleep)
+        await limiter.open()
+        limiters.append(limiter)
+
+    results = await clock.run(call(upstream, limiters[i % len(limiters)] if limiters else None) for i in range(BURST))
+    for limiter in limiters:
+        await limiter.close()
+    print(f"{label:>28}: {results.count('ok'):3d} ok, {results.count('429'):3d} upstream 429s, "
+          f"{results.count('gave up'):2d} gave up, done after {clock.now:6.1f}s simulated")
+
+
+def run_benchmark():
+    print(f"{BURST} calls at t=0, quota {QUOTA.rpm} RPM / {QUOTA.tpm} TPM, "
+          f"{ESTIMATED_TOKENS} tokens estimated / {ACTUAL_TOKENS} used per call")
+    asyncio.run(scenario("no limiter", 0))
+    asyncio.run(scenario("token bucket, 1 worker", 1))
+    asyncio.run(scenario("token bucket, 2 workers", 2))
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,100 @@
+# bench_resume.py
+# Kills the client in the middle of a /chat/ stream, reconnects to /chat-stream/{run_id} with Last-Event-ID
+# and checks the answer arrives whole, without a second model call.
+import os
+import json
+import asyncio
+import tempfile
+
+os.environ.setdefault("CHECKPOINT_DB", os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite"))
+os.environ.setdefault("ADMISSION_DB", os.path.join(tempfile.mkdtemp(), "admission.sqlite"))
+os.environ.setdefault("RUNS_DB", os.path.join(tempfile.mkdtemp(), "runs.sqlite"))
+
+import httpx
+import uvicorn
+
+import agent
+import main
+from fake_models import FakeChatModel
+
+PORT = 8798
+BASE = f"http://127.0.0.1:{PORT}"
+TOKENS = 200
+TOKEN_DELAY = 0.01
+KILL_AFTER_FRAMES = 5
+
+
+def parse(lines, frames):
+    """Collects (event id, payload) pairs from SSE lines."""
+    event_id = None
+    for line in lines:
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            frames.append((event_id, json.loads(line[6:])))
+
+
+async def read_stream(response, frames, limit=None):
+    lines = []
+    async for line in response.aiter_lines():
+        lines.append(line)
+        if line.startswith("data: "):
+            parse(lines, frames)
+            lines = []
+            if limit and len(frames) >= limit:
+                return
+
+
+def answer(frames):
+    return "".join(payload.get("chunk", "") for _, payload in frames)
+
+
+async def scenario():
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_level="warning")
+    server = uvicorn.Server(config)
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    try:
+        async with httpx.AsyncClient(base_url=BASE, timeout=30) as client:
+            token = (await client.get("/csrf-token")).json()["csrf_token"]
+            frames = []
+            body = {"input": "tell me a long story", "model_name": "fast", "csrf_token": token}
+
+            # First connection: read a few frames, then drop the socket mid-answer
+            async with client.stream("POST", "/chat/", json=body) as response:
+                await read_stream(response, frames, limit=KILL_AFTER_FRAMES)
+            run_id = next(payload["run_id"] for _, payload in frames if "run_id" in payload)
+            last_event_id = frames[-1][0]
+            print(f"client killed after event {last_event_id} ({len(answer(frames))} chars received)")
+
+            await asyncio.sleep(0.5)  # the generation keeps going meanwhile
+
+            # Reconnect: replay from Last-Event-ID, then follow the live run to the end
+            headers = {"Last-Event-ID": str(last_event_id)}
+            async with client.stream("GET", f"/chat-stream/{run_id}", headers=headers) as response:
+                await read_stream(response, frames)
+
+            ids = [event_id for event_id, _ in frames]
+            expected = agent.available_models["fast"].reply
+            print(f"resumed: events {ids[0]}..{ids[-1]}, contiguous {ids == list(range(1, len(ids) + 1))}, "
+                  f"done {frames[-1][1].get('done', False)}")
+            print(f"answer intact: {answer(frames) == expected} ({len(answer(frames))} / {len(expected)} chars), "
+                  f"model calls: {agent.model_router.stats()['requests']}")
+
+            missing = await client.get("/chat-stream/unknown-run")
+            print(f"unknown run: HTTP {missing.status_code}")
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel(reply="word " * TOKENS, chunks=TOKENS, token_delay=TOKEN_DELAY)
+    agent.default_model = "fast"
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    run_benchmark()
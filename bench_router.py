@@ -0,0 +1,114 @@
+# bench_router.py
+# Model tiers with injected failures and tail latency: no routing vs fallback chain vs fallback + hedging.
+# Then the token quota left after failed tiers and lost hedges (their reservations must be given back).
+import os
+import time
+import random
+import asyncio
+import logging
+import tempfile
+
+from langchain_core.messages import HumanMessage
+
+from fake_models import FakeChatModel
+from model_registry import ModelRegistry
+from model_router import ModelRouter
+from rate_limiter import TokenBucketLimiter, Quota, QUOTA_OUTPUT_TOKENS
+
+REQUESTS = 400
+CONCURRENCY = 50
+
+# Primary tier: fast most of the time, slow on a few calls, and failing on some
+PRIMARY_LATENCY = 0.05
+PRIMARY_SLOW_LATENCY = 1.5
+PRIMARY_SLOW_RATE = 0.08
+PRIMARY_FAILURE_RATE = 0.05
+
+
+class TailLatencyModel(FakeChatModel):
+    """FakeChatModel whose first token is `slow_latency` late on a share `slow_rate` of the calls."""
+
+    slow_latency: float = 0.0
+    slow_rate: float = 0.0
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_latency)
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            yield chunk
+
+
+def make_registry():
+    registry = ModelRegistry()
+    registry["pro"] = TailLatencyModel(latency=PRIMARY_LATENCY, slow_latency=PRIMARY_SLOW_LATENCY,
+                                       slow_rate=PRIMARY_SLOW_RATE, failure_rate=PRIMARY_FAILURE_RATE)
+    registry["fast"] = TailLatencyModel(latency=0.08, slow_latency=PRIMARY_SLOW_LATENCY, slow_rate=0.02)
+    registry["unlimited"] = FakeChatModel(latency=0.1)
+    return registry
+
+
+async def first_token_ms(model, semaphore):
+    async with semaphore:
+        start_time = time.perf_counter()
+        try:
+            async for _ in model.astream([HumanMessage(content="question")]):
+                return (time.perf_counter() - start_time) * 1000
+        except Exception:
+            return None
+
+
+async def run_requests(label, model_for):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    results = await asyncio.gather(*(first_token_ms(model_for(), semaphore) for _ in range(REQUESTS)))
+    latencies = sorted(ms for ms in results if ms is not None)
+    failed = len(results) - len(latencies)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    print(f"{label:>20}: {failed:3d}/{REQUESTS} failed, first token p50 {pct(50):6.1f} ms, "
+          f"p95 {pct(95):6.1f} ms, p99 {pct(99):6.1f} ms")
+
+
+async def quota_after(label, registry, hedging):
+    """20 calls answered by "fast"; on a frozen clock, "pro"'s token bucket must end up full again."""
+    limiter = TokenBucketLimiter({"pro": Quota(1000, 100_000), "fast": Quota(1000, 100_000)},
+                                 db_path=os.path.join(tempfile.mkdtemp(), "quota.sqlite"), clock=lambda: 0.0)
+    await limiter.open()
+    router = ModelRouter(registry, fallbacks={"pro": ["fast"]}, limiter=limiter, hedging=hedging,
+                         hedge_min_samples=1000, hedge_max_ms=50)
+    for _ in range(20):
+        await first_token_ms(router.for_model("pro"), asyncio.Semaphore(1))
+    async with limiter._lock:
+        levels = {name: await limiter._levels(name, 0.0) for name in ("pro", "fast")}
+    await limiter.close()
+    print(f"{label:>20}: pro tokens left {levels['pro']['tokens']:.0f} of 100000, "
+          f"fast {levels['fast']['tokens']:.0f} (estimate {QUOTA_OUTPUT_TOKENS} + prompt per call)")
+
+
+async def main():
+    random.seed(11)
+    registry = make_registry()
+    fallback = ModelRouter(registry, fallbacks={"pro": ["fast", "unlimited"]}, hedging=False)
+    hedged = ModelRouter(registry, fallbacks={"pro": ["fast", "unlimited"]}, hedging=True,
+                         hedge_min_samples=20, hedge_min_ms=50, hedge_max_ms=2000)
+
+    await run_requests("primary only", lambda: registry["pro"])
+    await run_requests("fallback chain", lambda: fallback.for_model("pro"))
+    await run_requests("fallback + hedging", lambda: hedged.for_model("pro"))
+    print(f"hedging router: {hedged.stats()}")
+
+    for label, pro, hedging in (("pro failing", FakeChatModel(failure_rate=1.0), False),
+                                ("pro losing hedges", FakeChatModel(latency=0.3), True)):
+        registry = ModelRegistry()
+        registry["pro"], registry["fast"] = pro, FakeChatModel()
+        await quota_after(label, registry, hedging)
+
+
+def run_benchmark():
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,107 @@
+# bench_runs.py
+# Background runs: two viewers on one run, POST /runs/{id}/cancel, an abandoned run cancelled, and the active-run cap.
+import os
+import asyncio
+import tempfile
+
+os.environ.setdefault("CHECKPOINT_DB", os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite"))
+os.environ.setdefault("ADMISSION_DB", os.path.join(tempfile.mkdtemp(), "admission.sqlite"))
+os.environ.setdefault("RUNS_DB", os.path.join(tempfile.mkdtemp(), "runs.sqlite"))
+
+import httpx
+import uvicorn
+
+import agent
+import main
+from fake_models import FakeChatModel
+from bench_resume import read_stream, answer
+
+PORT = 8797
+BASE = f"http://127.0.0.1:{PORT}"
+TOKENS = 200
+TOKEN_DELAY = 0.01
+
+
+async def start_chat(client, limit=None):
+    """POSTs a chat and reads `limit` frames (all if None); returns the frames read."""
+    token = (await client.get("/csrf-token")).json()["csrf_token"]
+    frames = []
+    body = {"input": "tell me a long story", "model_name": "fast", "csrf_token": token}
+    async with client.stream("POST", "/chat/", json=body) as response:
+        if response.status_code != 200:
+            return response.status_code
+        await read_stream(response, frames, limit=limit)
+    return frames
+
+
+def run_id_of(frames):
+    return next(payload["run_id"] for _, payload in frames if "run_id" in payload)
+
+
+async def two_viewers(client):
+    frames = await start_chat(client, limit=3)
+    run_id = run_id_of(frames)
+    first, second = list(frames), []
+
+    async def follow(collected, last_event_id):
+        async with client.stream("GET", f"/chat-stream/{run_id}", params={"last_event_id": last_event_id}) as response:
+            await read_stream(response, collected)
+
+    await asyncio.gather(follow(first, first[-1][0]), follow(second, 0))
+    print(f"two viewers: same answer {answer(first) == answer(second) == agent.available_models['fast'].reply}, "
+          f"model calls {agent.model_router.stats()['requests']}")
+    return first[-1][0]
+
+
+async def cancel(client):
+    frames = await start_chat(client, limit=5)
+    run_id = run_id_of(frames)
+    result = (await client.post(f"/runs/{run_id}/cancel")).json()
+    async with client.stream("GET", f"/chat-stream/{run_id}", params={"last_event_id": frames[-1][0]}) as response:
+        await read_stream(response, frames)
+    print(f"cancel: {result}, last frame {frames[-1][1]}, "
+          f"{len(answer(frames))} of {len(agent.available_models['fast'].reply)} chars generated")
+
+
+async def abandoned(client, full_frames):
+    main.run_manager.abandon_after = 0.3
+    frames = await start_chat(client, limit=3)
+    run = main.run_manager.get(run_id_of(frames))
+    await asyncio.sleep(1.0)
+    print(f"abandoned: run done {run.done}, stopped after {run.last_id} of {full_frames} frames, "
+          f"stats {main.run_manager.stats()}")
+    main.run_manager.abandon_after = 30
+
+
+async def limit(client):
+    main.run_manager.max_active = 2
+    results = await asyncio.gather(*(start_chat(client) for _ in range(4)))
+    print(f"limit 2, 4 chats at once: {sum(isinstance(r, list) for r in results)} answered, "
+          f"{results.count(429)} got 429")
+    main.run_manager.max_active = 128
+
+
+async def scenario():
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        async with httpx.AsyncClient(base_url=BASE, timeout=30) as client:
+            full_frames = await two_viewers(client)
+            await cancel(client)
+            await abandoned(client, full_frames)
+            await limit(client)
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel(reply="word " * TOKENS, chunks=TOKENS, token_delay=TOKEN_DELAY)
+    agent.default_model = "fast"
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,55 @@
+# bench_search.py
+# Concurrent identical web searches through CachedSearchTool against a local stub backend.
+import time
+import asyncio
+
+from langchain_core.tools import BaseTool
+
+from search_cache import CachedSearchTool
+
+CONCURRENT_USERS = 100
+BACKEND_LATENCY = 0.5
+
+
+class StubSearch(BaseTool):
+    """Stands in for TavilySearch: sleeps, then returns a canned result."""
+
+    name: str = "tavily_search"
+    description: str = "Stub web search."
+    calls: int = 0
+
+    def _run(self, query: str, **kwargs):
+        self.calls += 1
+        time.sleep(BACKEND_LATENCY)
+        return {"query": query, "results": [{"title": "stub", "content": "stub result"}]}
+
+    async def _arun(self, query: str, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(BACKEND_LATENCY)
+        return {"query": query, "results": [{"title": "stub", "content": "stub result"}]}
+
+
+async def run_wave(tool, queries):
+    start_time = time.time()
+    await asyncio.gather(*[tool.ainvoke({"query": q}) for q in queries])
+    return time.time() - start_time
+
+
+def run_benchmark():
+    queries = [("Breaking NEWS  today" if i % 2 else "breaking news today") for i in range(CONCURRENT_USERS)]
+
+    plain = StubSearch()
+    elapsed = asyncio.run(run_wave(plain, queries))
+    print(f"{'uncached':>10}: {CONCURRENT_USERS} searches in {elapsed:.2f}s, backend calls: {plain.calls}")
+
+    backend = StubSearch()
+    cached = CachedSearchTool(backend, ttl=60)
+    elapsed = asyncio.run(run_wave(cached, queries))
+    print(f"{'cached':>10}: {CONCURRENT_USERS} searches in {elapsed:.2f}s, backend calls: {backend.calls}, {cached.stats()}")
+
+    elapsed = asyncio.run(run_wave(cached, queries))
+    print(f"{'warm':>10}: {CONCURRENT_USERS} searches in {elapsed:.2f}s, backend calls: {backend.calls}, {cached.stats()}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
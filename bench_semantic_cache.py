@@ -0,0 +1,90 @@
+# bench_semantic_cache.py
+# Semantic cache with the hashing embedder: hit on a near-duplicate, miss on another question or another
+# model, a hit while many other models cached the same question, expiry after the TTL, and lookup latency.
+# Needs a Python whose sqlite3 can load extensions (sqlite-vec); otherwise the cache disables itself.
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+from semantic_cache import SemanticCache
+
+QUESTION = "What is the capital of France?"
+NEAR_DUPLICATE = "what is the capital of france"
+OTHER_MODELS = 20
+ROWS = 5000
+LOOKUPS = 200
+
+
+async def open_cache(ttl: int = 3600) -> SemanticCache:
+    cache = SemanticCache(enabled=True, db_path=os.path.join(tempfile.mkdtemp(), "semantic_cache.sqlite"), ttl=ttl)
+    await cache.open()
+    return cache
+
+
+async def hit_and_miss():
+    cache = await open_cache()
+    await cache.store("fast", QUESTION, ["Paris."], 800)
+    print(f"near-duplicate, same model:     hit {await cache.lookup('fast', NEAR_DUPLICATE) == ['Paris.']}")
+    print(f"other question, same model:     miss {await cache.lookup('fast', 'how do I bake bread') is None}")
+    print(f"same question, other model:     miss {await cache.lookup('pro', QUESTION) is None}")
+    await cache.close()
+
+
+async def crowded():
+    # The same question cached for many models: the requested model's row must still be found
+    cache = await open_cache()
+    await cache.store("fast", QUESTION, ["Paris (fast)."], 800)
+    for i in range(OTHER_MODELS):
+        await cache.store(f"model-{i}", QUESTION, [f"Paris ({i})."], 800)
+    print(f"{OTHER_MODELS} other models cached it:      hit {await cache.lookup('fast', QUESTION) == ['Paris (fast).']}")
+    await cache.close()
+
+
+async def expiry():
+    cache = await open_cache(ttl=1)
+    await cache.store("fast", QUESTION, ["Paris."], 800)
+    await asyncio.sleep(1.1)
+    expired = await cache.lookup("fast", QUESTION) is None
+    # The next store drops expired rows from both tables
+    await cache.store("fast", "how do I bake bread", ["Knead."], 800)
+    answers = await (await cache._conn.execute("SELECT COUNT(*) FROM semantic_answers")).fetchone()
+    vectors = await (await cache._conn.execute("SELECT COUNT(*) FROM semantic_vectors")).fetchone()
+    print(f"after the TTL:                  miss {expired}, rows left {answers[0]} answer(s) / {vectors[0]} vector(s)")
+    await cache.close()
+
+
+async def latency():
+    random.seed(3)
+    words = [f"word{i}" for i in range(2000)]
+    cache = await open_cache()
+    for i in range(ROWS):
+        await cache.store(f"model-{i % 4}", " ".join(random.sample(words, 8)), ["answer"], 800)
+    questions = [" ".join(random.sample(words, 8)) for _ in range(LOOKUPS)]
+    start_time = time.perf_counter()
+    for question in questions:
+        await cache.lookup("model-0", question)
+    elapsed_ms = (time.perf_counter() - start_time) / LOOKUPS * 1000
+    print(f"{ROWS} rows over 4 models:        lookup {elapsed_ms:.2f} ms on average")
+    await cache.close()
+
+
+async def main():
+    probe = await open_cache()
+    if not probe.enabled:
+        print("sqlite-vec could not be loaded in this Python (sqlite3 without extension loading), nothing to measure")
+        return
+    await probe.close()
+    await hit_and_miss()
+    await crowded()
+    await expiry()
+    await latency()
+
+
+def run_benchmark():
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    run_benchmark()
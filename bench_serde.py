@@ -0,0 +1,121 @@
+# bench_serde.py
+# checkpoints.sqlite size and checkpoint write / read latency: plain msgpack vs zstd vs zstd with a trained dictionary.
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import tempfile
+
+import zstandard
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.base.id import uuid6
+
+from db import SqlitePool
+from checkpoint_serde import CompressedSerializer
+
+THREADS = 200
+TURNS = 8
+WORDS = ("the quick model answers questions about python sqlite latency search results weather "
+         "news football cricket stocks release notes documentation example error stack trace").split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def search_results(rng, query):
+    """Shaped like a Tavily search payload: a few results with URLs and long content."""
+    return json.dumps({
+        "query": query,
+        "results": [
+            {"title": sentence(rng, 6), "url": f"https://example.com/{uuid.uuid4().hex[:12]}",
+             "content": " ".join(sentence(rng, 18) for _ in range(12)), "score": round(rng.random(), 4)}
+            for _ in range(5)
+        ],
+        "response_time": round(rng.random(), 2),
+    })
+
+
+def make_thread(rng):
+    """One checkpoint per turn, each holding the whole conversation so far (as the saver stores it)."""
+    messages, checkpoints = [], []
+    for turn in range(TURNS):
+        question = sentence(rng, 12)
+        messages.append(HumanMessage(content=question, id=str(uuid.uuid4())))
+        if rng.random() < 0.5:
+            call_id = f"call_{uuid.uuid4().hex[:8]}"
+            messages.append(AIMessage(content="", id=str(uuid.uuid4()),
+                                      tool_calls=[{"name": "tavily_search", "args": {"query": question}, "id": call_id}]))
+            messages.append(ToolMessage(content=search_results(rng, question), tool_call_id=call_id, id=str(uuid.uuid4())))
+        messages.append(AIMessage(content=" ".join(sentence(rng, 15) for _ in range(8)), id=str(uuid.uuid4())))
+        checkpoint = empty_checkpoint()
+        checkpoint["id"] = str(uuid6())
+        checkpoint["channel_values"] = {"messages": list(messages)}
+        checkpoints.append(checkpoint)
+    return checkpoints
+
+
+def config_for(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def file_mib(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 1024 / 1024
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_serde(label, serde, corpus):
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+    pool = SqlitePool(path, serde=serde)
+    await pool.open()
+
+    writes = []
+    for t, thread in enumerate(corpus):
+        parent = None
+        for checkpoint in thread:
+            start_time = time.perf_counter()
+            parent = await pool.checkpointer.aput(parent or config_for(f"thread-{t}"), checkpoint, {}, {})
+            writes.append((time.perf_counter() - start_time) * 1000)
+    await pool.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    reads = []
+    for t in range(len(corpus)):
+        async with pool.reader() as reader:
+            start_time = time.perf_counter()
+            await reader.aget_tuple(config_for(f"thread-{t}"))
+            reads.append((time.perf_counter() - start_time) * 1000)
+
+    print(f"{label:>16}: {file_mib(path):6.2f} MiB, write p50 {percentile(writes, 0.5):.2f} / p95 {percentile(writes, 0.95):.2f} ms, "
+          f"read p50 {percentile(reads, 0.5):.2f} / p95 {percentile(reads, 0.95):.2f} ms")
+    await pool.close()
+
+
+def train(corpus, out_path):
+    """Dictionary trained on a separate sample of threads (as checkpoint_serde.py --train-dict would)."""
+    plain = CompressedSerializer(enabled=False)
+    samples = [plain.dumps_typed(checkpoint)[1] for thread in corpus for checkpoint in thread]
+    with open(out_path, "wb") as f:
+        f.write(zstandard.train_dictionary(112 * 1024, samples).as_bytes())
+
+
+def run_benchmark():
+    rng = random.Random(7)
+    corpus = [make_thread(rng) for _ in range(THREADS)]
+    dict_path = os.path.join(tempfile.mkdtemp(), "checkpoints.dict")
+    train([make_thread(rng) for _ in range(50)], dict_path)
+
+    print(f"{THREADS} threads x {TURNS} checkpoints, about half the turns with a search result")
+    asyncio.run(run_serde("plain msgpack", CompressedSerializer(enabled=False), corpus))
+    asyncio.run(run_serde("zstd", CompressedSerializer(enabled=True), corpus))
+    asyncio.run(run_serde("zstd + dictionary", CompressedSerializer(enabled=True, dict_path=dict_path), corpus))
+
+
+if __name__ == "__main__":
+    run_benchmark()
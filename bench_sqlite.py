@@ -0,0 +1,115 @@
+# bench_sqlite.py
+# Mixed read/write throughput: one shared aiosqlite connection vs SqlitePool (1 writer + N readers, WAL).
+import os
+import time
+import uuid
+import random
+import asyncio
+import tempfile
+
+import aiosqlite
+from langchain_core.messages import HumanMessage, AIMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+import thread_index
+from db import SqlitePool
+
+THREADS = 500
+WRITERS = 4
+READERS = 16
+DURATION = 5.0
+
+
+def make_checkpoint(turns: int):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = str(uuid.uuid4())
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i} " * 20))
+        messages.append(AIMessage(content=f"answer {i} " * 200))
+    checkpoint["channel_values"] = {"messages": messages}
+    return checkpoint
+
+
+def config_for(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+async def seed(path):
+    conn = await aiosqlite.connect(path)
+    saver = AsyncSqliteSaver(conn=conn)
+    await saver.setup()
+    await thread_index.setup(conn)
+    for i in range(THREADS):
+        thread_id = f"thread-{i}"
+        await saver.aput(config_for(thread_id), make_checkpoint(5), {}, {})
+        await thread_index.record_turn(conn, thread_id, f"title {i}")
+    await conn.close()
+
+
+async def run_mixed(write_saver, reader_ctx):
+    counts = {"writes": 0, "reads": 0, "read_latency": []}
+    deadline = time.time() + DURATION
+
+    async def writer():
+        while time.time() < deadline:
+            thread_id = f"thread-{random.randrange(THREADS)}"
+            await write_saver.aput(config_for(thread_id), make_checkpoint(5), {}, {})
+            await thread_index.record_turn(write_saver.conn, thread_id, "title")
+            counts["writes"] += 1
+
+    async def reader():
+        while time.time() < deadline:
+            started = time.perf_counter()
+            async with reader_ctx() as saver:
+                if random.random() < 0.5:
+                    await saver.aget_tuple(config_for(f"thread-{random.randrange(THREADS)}"))
+                else:
+                    await thread_index.list_threads(saver.conn, 50)
+            counts["reads"] += 1
+            counts["read_latency"].append(time.perf_counter() - started)
+
+    await asyncio.gather(*[writer() for _ in range(WRITERS)], *[reader() for _ in range(READERS)])
+    return counts
+
+
+async def bench_single(path):
+    conn = await aiosqlite.connect(path)
+    saver = AsyncSqliteSaver(conn=conn)
+
+    class Shared:
+        async def __aenter__(self):
+            return saver
+
+        async def __aexit__(self, *args):
+            return False
+
+    counts = await run_mixed(saver, Shared)
+    await conn.close()
+    return counts
+
+
+async def bench_pool(path):
+    pool = SqlitePool(path)
+    await pool.open()
+    counts = await run_mixed(pool.checkpointer, pool.reader)
+    await pool.close()
+    return counts
+
+
+def run_benchmark():
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, bench in (("single connection", bench_single), ("pool (WAL, 1w+4r)", bench_pool)):
+            path = os.path.join(tmp, f"{bench.__name__}.sqlite")
+            asyncio.run(seed(path))
+            counts = asyncio.run(bench(path))
+            latency = sorted(counts["read_latency"])
+            p50 = latency[len(latency) // 2] * 1000
+            p95 = latency[int(len(latency) * 0.95)] * 1000
+            print(f"{label:>20}: {counts['writes'] / DURATION:8.0f} writes/s  {counts['reads'] / DURATION:8.0f} reads/s  "
+                  f"read p50 {p50:.1f} ms  p95 {p95:.1f} ms")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,58 @@
+# bench_sse.py
+# Encoding a 10k-token answer: json.dumps + f-string per token vs orjson encoder with token coalescing.
+import json
+import time
+import random
+import asyncio
+
+from sse import encode_chunk, coalesce_tokens
+
+TOKENS = 10_000
+RUNS = 20
+
+
+def make_tokens():
+    random.seed(7)
+    words = ["the", "model", "streams", "tokens", "quickly", "über", "naïve", "résumé", "data", "SSE", "\n"]
+    return [random.choice(words) + " " for _ in range(TOKENS)]
+
+
+async def token_source(tokens):
+    for token in tokens:
+        yield token
+
+
+async def old_encoder(tokens):
+    frames = []
+    async for content in token_source(tokens):
+        frames.append(f"data: {json.dumps({'chunk': content})}\n\n".encode("utf-8"))
+    return frames
+
+
+async def new_encoder(tokens):
+    frames = []
+    async for text in coalesce_tokens(token_source(tokens), max_bytes=512, max_delay_ms=20):
+        frames.append(encode_chunk(text))
+    return frames
+
+
+def measure(label, encoder, tokens):
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(RUNS):
+        frames = asyncio.run(encoder(tokens))
+    cpu = (time.process_time() - cpu_start) / RUNS
+    wall = (time.perf_counter() - wall_start) / RUNS
+    total_bytes = sum(len(f) for f in frames)
+    print(f"{label:>22}: {len(frames):6d} writes, {total_bytes / 1024:7.1f} KiB, "
+          f"{total_bytes / wall / 1024 / 1024:7.1f} MiB/s, CPU {cpu * 1000:6.2f} ms per {TOKENS} tokens")
+
+
+def run_benchmark():
+    tokens = make_tokens()
+    measure("json.dumps per token", old_encoder, tokens)
+    measure("orjson + coalescing", new_encoder, tokens)
+
+
+if __name__ == "__main__":
+    run_benchmark()
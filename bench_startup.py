@@ -0,0 +1,35 @@
+# bench_startup.py
+# Import / startup cost of agent.py: lazy model registry vs building every model up front (the old import-time behavior).
+import os
+import sys
+import subprocess
+
+RUNS = 5
+
+LAZY = "import agent"
+EAGER = "import agent; [agent.available_models[name] for name in agent.available_models]"
+REPORT = "; import time, resource; print(time.perf_counter() - START, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def measure(code):
+    """Runs `code` in a fresh interpreter under -X importtime; returns (import agent ms, total s, peak RSS MiB)."""
+    env = {**os.environ, "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "bench-key"), "MODEL_WARMUP": ""}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import time; START = time.perf_counter(); " + code + REPORT],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    # -X importtime lines: "import time: self [us] | cumulative | name"
+    import_us = next(int(line.split("|")[1]) for line in result.stderr.splitlines() if line.rstrip().endswith("| agent"))
+    total, rss_kb = result.stdout.split()
+    return import_us / 1000, float(total), int(rss_kb) / 1024
+
+
+def run_benchmark():
+    for label, code in (("lazy registry", LAZY), ("build all models", EAGER)):
+        samples = sorted(measure(code) for _ in range(RUNS))
+        import_ms, total, rss = samples[RUNS // 2]
+        print(f"{label:>16}: import agent {import_ms:7.1f} ms, ready in {total * 1000:7.1f} ms, peak RSS {rss:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,38 @@
+# bench_stream.py
+# CPU per streamed response: astream_events (debug path) vs stream_mode="messages" (default path).
+import time
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+import agent
+from fake_models import FakeChatModel
+from streaming import stream_tokens, stream_events
+
+RESPONSES = 50
+TOKENS_PER_RESPONSE = 1000
+
+
+async def run_responses(app, source):
+    tokens = 0
+    for i in range(RESPONSES):
+        async for item in source(app, {"messages": [HumanMessage(content=f"question {i}")]}, {"configurable": {"model_name": "fast"}}):
+            if isinstance(item, str):
+                tokens += 1
+    return tokens
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel(reply="tok " * TOKENS_PER_RESPONSE, chunks=TOKENS_PER_RESPONSE)
+    agent.default_model = "fast"
+    app = agent.workflow_.compile()
+
+    for label, source in (("astream_events", stream_events), ("stream_mode=messages", stream_tokens)):
+        cpu_start = time.process_time()
+        tokens = asyncio.run(run_responses(app, source))
+        cpu = (time.process_time() - cpu_start) / RESPONSES
+        print(f"{label:>22}: {tokens // RESPONSES} tokens/response, CPU {cpu * 1000:7.2f} ms per response")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,65 @@
+# bench_summary.py
+# 1,000 turns on one thread: latest checkpoint size and aget_state latency, with and without the summarize node.
+import os
+import time
+import asyncio
+import tempfile
+
+# The summarize node is only added to the graph when this is set at import time
+os.environ["CONVERSATION_SUMMARY"] = "1"
+
+from langchain_core.messages import HumanMessage
+
+import agent
+import summarizer
+from db import SqlitePool
+from fake_models import FakeChatModel, FakeSummarizer
+
+TURNS = 1000
+REPORT_EVERY = 200
+
+
+async def checkpoint_bytes(pool, thread_id):
+    query = await pool.writer.execute(
+        "SELECT length(checkpoint) FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT 1", (thread_id,)
+    )
+    return (await query.fetchone())[0]
+
+
+async def run_thread(label, fake_summarizer):
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+    pool = SqlitePool(path)
+    await pool.open()
+    app = agent.workflow_.compile(checkpointer=pool.checkpointer)
+    agent.summarizer = fake_summarizer
+    config = {"configurable": {"thread_id": "long-thread", "model_name": "fast"}}
+
+    print(label)
+    for turn in range(1, TURNS + 1):
+        await app.ainvoke({"messages": [HumanMessage(content=f"Turn {turn}: tell me more about topic {turn} " + "please " * 30)]}, config)
+        if turn % REPORT_EVERY == 0:
+            start_time = time.perf_counter()
+            state = await app.aget_state(config)
+            state_ms = (time.perf_counter() - start_time) * 1000
+            print(f"  turn {turn:5d}: {len(state.values['messages']):5d} messages, "
+                  f"checkpoint {await checkpoint_bytes(pool, 'long-thread') / 1024:8.1f} KiB, aget_state {state_ms:6.2f} ms")
+    await pool.close()
+
+
+def run_benchmark():
+    agent.available_models["fast"] = FakeChatModel(reply="A fairly detailed fake answer from the model. " * 10)
+    agent.default_model = "fast"
+
+    # Thresholds that are never reached: the node runs but never summarizes
+    max_messages = summarizer.SUMMARY_MAX_MESSAGES
+    summarizer.SUMMARY_MAX_MESSAGES, summarizer.SUMMARY_MAX_TOKENS = 10 ** 9, 10 ** 9
+    asyncio.run(run_thread("without summary", FakeSummarizer()))
+
+    summarizer.SUMMARY_MAX_MESSAGES, summarizer.SUMMARY_MAX_TOKENS = max_messages, 6000
+    fake_summarizer = FakeSummarizer()
+    asyncio.run(run_thread(f"with summary (over {max_messages} messages, keep {summarizer.SUMMARY_KEEP_TURNS} turns)", fake_summarizer))
+    print(f"  {fake_summarizer.calls} summaries written")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,96 @@
+# bench_tools.py
+# One agent turn with several tool calls: sequential execution vs ConcurrentToolNode (with deadlines);
+# then on the sync path, two hung calls followed by a quick one in the next turn, and an argument error.
+import json
+import time
+import asyncio
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from tool_executor import ConcurrentToolNode
+
+SLOW_SEARCH_SECONDS = 5.0
+SEARCH_TIMEOUT = 1.0
+
+
+@tool
+async def get_current_time_tool(timezone: str = "UTC") -> str:
+    """Stub clock tool."""
+    await asyncio.sleep(0.05)
+    return f"12:00 in {timezone}"
+
+
+@tool
+async def tavily_search(query: str) -> str:
+    """Stub web search that answers after a delay depending on the query."""
+    await asyncio.sleep(SLOW_SEARCH_SECONDS if "slow" in query else 0.3)
+    return f"results for {query}"
+
+
+def turn_state():
+    return {"messages": [AIMessage(content="", tool_calls=[
+        {"name": "tavily_search", "args": {"query": "fast news"}, "id": "call_1"},
+        {"name": "tavily_search", "args": {"query": "slow news"}, "id": "call_2"},
+        {"name": "tavily_search", "args": {"query": "fast sports"}, "id": "call_3"},
+        {"name": "get_current_time_tool", "args": {"timezone": "UTC"}, "id": "call_4"},
+    ])]}
+
+
+async def run_sequential(tools):
+    by_name = {t.name: t for t in tools}
+    results = []
+    for tool_call in turn_state()["messages"][-1].tool_calls:
+        results.append(await by_name[tool_call["name"]].ainvoke({**tool_call, "type": "tool_call"}))
+    return results
+
+
+async def run_concurrent(tools):
+    node = ConcurrentToolNode(tools, max_parallel=4, default_timeout=10, timeouts={"tavily_search": SEARCH_TIMEOUT})
+    return (await node.ainvoke(turn_state(), {}))["messages"]
+
+
+@tool
+def hang(seconds: float) -> str:
+    """Stub sync tool that blocks its thread."""
+    time.sleep(seconds)
+    return "done"
+
+
+@tool
+def quick() -> str:
+    """Stub sync tool that answers at once."""
+    return "quick"
+
+
+def sync_calls(*tool_calls):
+    return {"messages": [AIMessage(content="", tool_calls=[
+        {"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(tool_calls)])]}
+
+
+def run_sync():
+    node = ConcurrentToolNode([hang, quick], max_parallel=2, default_timeout=0.5)
+    start_time = time.time()
+    first = node.invoke(sync_calls(("hang", {"seconds": 3}), ("hang", {"seconds": 3})), {})["messages"]
+    second = node.invoke(sync_calls(("quick", {}),), {})["messages"]
+    elapsed = time.time() - start_time
+    print(f"       sync: hung turn {[json.loads(m.content)['error'] for m in first]}, "
+          f"next turn {second[0].content!r}, both in {elapsed:.2f}s")
+
+    bad = node.invoke(sync_calls(("hang", {"seconds": "soon"}),), {})["messages"][0]
+    print(f"  arg error: {bad.content[:160]}")
+
+
+def run_benchmark():
+    tools = [get_current_time_tool, tavily_search]
+    for label, runner in (("sequential", run_sequential), ("concurrent", run_concurrent)):
+        start_time = time.time()
+        results = asyncio.run(runner(tools))
+        elapsed = time.time() - start_time
+        errors = sum(1 for r in results if getattr(r, "status", "success") == "error")
+        print(f"{label:>11}: {len(results)} tool calls in {elapsed:.2f}s ({errors} timed out)")
+    run_sync()
+
+
+if __name__ == "__main__":
+    run_benchmark()
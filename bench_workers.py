@@ -0,0 +1,86 @@
+# bench_workers.py
+# Requests/s through serve.py with 1, 2, 4... workers, driven by several keep-alive client processes.
+import os
+import sys
+import time
+import socket
+import tempfile
+import asyncio
+import subprocess
+import multiprocessing
+
+PORT = 8799
+PATH = "/csrf-token"
+DURATION = 5.0
+CLIENT_PROCESSES = max(2, os.cpu_count() or 1)
+CONNECTIONS_PER_CLIENT = 16
+# Up to one worker per core unless BENCH_WORKERS="1,2,4" asks otherwise
+WORKER_COUNTS = ([int(n) for n in os.getenv("BENCH_WORKERS", "").split(",") if n.strip()]
+                 or [n for n in (1, 2, 4, 8, 16) if n <= (os.cpu_count() or 1)])
+
+REQUEST = f"GET {PATH} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+
+
+async def connection_loop(deadline):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    done = 0
+    while time.monotonic() < deadline:
+        writer.write(REQUEST)
+        headers = await reader.readuntil(b"\r\n\r\n")
+        length = int(headers.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+        await reader.readexactly(length)
+        done += 1
+    writer.close()
+    return done
+
+
+def client_process(results):
+    async def run():
+        deadline = time.monotonic() + DURATION
+        return sum(await asyncio.gather(*(connection_loop(deadline) for _ in range(CONNECTIONS_PER_CLIENT))))
+    results.put(asyncio.run(run()))
+
+
+def wait_for_port():
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def measure(workers):
+    tmp = tempfile.mkdtemp()
+    env = {**os.environ, "WEB_WORKERS": str(workers), "PORT": str(PORT), "HOST": "127.0.0.1", "CSRF_SECRET": "bench",
+           "CHECKPOINT_DB": os.path.join(tmp, "checkpoints.sqlite"), "ADMISSION_DB": os.path.join(tmp, "admission.sqlite"),
+           "CSRF_DB": os.path.join(tmp, "csrf_nonces.sqlite"), "RUNS_DB": os.path.join(tmp, "runs.sqlite")}
+    server = subprocess.Popen([sys.executable, "serve.py"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port()
+        time.sleep(2 + workers)  # let every worker finish its startup
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client_process, args=(results,)) for _ in range(CLIENT_PROCESSES)]
+        for client in clients:
+            client.start()
+        total = sum(results.get() for _ in clients)
+        for client in clients:
+            client.join()
+        return total / DURATION
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_benchmark():
+    print(f"{os.cpu_count()} cores, {CLIENT_PROCESSES} client processes x {CONNECTIONS_PER_CLIENT} keep-alive connections, GET {PATH}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        rate = measure(workers)
+        baseline = baseline or rate
+        print(f"{workers:2d} worker(s): {rate:8.0f} req/s ({rate / baseline:4.2f}x)")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,143 @@
+import os
+import sys
+import asyncio
+import logging
+import threading
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from db import DB_PATH, connect
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Opt-in (CHECKPOINT_COMPRESSION=1): new checkpoint blobs are written zstd-compressed.
+# Compressed rows are always readable, so turning it off again is safe.
+COMPRESSION_ENABLED = os.getenv("CHECKPOINT_COMPRESSION", "0") == "1"
+
+# Blobs smaller than this stay uncompressed (small channel writes gain nothing)
+COMPRESSION_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESSION_MIN_BYTES", "1024"))
+
+# zstd level: 3 is the zstd default, higher levels cost CPU on every checkpoint write
+COMPRESSION_LEVEL = int(os.getenv("CHECKPOINT_COMPRESSION_LEVEL", "3"))
+
+# Optional trained dictionary (python checkpoint_serde.py --train-dict PATH)
+COMPRESSION_DICT_PATH = os.getenv("CHECKPOINT_COMPRESSION_DICT", "")
+
+# Type tags of compressed rows: "zstd:<inner type>" or "zstd.<dict id>:<inner type>"
+ZSTD_TAG = "zstd"
+
+
+class CompressedSerializer:
+    """
+    Checkpoint serializer that zstd-compresses large blobs.
+
+    Serialization itself is delegated to JsonPlusSerializer (msgpack);
+    blobs of at least `min_bytes` are then compressed, optionally with a
+    trained dictionary, and their type tag becomes "zstd:msgpack" (or
+    "zstd.<dict id>:msgpack"). Rows without the prefix are passed to the
+    inner serializer unchanged, so existing databases keep working and
+    compressed and plain rows can live side by side.
+
+    zstd contexts are not thread-safe, so each thread gets its own.
+    """
+
+    def __init__(self, enabled: bool = COMPRESSION_ENABLED, min_bytes: int = COMPRESSION_MIN_BYTES,
+                 level: int = COMPRESSION_LEVEL, dict_path: str = COMPRESSION_DICT_PATH, inner=None):
+        self.inner = inner or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+        self.level = level
+        self.enabled = enabled and zstandard is not None
+        self.dictionary = None
+        self._local = threading.local()
+
+        if enabled and zstandard is None:
+            logger.warning("zstandard not installed. Checkpoint compression will not be available.")
+        if dict_path and zstandard is not None:
+            with open(dict_path, "rb") as f:
+                self.dictionary = zstandard.ZstdCompressionDict(f.read())
+            # Digest the dictionary once instead of on every compressor
+            self.dictionary.precompute_compress(level=level)
+            logger.info(f"Checkpoint compression dictionary {self.dictionary.dict_id()} loaded from {dict_path}")
+
+    # ---------------------------------
+    # zstd contexts (one per thread)
+    # ---------------------------------
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, dict_id: int):
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        if dict_id not in decompressors:
+            if dict_id and (self.dictionary is None or self.dictionary.dict_id() != dict_id):
+                raise ValueError(f"Checkpoint was compressed with dictionary {dict_id}, which is not loaded")
+            decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=self.dictionary if dict_id else None)
+        return decompressors[dict_id]
+
+    # ---------------------------------
+    # SerializerProtocol
+    # ---------------------------------
+
+    def dumps_typed(self, obj) -> tuple[str, bytes]:
+        type_, data = self.inner.dumps_typed(obj)
+        if not self.enabled or data is None or len(data) < self.min_bytes:
+            return type_, data
+
+        tag = f"{ZSTD_TAG}.{self.dictionary.dict_id()}" if self.dictionary is not None else ZSTD_TAG
+        return f"{tag}:{type_}", self._compressor().compress(data)
+
+    def loads_typed(self, data: tuple[str, bytes]):
+        type_, payload = data
+        if not type_.startswith(ZSTD_TAG):
+            return self.inner.loads_typed(data)
+
+        if zstandard is None:
+            raise RuntimeError("Checkpoint is zstd-compressed but zstandard is not installed")
+        tag, _, inner_type = type_.partition(":")
+        _, _, dict_id = tag.partition(".")
+        raw = self._decompressor(int(dict_id or 0)).decompress(payload)
+        return self.inner.loads_typed((inner_type, raw))
+
+
+# ---------------------------------
+# Dictionary training
+# ---------------------------------
+
+async def train_dictionary(out_path: str, db_path: str = DB_PATH, size: int = 112 * 1024, samples: int = 5000):
+    """Trains a zstd dictionary on the latest checkpoint blobs of an existing database."""
+    serde = CompressedSerializer(enabled=False, dict_path=COMPRESSION_DICT_PATH)
+    conn = await connect(db_path, read_only=True)
+    try:
+        query = await conn.execute(
+            "SELECT type, checkpoint FROM checkpoints ORDER BY checkpoint_id DESC LIMIT ?", (samples,)
+        )
+        blobs = []
+        for type_, payload in await query.fetchall():
+            # Train on the uncompressed msgpack, whatever the row holds now
+            blobs.append(serde.inner.dumps_typed(serde.loads_typed((type_, payload)))[1])
+    finally:
+        await conn.close()
+
+    dictionary = zstandard.train_dictionary(size, blobs)
+    with open(out_path, "wb") as f:
+        f.write(dictionary.as_bytes())
+    logger.info(f"Trained dictionary {dictionary.dict_id()} on {len(blobs)} checkpoints, written to {out_path}")
+
+
+if __name__ == "__main__":
+    # python checkpoint_serde.py --train-dict checkpoints.dict
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if "--train-dict" in sys.argv:
+        asyncio.run(train_dictionary(sys.argv[sys.argv.index("--train-dict") + 1]))
@@ -0,0 +1,218 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+
+import aiosqlite
+
+from db import DB_PATH, connect, take_lease
+from thread_index import now_ms
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Opt-in background job (CHECKPOINT_COMPACTION=1), run every interval by one worker at a time
+COMPACTION_ENABLED = os.getenv("CHECKPOINT_COMPACTION", "0") == "1"
+COMPACTION_INTERVAL_SECONDS = int(os.getenv("COMPACTION_INTERVAL_SECONDS", "3600"))
+
+# Checkpoints kept per thread; the latest one holds the whole conversation
+CHECKPOINT_KEEP = max(1, int(os.getenv("CHECKPOINT_KEEP", "10")))
+
+# Threads not updated for this many days are deleted (0 keeps every thread)
+CHECKPOINT_RETENTION_DAYS = float(os.getenv("CHECKPOINT_RETENTION_DAYS", "0"))
+
+# Threads handled per write transaction, and the pause between transactions,
+# so chat requests never wait behind compaction for more than one short batch
+COMPACTION_BATCH_THREADS = int(os.getenv("COMPACTION_BATCH_THREADS", "50"))
+COMPACTION_PAUSE_MS = float(os.getenv("COMPACTION_PAUSE_MS", "20"))
+
+# Free pages returned to the OS per incremental_vacuum step
+VACUUM_STEP_PAGES = 1000
+
+LEASE_JOB = "checkpoint_compaction"
+
+
+class CheckpointCompactor:
+    """
+    Keeps checkpoints.sqlite from growing without bound.
+
+    Every run deletes threads idle for longer than `retention_days` (their
+    checkpoints, writes and thread index row), then trims every thread to
+    its latest `keep` checkpoints and the write rows of those checkpoints,
+    then returns the freed pages to the OS with incremental VACUUM.
+
+    The job uses its own connection and works in small transactions with a
+    pause between them, so live checkpoint writes only ever wait for one
+    batch. A lease row makes sure only one worker compacts at a time.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, keep: int = CHECKPOINT_KEEP,
+                 retention_days: float = CHECKPOINT_RETENTION_DAYS, interval: int = COMPACTION_INTERVAL_SECONDS,
+                 batch_threads: int = COMPACTION_BATCH_THREADS, pause_ms: float = COMPACTION_PAUSE_MS):
+        self.db_path = db_path
+        self.keep = keep
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_threads = max(1, batch_threads)
+        self.pause = pause_ms / 1000
+        self.owner = f"{os.getpid()}"
+        self.last_report = None
+        self._task: asyncio.Task = None
+
+    # ---------------------------------
+    # Scheduling
+    # ---------------------------------
+
+    def start(self):
+        """Starts the periodic job on the running loop."""
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in checkpoint compaction: {type(e).__name__}")
+
+    async def _take_lease(self, conn: aiosqlite.Connection) -> bool:
+        """Claims the job for this worker until the next interval; False if another worker holds it."""
+        return await take_lease(conn, LEASE_JOB, self.owner, self.interval * 0.9)
+
+    # ---------------------------------
+    # One compaction run
+    # ---------------------------------
+
+    async def run(self, use_lease: bool = True) -> dict:
+        """Runs one compaction pass and returns its report (None if another worker holds the lease)."""
+        conn = await connect(self.db_path)
+        try:
+            if use_lease and not await self._take_lease(conn):
+                logger.info("Checkpoint compaction skipped, another worker holds the lease")
+                return None
+
+            started = time.perf_counter()
+            size_before = await self._file_bytes(conn)
+            report = {"threads_deleted": 0, "checkpoints_deleted": 0, "writes_deleted": 0}
+
+            if self.retention_days > 0:
+                await self._delete_idle_threads(conn, report)
+            await self._trim_threads(conn, report)
+            report["vacuumed"] = await self._incremental_vacuum(conn)
+
+            report["bytes_reclaimed"] = size_before - await self._file_bytes(conn)
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            self.last_report = report
+            logger.info(
+                f"Checkpoint compaction: {report['threads_deleted']} idle threads, "
+                f"{report['checkpoints_deleted']} checkpoints and {report['writes_deleted']} writes deleted, "
+                f"{report['bytes_reclaimed']} bytes reclaimed in {report['seconds']}s"
+            )
+            return report
+        finally:
+            await conn.close()
+
+    async def _file_bytes(self, conn: aiosqlite.Connection) -> int:
+        page_count = (await (await conn.execute("PRAGMA page_count")).fetchone())[0]
+        page_size = (await (await conn.execute("PRAGMA page_size")).fetchone())[0]
+        return page_count * page_size
+
+    async def _delete_idle_threads(self, conn: aiosqlite.Connection, report: dict):
+        cutoff = now_ms() - int(self.retention_days * 86400 * 1000)
+        query = await conn.execute("SELECT thread_id FROM threads WHERE updated_at < ?", (cutoff,))
+        idle = [row[0] for row in await query.fetchall()]
+
+        for i in range(0, len(idle), self.batch_threads):
+            batch = [(thread_id,) for thread_id in idle[i:i + self.batch_threads]]
+            report["checkpoints_deleted"] += await self._delete_many(conn, "DELETE FROM checkpoints WHERE thread_id = ?", batch)
+            report["writes_deleted"] += await self._delete_many(conn, "DELETE FROM writes WHERE thread_id = ?", batch)
+            report["threads_deleted"] += await self._delete_many(conn, "DELETE FROM threads WHERE thread_id = ?", batch)
+            await conn.commit()
+            await asyncio.sleep(self.pause)
+
+    async def _trim_threads(self, conn: aiosqlite.Connection, report: dict):
+        query = await conn.execute(
+            "SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, checkpoint_ns HAVING COUNT(*) > ?",
+            (self.keep,),
+        )
+        threads = await query.fetchall()
+
+        for i in range(0, len(threads), self.batch_threads):
+            batch = [(thread_id, ns, thread_id, ns, self.keep) for thread_id, ns in threads[i:i + self.batch_threads]]
+            # checkpoint_id is time-ordered (uuid6): the latest are the largest, as in AsyncSqliteSaver
+            report["checkpoints_deleted"] += await self._delete_many(
+                conn,
+                """
+                DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                    ORDER BY checkpoint_id DESC LIMIT ?
+                )
+                """,
+                batch,
+            )
+            report["writes_deleted"] += await self._delete_many(
+                conn,
+                """
+                DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                )
+                """,
+                [row[:4] for row in batch],
+            )
+            await conn.commit()
+            await asyncio.sleep(self.pause)
+
+    async def _delete_many(self, conn: aiosqlite.Connection, sql: str, rows: list) -> int:
+        cursor = await conn.executemany(sql, rows)
+        return cursor.rowcount
+
+    async def _incremental_vacuum(self, conn: aiosqlite.Connection) -> bool:
+        """Truncates free pages off the file in small steps; needs auto_vacuum=INCREMENTAL."""
+        auto_vacuum = (await (await conn.execute("PRAGMA auto_vacuum")).fetchone())[0]
+        if auto_vacuum != 2:
+            logger.warning(
+                "auto_vacuum is not INCREMENTAL on this database: freed pages are reused but the file "
+                "does not shrink. Run `python compaction.py --vacuum` once, with the server stopped."
+            )
+            return False
+
+        # Only the pages free now: live traffic keeps freeing a few, chasing them would never end
+        free_pages = (await (await conn.execute("PRAGMA freelist_count")).fetchone())[0]
+        for _ in range(0, free_pages, VACUUM_STEP_PAGES):
+            # execute() steps the pragma once (one page); executescript runs it to the end
+            await conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});")
+            await asyncio.sleep(self.pause)
+        # Let the WAL give the space back too
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+
+async def full_vacuum(db_path: str = DB_PATH):
+    """Offline one-off: switches an existing database to auto_vacuum=INCREMENTAL (rewrites the file)."""
+    conn = await aiosqlite.connect(db_path)
+    try:
+        await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await conn.execute("VACUUM")
+        logger.info(f"{db_path} rewritten with auto_vacuum=INCREMENTAL")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    # One compaction pass from the command line; --vacuum first converts the file (server stopped)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if "--vacuum" in sys.argv:
+        asyncio.run(full_vacuum())
+    print(asyncio.run(CheckpointCompactor().run(use_lease=False)))
@@ -0,0 +1,152 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import sqlite3
+import secrets
+import logging
+import threading
+
+import aiosqlite
+from cachetools import TTLCache
+
+from db import BUSY_TIMEOUT_MS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+CSRF_TTL_SECONDS = int(os.getenv("CSRF_TTL_SECONDS", "3600"))
+CSRF_MAX_TOKENS = int(os.getenv("CSRF_MAX_TOKENS", "100000"))
+
+# "memory" (per-process) or "signed" (stateless HMAC, works across workers)
+CSRF_STORE = os.getenv("CSRF_STORE", "signed" if os.getenv("CSRF_SECRET") else "memory")
+
+# Spent nonces of signed tokens, shared by every worker on the host (kept until the token expires)
+CSRF_DB = os.getenv("CSRF_DB", "csrf_nonces.sqlite")
+
+# Expired nonces are deleted at most this often
+NONCE_PURGE_SECONDS = 60
+
+
+class MemoryTokenStore:
+    """
+    In-process token store. Tokens expire after `ttl` seconds and the oldest
+    ones are evicted once `max_tokens` are outstanding, so memory stays bounded.
+    Only valid for a single worker process.
+    """
+
+    def __init__(self, ttl: int = CSRF_TTL_SECONDS, max_tokens: int = CSRF_MAX_TOKENS):
+        self._tokens = TTLCache(maxsize=max_tokens, ttl=ttl)
+        self._lock = threading.Lock()
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def issue(self) -> str:
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._tokens[token] = True
+        return token
+
+    async def consume(self, token: str) -> bool:
+        """Returns True once for a valid, unexpired token."""
+        with self._lock:
+            return self._tokens.pop(token, None) is not None
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+class SignedTokenStore:
+    """
+    Stateless token store: a token is an expiry timestamp and a random nonce,
+    signed with HMAC-SHA256. Any worker sharing CSRF_SECRET can verify it
+    without shared memory, and issuing a token allocates nothing server-side.
+
+    Single use holds across workers and restarts: a spent nonce is recorded
+    in SQLite (INSERT OR FAIL on its primary key) until the token expires,
+    so the second use fails whichever worker it reaches.
+    """
+
+    def __init__(self, secret: str, ttl: int = CSRF_TTL_SECONDS, db_path: str = CSRF_DB):
+        self._key = secret.encode()
+        self._ttl = ttl
+        self.db_path = db_path
+        self._conn: aiosqlite.Connection = None
+        self._purged_at = 0.0
+
+    async def open(self):
+        # Autocommit mode, every INSERT is its own transaction
+        self._conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+        await self._conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA busy_timeout={BUSY_TIMEOUT_MS};
+            CREATE TABLE IF NOT EXISTS spent_nonces (
+                nonce BLOB PRIMARY KEY,
+                expires_at INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_spent_nonces_expires ON spent_nonces (expires_at);
+            """
+        )
+        logger.info(f"Spent CSRF nonces stored in {self.db_path}")
+
+    async def close(self):
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()[:16]
+
+    def issue(self) -> str:
+        expires = int(time.time()) + self._ttl
+        payload = expires.to_bytes(8, "big") + secrets.token_bytes(16)
+        return base64.urlsafe_b64encode(payload + self._sign(payload)).decode().rstrip("=")
+
+    async def consume(self, token: str) -> bool:
+        """Returns True once, on any worker, for a validly signed, unexpired token."""
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError):
+            return False
+        if len(raw) != 40:
+            return False
+
+        payload, signature = raw[:24], raw[24:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return False
+        expires = int.from_bytes(payload[:8], "big")
+        now = time.time()
+        if expires < now:
+            return False
+
+        if now - self._purged_at > NONCE_PURGE_SECONDS:
+            self._purged_at = now
+            await self._conn.execute("DELETE FROM spent_nonces WHERE expires_at < ?", (int(now),))
+        try:
+            await self._conn.execute("INSERT OR FAIL INTO spent_nonces (nonce, expires_at) VALUES (?, ?)",
+                                     (payload[8:], expires))
+        except sqlite3.IntegrityError:
+            # Already spent, here or on another worker
+            return False
+        return True
+
+
+def create_token_store():
+    """Builds the token store selected by CSRF_STORE."""
+    if CSRF_STORE == "signed":
+        secret = os.getenv("CSRF_SECRET")
+        if not secret:
+            logger.warning("CSRF_SECRET not set. Using a random per-process secret; tokens will not work across workers.")
+            secret = secrets.token_urlsafe(32)
+        logger.info("Using signed (stateless) CSRF tokens.")
+        return SignedTokenStore(secret)
+
+    logger.info("Using in-memory CSRF token store.")
+    return MemoryTokenStore()
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+import logging
+
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from tracing import TracedSqliteSaver, TRACING_ENABLED
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+
+# Number of read-only connections next to the single writer
+READER_CONNECTIONS = int(os.getenv("SQLITE_READERS", "4"))
+
+# Page cache per connection in KiB (negative cache_size means KiB in SQLite)
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "32768"))
+
+# Memory-mapped I/O window in bytes
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# With tracing on, checkpoint get / put show up as spans of sampled requests
+SAVER_CLASS = TracedSqliteSaver if TRACING_ENABLED else AsyncSqliteSaver
+
+
+def connection_pragmas(read_only: bool = False) -> str:
+    # auto_vacuum must come first: it only takes effect on a new file (lets compaction shrink it)
+    pragmas = "" if read_only else "PRAGMA auto_vacuum=INCREMENTAL;"
+    pragmas += f"""
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-{CACHE_SIZE_KB};
+    PRAGMA mmap_size={MMAP_SIZE};
+    PRAGMA temp_store=MEMORY;
+    PRAGMA busy_timeout={BUSY_TIMEOUT_MS};
+    """
+    if read_only:
+        pragmas += "PRAGMA query_only=ON;\n"
+    return pragmas
+
+
+async def connect(path: str, read_only: bool = False) -> aiosqlite.Connection:
+    """Opens an aiosqlite connection with the WAL / cache pragmas applied."""
+    conn = await aiosqlite.connect(path)
+    await conn.executescript(connection_pragmas(read_only))
+    return conn
+
+
+async def take_lease(conn: aiosqlite.Connection, job: str, owner: str, seconds: float) -> bool:
+    """
+    Claims a maintenance job for `owner` for `seconds` (one lease row per job);
+    False while another owner holds an unexpired lease on it.
+    """
+    now = time.time()
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS maintenance_leases (job TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+    )
+    cursor = await conn.execute(
+        """
+        INSERT INTO maintenance_leases (job, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(job) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE maintenance_leases.expires_at < ? OR maintenance_leases.owner = excluded.owner
+        """,
+        (job, owner, now + seconds, now),
+    )
+    await conn.commit()
+    return cursor.rowcount > 0
+
+
+class SqlitePool:
+    """
+    One writer connection plus N reader connections to the checkpoint database.
+
+    The writer backs the AsyncSqliteSaver used by the graph (checkpoint writes)
+    and the thread index writes. Readers serve /chat-history and /all-chats,
+    so in WAL mode those reads never queue behind checkpoint writes.
+    Each reader carries its own AsyncSqliteSaver for checkpoint reads.
+    """
+
+    def __init__(self, path: str = DB_PATH, readers: int = READER_CONNECTIONS, serde=None):
+        self.path = path
+        self.reader_count = max(1, readers)
+        self.serde = serde
+        self.writer: aiosqlite.Connection = None
+        self.checkpointer: AsyncSqliteSaver = None
+        self._readers: list[AsyncSqliteSaver] = []
+        self._idle: asyncio.Queue = None
+
+    async def open(self):
+        self.writer = await connect(self.path)
+        self.checkpointer = SAVER_CLASS(conn=self.writer, serde=self.serde)
+        # Create the checkpoint tables before the readers go query-only
+        await self.checkpointer.setup()
+
+        self._idle = asyncio.Queue()
+        for _ in range(self.reader_count):
+            saver = SAVER_CLASS(conn=await connect(self.path, read_only=True), serde=self.serde)
+            saver.is_setup = True
+            self._readers.append(saver)
+            self._idle.put_nowait(saver)
+
+        logger.info(f"SQLite pool opened: 1 writer + {self.reader_count} readers on {self.path}")
+
+    @asynccontextmanager
+    async def reader(self):
+        """
+        Checks out a read-only AsyncSqliteSaver. Use its aget_tuple() for
+        checkpoint reads and its .conn for plain SQL queries.
+        """
+        saver = await self._idle.get()
+        try:
+            yield saver
+        finally:
+            self._idle.put_nowait(saver)
+
+    async def close(self):
+        for saver in self._readers:
+            await saver.conn.close()
+        self._readers = []
+        if self.writer:
+            await self.writer.close()
+            self.writer = None
@@ -0,0 +1,132 @@
+import json
+import time
+import random
+import asyncio
+
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeModelError(Exception):
+    """Injected model failure (stands in for an API error or a rate limit)."""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatGoogleGenerativeAI used by the bench_*.py scripts.
+    Replies with a fixed text after `latency` seconds, split into `chunks` tokens.
+    The sync path blocks with time.sleep, the async path awaits asyncio.sleep.
+    A share `failure_rate` of the calls raises FakeModelError after the latency.
+    With `usage_tokens` set, the last streamed chunk reports that usage.
+    With `tool_call` set ({"name": ..., "args": {...}}), a call that does not
+    follow a tool result asks for that tool instead of answering.
+    """
+
+    reply: str = "This is a fake answer from the model."
+    latency: float = 0.0
+    token_delay: float = 0.0
+    chunks: int = 8
+    failure_rate: float = 0.0
+    usage_tokens: int = 0
+    tool_call: Optional[dict] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeModelError("injected failure")
+
+    def _wants_tool(self, messages: list[BaseMessage]) -> bool:
+        return bool(self.tool_call) and not (messages and isinstance(messages[-1], ToolMessage))
+
+    def _tool_message(self) -> AIMessage:
+        return AIMessage(content="", tool_calls=[{**self.tool_call, "id": "call_fake", "type": "tool_call"}])
+
+    def _tool_chunk(self) -> ChatGenerationChunk:
+        args = json.dumps(self.tool_call.get("args", {}))
+        return ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+            {"name": self.tool_call["name"], "args": args, "id": "call_fake", "index": 0}]))
+
+    def _chunk(self, piece: str, last: bool) -> ChatGenerationChunk:
+        usage = None
+        if last and self.usage_tokens:
+            usage = {"input_tokens": 0, "output_tokens": self.usage_tokens, "total_tokens": self.usage_tokens}
+        return ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+
+    def _pieces(self) -> list[str]:
+        size = max(1, len(self.reply) // self.chunks)
+        return [self.reply[i:i + size] for i in range(0, len(self.reply), size)]
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        self._maybe_fail()
+        message = self._tool_message() if self._wants_tool(messages) else AIMessage(content=self.reply)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        message = self._tool_message() if self._wants_tool(messages) else AIMessage(content=self.reply)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any):
+        time.sleep(self.latency)
+        self._maybe_fail()
+        if self._wants_tool(messages):
+            yield self._tool_chunk()
+            return
+        pieces = self._pieces()
+        for i, piece in enumerate(pieces):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = self._chunk(piece, i == len(pieces) - 1)
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        if self._wants_tool(messages):
+            yield self._tool_chunk()
+            return
+        pieces = self._pieces()
+        for i, piece in enumerate(pieces):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            chunk = self._chunk(piece, i == len(pieces) - 1)
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+class FakeSummarizer:
+    """
+    Deterministic stand-in for summarizer.ModelSummarizer: the summary is the
+    previous one plus the first words of every folded user message, capped
+    at `max_chars` (oldest text dropped first), like a real bounded summary.
+    """
+
+    def __init__(self, words: int = 8, max_chars: int = 2000):
+        self.words = words
+        self.max_chars = max_chars
+        self.calls = 0
+
+    def summarize(self, previous: str, messages: list[BaseMessage]) -> str:
+        self.calls += 1
+        lines = [previous] if previous else []
+        for message in messages:
+            if message.type == "human":
+                lines.append("- " + " ".join(str(message.content).split()[:self.words]))
+        return "\n".join(lines)[-self.max_chars:]
+
+    async def asummarize(self, previous: str, messages: list[BaseMessage]) -> str:
+        return self.summarize(previous, messages)
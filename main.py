@@ -1,54 +1,147 @@
+import os
 import logging
 import json
 import uvicorn
 import uuid
-import aiosqlite
-import secrets
 import asyncio
+import time
 
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import StreamingResponse, HTMLResponse, RedirectResponse 
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, RedirectResponse, PlainTextResponse
 from pydantic import BaseModel
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from contextlib import asynccontextmanager
 from typing import Any, Dict, Optional
 
 # Import the graph definition and the async checkpointer
-from agent import workflow_
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from agent import workflow_, available_models, rate_limiter, model_router, MODEL_WARMUP, TURN_END_NODE
+from tools import tavily_tool
+import thread_index
+from csrf import create_token_store
+from response_cache import ResponseCache, cache_key, UNCACHEABLE_MODELS
+from semantic_cache import SemanticCache
+from sse import encode_event, encode_chunk, coalesce_tokens
+from run_manager import RunManager, RunLimitReached
+from metrics import registry as metrics, CHAT_TTFT, CHAT_DURATION, SQLITE_QUERY, record_error
+from tracing import Tracer, TracingCallbackHandler, new_trace_id, parse_traceparent, bind_trace_id, span
+from streaming import stream_tokens, stream_events
+from db import SqlitePool
+from checkpoint_serde import CompressedSerializer
+from admission import AdmissionController, QueueFull
+from compaction import CheckpointCompactor, COMPACTION_ENABLED
+from queue_logging import QueueLogging, LOG_QUEUE
 from fastapi.staticfiles import StaticFiles # <-- Add StaticFiles
 
 # Setup logging
 logger = logging.getLogger("agent")
 
+# STREAM_DEBUG=1 streams through astream_events and also sends tool progress events
+STREAM_DEBUG = os.getenv("STREAM_DEBUG", "0") == "1"
+
 
 # This will hold our compiled-with-persistence app
 langgraph_app = None
 
+# One writer + N reader connections to checkpoints.sqlite
+db_pool = None
+
+# Chat runs are background tasks (see run_manager.py). On shutdown, uvicorn lets connected
+# clients read for timeout_graceful_shutdown (see serve.py); the lifespan then gives the
+# runs STREAM_DRAIN_SECONDS more, cancels the rest and waits for their partial answers
+# to be checkpointed (in tasks of their own) before the database is closed
+partial_saves = set()
+STREAM_DRAIN_SECONDS = float(os.getenv("STREAM_DRAIN_SECONDS", "10"))
+
+# Opt-in background pruning of old checkpoints and idle threads (CHECKPOINT_COMPACTION=1)
+compactor = CheckpointCompactor()
+
+# Chat runs with their frame buffers: capped (RUNS_MAX_ACTIVE), cancellable, watched by
+# any number of streams and cancelled when nobody watches them (RUN_ABANDON_SECONDS);
+# shared with the other workers through RUNS_DB, so streams resume on any of them
+run_manager = RunManager()
+
+# Console / file log writes move to a background thread once uvicorn has configured
+# logging (LOG_QUEUE), optionally as JSON (LOG_JSON) and sampled per logger (LOG_SAMPLE_RATES)
+queue_logging = QueueLogging()
+
+# Sampled per-request traces of graph nodes, model and tool calls and checkpoint I/O
+# (TRACE_SAMPLE_RATE, exported by TRACE_EXPORTER to a JSONL file or an OTLP collector)
+tracer = Tracer()
+
+# Global / per-model / per-IP caps on concurrent model streams, counted across workers in ADMISSION_DB,
+# with a bounded queue per worker (ADMISSION_*)
+admission = AdmissionController()
+
+# Opt-in cache of complete answers (RESPONSE_CACHE=1)
+response_cache = ResponseCache()
+
+# Opt-in cache for near-duplicate first questions (SEMANTIC_CACHE=1)
+semantic_cache = SemanticCache()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Async context manager for FastAPI lifespan events.
     This is the new way to handle startup/shutdown in modern FastAPI.
     """
-    global langgraph_app
+    global langgraph_app, db_pool
+    if LOG_QUEUE:
+        queue_logging.install()
     logger.info("Application startup...")
     
-    # Create the async connection
-    conn = await aiosqlite.connect("checkpoints.sqlite")
+    # Open the writer and reader connections (WAL mode); large checkpoints are
+    # zstd-compressed with CHECKPOINT_COMPRESSION=1, plain rows stay readable
+    db_pool = SqlitePool(serde=CompressedSerializer())
+    await db_pool.open()
     
-    # Pass the connection to the AsyncSqliteSaver
-    memory = AsyncSqliteSaver(conn=conn)
-    
-    # Compile the graph with the checkpointer
-    langgraph_app = workflow_.compile(checkpointer=memory)
+    # Compile the graph with the checkpointer (writes go through the writer connection)
+    langgraph_app = workflow_.compile(checkpointer=db_pool.checkpointer)
+
+    # Thread index used by /all-chats (titles and timestamps without loading state); threads
+    # from before the index are added in the background, by one worker (see thread_index.backfill)
+    await thread_index.setup(db_pool.writer)
+    backfill = asyncio.create_task(thread_index.backfill(db_pool.path, db_pool.checkpointer.serde))
+
+    await csrf_tokens.open()
+    await admission.open()
+    await run_manager.open()
+    await response_cache.open()
+    await semantic_cache.open()
+    await rate_limiter.open()
+
+    if COMPACTION_ENABLED:
+        compactor.start()
+
+    # Models are built on first use; MODEL_WARMUP builds the listed ones now
+    await available_models.warm_up(MODEL_WARMUP)
     
     logger.info("LangGraph app compiled with persistence.")
     
     yield  # This is where the application runs
+
+    backfill.cancel()
+    try:
+        await backfill
+    except asyncio.CancelledError:
+        pass
+    await compactor.stop()
+
+    if run_manager.active or partial_saves:
+        logger.info(f"Waiting for {run_manager.active} chat run(s) to checkpoint...")
+        await run_manager.drain(STREAM_DRAIN_SECONDS)
+        if partial_saves:
+            await asyncio.wait(partial_saves, timeout=STREAM_DRAIN_SECONDS)
     
-    await conn.close()
-    logger.info("Database connection closed. Application shutdown.")
+    await run_manager.close()
+    await csrf_tokens.close()
+    await admission.close()
+    await response_cache.close()
+    await semantic_cache.close()
+    await rate_limiter.close()
+    await db_pool.close()
+    tracer.close()
+    logger.info("Database connections closed. Application shutdown.")
+    queue_logging.stop()
 
 # Pass the lifespan context manager to the FastAPI app
 app = FastAPI(lifespan=lifespan)
@@ -66,8 +159,8 @@ class ChatRequest(BaseModel):
     client_data: Optional[Dict[str, Any]] = None
     csrf_token: str
 
-# CSRF token storage (in production, use Redis or database)
-csrf_tokens = set()
+# CSRF token storage: bounded TTL store, or signed tokens shared across workers (spent nonces in CSRF_DB)
+csrf_tokens = create_token_store()
 
 @app.get("/")
 async def get_root(request: Request):
@@ -77,133 +170,347 @@ async def get_root(request: Request):
 @app.get("/csrf-token")
 async def get_csrf_token():
     """Generate and return a CSRF token."""
-    token = secrets.token_urlsafe(32)
+    token = csrf_tokens.issue()
     logger.info("CSRF token generated")
-    csrf_tokens.add(token)
     return {"csrf_token": token}
 
+# Messages per SSE frame when replaying history
+HISTORY_BATCH_SIZE = 50
+
+def visible_messages(messages: list) -> list[dict]:
+    """Keeps only what the chat window shows: user messages and final AI answers."""
+    visible = []
+    for msg in messages:
+        ai_typ = msg.__class__.__name__
+        
+        if ai_typ == 'HumanMessage':
+            sender = 'user'
+        elif ai_typ == 'AIMessage':
+            if hasattr(msg, 'tool_calls') and msg.tool_calls:
+                continue
+            sender = 'assistant'
+        else:
+            continue
+        
+        if hasattr(msg, 'content'):
+            visible.append({'sender': sender, 'content': msg.content})
+    return visible
+
 @app.get("/chat-history/{thread_id}")
-async def get_chat_history(thread_id: str):
-    """Stream chat history for a specific thread."""
+async def get_chat_history(
+    thread_id: str,
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[int] = Query(None, ge=0),
+    batch: int = Query(HISTORY_BATCH_SIZE, ge=1, le=1000),
+):
+    """
+    Stream chat history for a specific thread in batched frames
+    ({'messages': [...]}, up to `batch` messages each).
+    Optional paging: ?limit=N returns the N messages before index ?before=
+    (default: the end of the thread). The done frame carries next_before
+    for loading the previous page, or None when the start was reached.
+    """
     async def generate():
         try:
             config = {"configurable": {"thread_id": thread_id}}
-            state = await langgraph_app.aget_state(config)
+            async with db_pool.reader() as reader:
+                with SQLITE_QUERY.time("aget_tuple"):
+                    checkpoint_tuple = await reader.aget_tuple(config)
+            
+            visible = []
+            if checkpoint_tuple:
+                visible = visible_messages(checkpoint_tuple.checkpoint["channel_values"].get('messages', []))
             
-            if state and state.values and 'messages' in state.values:
-                for msg in state.values['messages']:
-                    ai_typ = msg.__class__.__name__
-                    
-                    if ai_typ == 'HumanMessage':
-                        sender = 'user'
-                    elif ai_typ == 'AIMessage':
-                        if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                            continue
-                        sender = 'assistant'
-                    elif ai_typ == 'ToolMessage':
-                        continue
-                    else:
-                        continue
-                    
-                    if hasattr(msg, 'content'):
-                        yield f"data: {json.dumps({'sender': sender, 'content': msg.content})}\n\n"
-                        await asyncio.sleep(0.01)
+            end = len(visible) if before is None else min(before, len(visible))
+            start = max(0, end - limit) if limit else 0
+            page = visible[start:end]
             
-            yield f"data: {json.dumps({'done': True, 'thread_id': thread_id})}\n\n"
+            for i in range(0, len(page), batch):
+                yield f"data: {json.dumps({'messages': page[i:i + batch]})}\n\n"
+            
+            yield f"data: {json.dumps({'done': True, 'thread_id': thread_id, 'total': len(visible), 'next_before': start or None})}\n\n"
         except Exception as e:
+            record_error("chat_history", e)
             logger.error(f"Error fetching chat history: {type(e).__name__}")
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
     
     return StreamingResponse(generate(), media_type="text/event-stream")
 
 @app.get("/all-chats")
-async def get_all_chats():
-    """Stream all chat threads from database."""
+async def get_all_chats(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    """
+    Stream one page of chat threads, most recently updated first.
+    Pass the returned next_cursor back as ?cursor= to get the next page.
+    """
+    # A bad cursor is the client's mistake: answer 400 before the stream starts
+    after = None
+    if cursor:
+        try:
+            after = thread_index.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
     async def generate():
         try:
-            conn = langgraph_app.checkpointer.conn
-            cursor = await conn.execute(
-                "SELECT thread_id, MAX(checkpoint) as latest_checkpoint FROM checkpoints GROUP BY thread_id ORDER BY latest_checkpoint"
-            )
-            rows = await cursor.fetchall()
+            async with db_pool.reader() as reader:
+                with SQLITE_QUERY.time("all_chats"):
+                    threads, next_cursor = await thread_index.list_threads(reader.conn, limit, after)
             
-            for row in rows:
-                thread_id = row[0]
-                config = {"configurable": {"thread_id": thread_id}}
-                state = await langgraph_app.aget_state(config)
-                
-                title = "New Chat"
-                timestamp = 0
-                if state and state.values and 'messages' in state.values:
-                    for msg in state.values['messages']:
-                        if hasattr(msg, 'content') and msg.__class__.__name__ == 'HumanMessage':
-                            title = msg.content[:30] + ('...' if len(msg.content) > 30 else '')
-                            break
-                    try:
-                        checkpoint_data = json.loads(row[1]) if isinstance(row[1], str) else row[1]
-                        timestamp = int(checkpoint_data.get('ts', 0))
-                    except:
-                        import time
-                        timestamp = int(time.time() * 1000)
-                
-                yield f"data: {json.dumps({'thread_id': thread_id, 'title': title, 'timestamp': timestamp})}\n\n"
-                await asyncio.sleep(0.01)
+            for thread in threads:
+                yield f"data: {json.dumps(thread)}\n\n"
             
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            yield f"data: {json.dumps({'done': True, 'next_cursor': next_cursor})}\n\n"
         except Exception as e:
+            record_error("all_chats", e)
             logger.error(f"Error fetching all chats: {type(e).__name__}: {str(e)}")
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
     
     return StreamingResponse(generate(), media_type="text/event-stream")
 
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Hit rates of the response, semantic and web search caches."""
+    return {
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "search_cache": tavily_tool.stats() if tavily_tool else None,
+    }
+
+
+@app.get("/admission-stats")
+async def get_admission_stats():
+    """Running streams, queue depth and queue wait times of this worker, and upstream quota waits."""
+    return {**admission.stats(), "rate_limiter": rate_limiter.stats(), "runs": run_manager.stats()}
+
+
+# Component stats are read at scrape time only (nothing extra per request)
+metrics.collect("chat_runs", "Chat runs of this worker (see /admission-stats).", run_manager.stats)
+metrics.collect("admission", "Admission control of model streams.", admission.stats)
+metrics.collect("rate_limiter", "Client-side upstream quota buckets.", rate_limiter.stats)
+metrics.collect("model_router", "Model fallbacks and hedging.", model_router.stats)
+metrics.collect("response_cache", "Exact-match answer cache.", response_cache.stats)
+metrics.collect("semantic_cache", "Near-duplicate question cache.", semantic_cache.stats)
+metrics.collect("search_cache", "Web search result cache.", lambda: tavily_tool.stats() if tavily_tool else {})
+metrics.collect("compaction", "Last checkpoint compaction run.", lambda: compactor.last_report)
+metrics.collect("tracing", "Sampled request traces and their export.", tracer.stats)
+metrics.collect("logging", "Queued log records.", queue_logging.stats)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format metrics of this worker (each worker keeps its own)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
  
 
-async def llm_response_stream(thread_id: str, request: ChatRequest):
-    async def generate():
-        try:
-            if not thread_id or thread_id == 1234:
-                new_thread_id = str(uuid.uuid4())
-                logger.info(f"Generated new thread_id: {new_thread_id}")
-            else:
-                new_thread_id = thread_id
-
-            logger.info(f"User message received (length: {len(request.input)})")
-
-            config = {
-                "configurable": {
-                    "thread_id": new_thread_id,
-                    "model_name": request.model_name,
-                    "recursion_limit": 30
-                }
+async def load_visible_history(thread_id: str) -> list[str]:
+    """Contents of the messages shown in the chat window, oldest first."""
+    async with db_pool.reader() as reader:
+        with SQLITE_QUERY.time("aget_tuple"):
+            checkpoint_tuple = await reader.aget_tuple({"configurable": {"thread_id": thread_id}})
+    if not checkpoint_tuple:
+        return []
+    messages = checkpoint_tuple.checkpoint["channel_values"].get('messages', [])
+    return [
+        msg['content'] if isinstance(msg['content'], str) else json.dumps(msg['content'])
+        for msg in visible_messages(messages)
+    ]
+
+async def replay_cached_answer(config: dict, thread_id: str, request: ChatRequest, cached_chunks: list):
+    """Replays a cached answer as the live chunk stream and records the turn."""
+    for content in cached_chunks:
+        yield encode_chunk(content)
+
+    # Keep the thread's checkpoint in step with what the user saw
+    answer = AIMessage(content="".join(cached_chunks))
+    await langgraph_app.aupdate_state(
+        config,
+        {"messages": [HumanMessage(content=request.input), answer]},
+        as_node=TURN_END_NODE,
+    )
+    await thread_index.record_turn(db_pool.writer, thread_id, request.input)
+
+    yield encode_event({'done': True})
+
+async def save_partial_answer(config: dict, thread_id: str, request: ChatRequest, text: str):
+    """Checkpoints the part of an answer that was streamed before the stream was cut off."""
+    try:
+        await langgraph_app.aupdate_state(config, {"messages": [AIMessage(content=text)]}, as_node=TURN_END_NODE)
+        await thread_index.record_turn(db_pool.writer, thread_id, request.input)
+        logger.info("Partial answer checkpointed")
+    except Exception as e:
+        logger.error(f"Error checkpointing partial answer: {type(e).__name__}")
+
+
+async def run_chat(run, thread_id: str, request: ChatRequest, ticket, trace_id: str, traceparent=None):
+    """
+    Generates one answer into the run's buffer. It runs as a task of its own,
+    so a client that drops off does not stop (or re-pay for) the generation:
+    it reconnects to /chat-stream/{run_id} and picks up where it left off.
+
+    If the request is sampled, its spans (graph nodes, model and tool calls,
+    checkpoint I/O) are recorded under `trace_id`, joining the caller's trace
+    when a traceparent header was sent.
+    """
+    new_thread_id = run.thread_id
+    # Text of the agent step being streamed (not checkpointed until the step ends)
+    partial = []
+    # Metrics label: only known model names, so clients can't blow up the series count
+    model_label = request.model_name if request.model_name in available_models else "unknown"
+    run_started = time.perf_counter()
+    outcome = "cancelled"
+    failure = None
+    parent_id, sampled = traceparent[1:] if traceparent else (None, None)
+    trace = tracer.start("chat", trace_id, parent_id, sampled,
+                         thread_id=new_thread_id, run_id=run.run_id, model=model_label)
+    try:
+        logger.info(f"User message received (length: {len(request.input)})")
+
+        config = {
+            "configurable": {
+                "thread_id": new_thread_id,
+                "model_name": request.model_name,
+                "recursion_limit": 30
             }
+        }
+        if trace:
+            config["callbacks"] = [TracingCallbackHandler(trace)]
+
+        # Send thread_id (and the run to reconnect to) first
+        run.append(encode_event({'thread_id': new_thread_id, 'run_id': run.run_id, 'trace_id': trace_id}))
+
+        key = None
+        cached_chunks = None
+        if response_cache.enabled_for(request.model_name):
+            with span("response_cache.get"):
+                history = await load_visible_history(new_thread_id) if thread_id else []
+                key = cache_key(request.model_name, history, request.input)
+                cached_chunks = await response_cache.get(key)
+
+        # Near-duplicate questions only make sense without earlier context
+        semantic = semantic_cache.enabled and not thread_id and request.model_name not in UNCACHEABLE_MODELS
+        if cached_chunks is None and semantic:
+            with span("semantic_cache.lookup"):
+                cached_chunks = await semantic_cache.lookup(request.model_name, request.input)
+
+        if cached_chunks is not None:
+            logger.info("Answer served from cache")
+            async for frame in replay_cached_answer(config, new_thread_id, request, cached_chunks):
+                run.append(frame)
+            outcome = "cached"
+            return
+
+        # Wait for a model slot, telling the client its place in the queue
+        with span("admission.wait"):
+            async for position in ticket.wait():
+                run.append(encode_event({'queue_position': position}))
+
+        chunks = []
+        used_tools = False
+        started = time.perf_counter()
+
+        inputs = {"messages": [HumanMessage(content=request.input)]}
+        source = stream_events if STREAM_DEBUG else stream_tokens
+
+        # Tokens are grouped into frames (SSE_COALESCE_BYTES / SSE_COALESCE_MS)
+        async for item in coalesce_tokens(source(langgraph_app, inputs, config)):
+            if isinstance(item, dict):
+                # Tool progress event: the agent step before it is checkpointed
+                partial = []
+                used_tools = True
+                if STREAM_DEBUG:
+                    run.append(encode_event(item))
+                continue
+            if not chunks:
+                CHAT_TTFT.observe(time.perf_counter() - run_started, model_label)
+                if trace:
+                    trace.root.event("first_frame")
+            chunks.append(item)
+            partial.append(item)
+            run.append(encode_chunk(item))
+        partial = []
+
+        with span("thread_index.record_turn"):
+            await thread_index.record_turn(db_pool.writer, new_thread_id, request.input)
+
+        # Tool answers (search results, current time) go stale, don't cache them
+        if chunks and not used_tools:
+            if key:
+                await response_cache.put(key, chunks)
+            if semantic:
+                await semantic_cache.store(request.model_name, request.input, chunks, (time.perf_counter() - started) * 1000)
+
+        run.append(encode_event({'done': True}))
+        outcome = "ok"
+        logger.info("AI workflow completed successfully")
+
+    except asyncio.CancelledError:
+        # The server is draining and gave up waiting for this run.
+        # The save runs in its own task: this one is cancelled and can't await anymore
+        if partial:
+            save = asyncio.ensure_future(save_partial_answer(config, new_thread_id, request, "".join(partial)))
+            partial_saves.add(save)
+            save.add_done_callback(partial_saves.discard)
+        raise
+    except Exception as e:
+        outcome = "error"
+        failure = e
+        record_error("chat", e)
+        logger.error(f"Critical error in llm_response_stream: {type(e).__name__}")
+        run.append(encode_event({'error': 'Internal server error'}))
+    finally:
+        ticket.release()
+        CHAT_DURATION.observe(time.perf_counter() - run_started, model_label, outcome)
+        tracer.finish(trace, error=failure, outcome=outcome, frames=run.last_id)
+
+
+async def llm_response_stream(thread_id: str, request: ChatRequest, ticket, trace_id: str, traceparent=None):
+    if not thread_id or thread_id == 1234:
+        new_thread_id = str(uuid.uuid4())
+        logger.info(f"Generated new thread_id: {new_thread_id}")
+    else:
+        new_thread_id = thread_id
+
+    try:
+        run = await run_manager.start(new_thread_id, lambda run: run_chat(run, thread_id, request, ticket, trace_id, traceparent))
+    except RunLimitReached as e:
+        ticket.release()
+        logger.warning(f"Run limit reached, rejecting request (Retry-After: {e.retry_after}s)")
+        raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(e.retry_after)})
+    # A task cancelled before it starts never runs its finally, free the slot anyway
+    run_manager.task(run).add_done_callback(lambda _: ticket.release())
+
+    return StreamingResponse(run_manager.view(run), media_type="text/event-stream", headers={"X-Trace-Id": trace_id})
 
-            # Send thread_id first
-            yield f"data: {json.dumps({'thread_id': new_thread_id})}\n\n"
-
-            # Stream token by token using astream_events
-            async for event in langgraph_app.astream_events(
-                {"messages": [HumanMessage(content=request.input)]},
-                config=config,
-                version="v2"
-            ):
-                kind = event.get("event")
-                
-                # Stream LLM tokens as they're generated
-                if kind == "on_chat_model_stream":
-                    content = event.get("data", {}).get("chunk", {}).content
-                    if content:
-                        yield f"data: {json.dumps({'chunk': content})}\n\n"
-
-            yield f"data: {json.dumps({'done': True})}\n\n"
-            logger.info("AI workflow completed successfully")
-            
-        except Exception as e:
-            logger.error(f"Critical error in llm_response_stream: {type(e).__name__}")
-            yield f"data: {json.dumps({'error': 'Internal server error'})}\n\n"
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
-    
 
+@app.get("/chat-stream/{run_id}")
+async def resume_chat_stream(run_id: str, request: Request, last_event_id: int = Query(0, ge=0)):
+    """
+    Re-attaches to a chat stream after a dropped connection: replays the
+    frames after the Last-Event-ID header (or ?last_event_id=) and follows
+    the generation live if it is still running, on whichever worker it runs.
+    """
+    run = await run_manager.lookup(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired stream")
+
+    header = request.headers.get("last-event-id", "")
+    if header.isdigit():
+        last_event_id = int(header)
+    if not run.can_resume(last_event_id):
+        raise HTTPException(status_code=410, detail="Stream events no longer available")
+
+    logger.info(f"Stream {run_id} resumed after event {last_event_id}")
+    return StreamingResponse(run_manager.view(run, last_event_id), media_type="text/event-stream")
+
+
+@app.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str):
+    """Stops a running generation on any worker; its viewers get a {'cancelled': true} frame."""
+    cancelled = await run_manager.request_cancel(run_id)
+    if cancelled is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired run")
+    return {"run_id": run_id, "cancelled": cancelled}
 
 
 @app.post("/chat/")
@@ -211,7 +518,12 @@ async def chat_invoke(request: Request):
     """
     POST endpoint to stream chat response.
     """
-    logger.info("Chat request received")
+    # Every request gets a trace id (returned in X-Trace-Id and the first frame, stamped
+    # on its log records), sampled or not
+    traceparent = parse_traceparent(request.headers.get("traceparent", ""))
+    trace_id = traceparent[0] if traceparent else new_trace_id()
+    bind_trace_id(trace_id)
+    logger.info(f"Chat request received (trace id: {trace_id})")
     
     try:
         data = await request.json()
@@ -221,9 +533,8 @@ async def chat_invoke(request: Request):
         
         chat_request = ChatRequest(**data)
         
-        if chat_request.csrf_token not in csrf_tokens:
+        if not await csrf_tokens.consume(chat_request.csrf_token):
             raise HTTPException(status_code=403, detail="Invalid CSRF token")
-        csrf_tokens.discard(chat_request.csrf_token)
         
     except HTTPException:
         raise
@@ -239,14 +550,20 @@ async def chat_invoke(request: Request):
 
     thread_id = chat_request.thread_id
     logger.info(f"Received request for thread: {thread_id}")
+
+    try:
+        ticket = await admission.enter(chat_request.model_name, ip)
+    except QueueFull as e:
+        logger.warning(f"Admission queue full, rejecting request (Retry-After: {e.retry_after}s)")
+        raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(e.retry_after)})
     
-    return await llm_response_stream(thread_id, chat_request)
+    return await llm_response_stream(thread_id, chat_request, ticket, trace_id, traceparent)
 
 
 
 
 if __name__ == "__main__":
-    # This is the entry point for running the server directly
+    # Single-worker dev server with --reload; production runs `python serve.py`
     import os
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(
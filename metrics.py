@@ -0,0 +1,174 @@
+import time
+import logging
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits to slow model answers
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# SQLite reads are much faster, finer buckets at the low end
+SQLITE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter per label set. inc() is one dict update."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram per label set. observe() finds the bucket with a
+    bisect and bumps one count; cumulative counts are only built on render.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            # Per-bucket counts (last one is +Inf), then sum
+            series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        for label_values, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+class Registry:
+    """
+    Metrics of this worker process, rendered in the Prometheus text format.
+
+    Besides the counters and histograms updated on the hot path, `collect`
+    registers stats() methods of the existing components (caches, admission,
+    router, ...). They are only read when /metrics is scraped, so they cost
+    nothing per request. Their numbers are exported as untyped samples.
+
+    Updates happen on the event loop, so no lock is taken; the rare update
+    from a sync graph thread may race and lose an increment.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors: list[tuple[str, str, Callable[[], dict]]] = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, prefix: str, help: str, stats: Callable[[], dict]):
+        """Exports the numbers of stats() as {prefix}_{key}; a nested dict becomes a `name` label."""
+        self.collectors.append((prefix, help, stats))
+
+    def _collected(self, prefix: str, help: str, stats: Callable[[], dict]) -> list[str]:
+        try:
+            values = stats() or {}
+        except Exception as e:
+            logger.error(f"Error collecting {prefix} metrics: {type(e).__name__}")
+            return []
+        lines = []
+        for key, value in values.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, bool) or value is None:
+                value = int(bool(value))
+            if isinstance(value, (int, float)):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} untyped", f"{name} {value}"]
+            elif isinstance(value, dict):
+                samples = [f'{name}{{name="{_escape(k)}"}} {v}' for k, v in value.items() if isinstance(v, (int, float))]
+                if samples:
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} untyped"] + samples
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for prefix, help, stats in self.collectors:
+            lines.extend(self._collected(prefix, help, stats))
+        return "\n".join(lines) + "\n"
+
+
+# ---------------------------------
+# Metrics of the chat service
+# ---------------------------------
+
+registry = Registry()
+
+CHAT_TTFT = registry.histogram(
+    "chat_time_to_first_token_seconds", "Time from the chat request to the first answer text (queueing included).", ("model",))
+CHAT_DURATION = registry.histogram(
+    "chat_stream_duration_seconds", "Duration of a chat run, from request to the end of the stream.", ("model", "outcome"))
+MODEL_TOKENS = registry.counter(
+    "model_tokens_total", "Tokens reported by the model, by model and input / output.", ("model", "kind"))
+TOOL_CALLS = registry.counter(
+    "tool_calls_total", "Tool calls by tool name and result (ok, timeout, error, unknown).", ("tool", "status"))
+TOOL_DURATION = registry.histogram(
+    "tool_call_duration_seconds", "Duration of a tool call.", ("tool",))
+ERRORS = registry.counter(
+    "errors_total", "Errors handled by the service, by where they happened and exception type.", ("where", "type"))
+SQLITE_QUERY = registry.histogram(
+    "sqlite_query_seconds", "Latency of checkpoint and thread index reads.", ("query",), buckets=SQLITE_BUCKETS)
+
+
+def record_error(where: str, error: BaseException):
+    ERRORS.inc(where, type(error).__name__)
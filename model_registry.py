@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import threading
+
+from typing import Iterable, NamedTuple, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class ModelSpec(NamedTuple):
+    """One selectable model: the name the UI sends and how to build its client."""
+    name: str
+    model: str
+    label: str
+    temperature: Optional[float] = None
+
+
+# Declared in priority order: the first available entry is the default model
+GEMINI_MODELS = (
+    ModelSpec("fast", "models/gemini-2.5-flash", "Gemini (2.5-flash)", temperature=0),
+    ModelSpec("unlimited", "models/gemini-2.5-flash-lite", "Gemini (2.5-flash-lite)", temperature=0),
+    ModelSpec("pro", "models/gemini-2.5-pro", "Gemini (2.5-pro)", temperature=1),
+    ModelSpec("flash", "models/gemini-2.0-flash", "Gemini (2.0-flash)"),
+)
+
+
+def build_gemini(spec: ModelSpec, api_key: str):
+    """Builds the streaming Gemini chat client for a spec (tools are bound by the registry)."""
+    # Imported here: langchain_google_genai alone is most of the import time of agent.py
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    options = {}
+    if spec.temperature is not None:
+        options["temperature"] = spec.temperature
+    return ChatGoogleGenerativeAI(model=spec.model, streaming=True, google_api_key=api_key, **options)
+
+
+class ModelRegistry:
+    """
+    Model clients by name, built and bound to the tools on first use.
+
+    Only the specs are declared up front, so importing agent.py (every worker
+    start and every --reload) no longer pays for the Gemini SDK import and
+    four client constructions. A model nobody selects is never built.
+
+    `get` / `[]` build on the calling thread; `aget` builds in a worker
+    thread so the event loop keeps serving other streams meanwhile. Builds
+    are serialized by a lock, so concurrent first requests build the client
+    once. Prebuilt models can be registered with `registry[name] = model`.
+    """
+
+    def __init__(self, specs: Iterable[ModelSpec] = (), tools=None, api_key: Optional[str] = None):
+        self.specs = {spec.name: spec for spec in specs}
+        self.tools = tools or []
+        self.api_key = api_key
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name) -> bool:
+        return name in self.specs or name in self._models
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    def names(self) -> list:
+        """Available model names, in declaration order."""
+        return list(dict.fromkeys([*self.specs, *self._models]))
+
+    def loaded(self) -> list:
+        """Names of the models whose client has already been built."""
+        return list(self._models)
+
+    def __setitem__(self, name: str, model):
+        self._models[name] = model
+
+    def __getitem__(self, name: str):
+        model = self.get(name)
+        if model is None:
+            raise KeyError(name)
+        return model
+
+    def get(self, name: str, default=None):
+        """Returns the bound model, building it on first use, or `default` if unknown."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self.specs:
+            return default
+        return self._build(name)
+
+    async def aget(self, name: str, default=None):
+        """Async `get`: the first build runs in a worker thread, later calls return immediately."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self.specs:
+            return default
+        return await asyncio.to_thread(self._build, name)
+
+    def _build(self, name: str):
+        with self._lock:
+            # Another caller may have built it while we waited for the lock
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            spec = self.specs[name]
+            model = build_gemini(spec, self.api_key).bind_tools(self.tools)
+            self._models[name] = model
+            logger.info(f"{spec.label} model loaded.")
+            return model
+
+    async def warm_up(self, names: Iterable[str]):
+        """Builds the given models ahead of the first request; unknown names are skipped."""
+        for name in names:
+            if name not in self:
+                logger.warning(f"Cannot warm up unknown model: {name}")
+                continue
+            try:
+                await self.aget(name)
+            except Exception as e:
+                logger.error(f"Error warming up model {name}: {type(e).__name__}")
@@ -0,0 +1,290 @@
+import os
+import time
+import asyncio
+import logging
+
+from collections import deque
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from metrics import MODEL_TOKENS, record_error
+from prompt_builder import estimate_tokens
+from rate_limiter import QUOTA_OUTPUT_TOKENS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Fallback chains, ">" separated: "pro>fast>unlimited" means pro falls back to fast,
+# then unlimited, and fast falls back to unlimited
+MODEL_FALLBACKS = os.getenv("MODEL_FALLBACKS", "pro>fast>unlimited,flash>unlimited")
+
+# Opt-in: start the next tier when the primary is slow to produce its first token
+MODEL_HEDGING_ENABLED = os.getenv("MODEL_HEDGING", "0") == "1"
+
+# The hedge fires at this percentile of the model's recent first-token latencies...
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "95"))
+
+# ...once this many samples are known, clamped to [MIN_MS, MAX_MS]; MAX_MS is used until then
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))
+MODEL_HEDGE_MIN_MS = float(os.getenv("MODEL_HEDGE_MIN_MS", "250"))
+MODEL_HEDGE_MAX_MS = float(os.getenv("MODEL_HEDGE_MAX_MS", "8000"))
+
+# First-token latencies kept per model
+LATENCY_WINDOW = 200
+
+
+def parse_fallbacks(spec: str) -> dict[str, list[str]]:
+    """Parses "pro>fast>unlimited,flash>unlimited" into {model: [fallbacks in order]}."""
+    fallbacks = {}
+    for chain in (spec or "").split(","):
+        names = [name.strip() for name in chain.split(">") if name.strip()]
+        for i, name in enumerate(names):
+            # The first chain that mentions a model decides its fallbacks
+            fallbacks.setdefault(name, names[i + 1:])
+    return fallbacks
+
+
+class LatencyTracker:
+    """Recent first-token latencies (seconds) per model, for the hedge deadline."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+
+    def record(self, name: str, seconds: float):
+        self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, name: str) -> int:
+        return len(self._samples.get(name, ()))
+
+    def percentile(self, name: str, percentile: float) -> Optional[float]:
+        samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+
+class ModelRouter:
+    """
+    Routes a model request along its fallback chain.
+
+    A tier that fails before producing its first token (an error, a rate
+    limit, an empty reply) is replaced by the next tier in the chain. With
+    hedging on, the next tier is also started when the current one has not
+    streamed its first token within its recent p95 first-token latency; the
+    first tier to stream wins and the others are cancelled. Once a tier has
+    streamed, the answer stays with it, errors after that are raised.
+
+    Models are resolved through the registry, so a fallback tier is only
+    built when a request actually falls back to it. With a `limiter`, each
+    tier first reserves its upstream quota (a tier out of quota falls back
+    like a failed one) and settles it against the reported usage.
+    """
+
+    def __init__(self, registry, fallbacks: dict[str, list[str]] = None, limiter=None, hedging: bool = MODEL_HEDGING_ENABLED,
+                 hedge_percentile: float = MODEL_HEDGE_PERCENTILE, hedge_min_samples: int = MODEL_HEDGE_MIN_SAMPLES,
+                 hedge_min_ms: float = MODEL_HEDGE_MIN_MS, hedge_max_ms: float = MODEL_HEDGE_MAX_MS):
+        self.registry = registry
+        self.limiter = limiter
+        self.fallbacks = parse_fallbacks(MODEL_FALLBACKS) if fallbacks is None else fallbacks
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_max_ms = hedge_max_ms
+        self.latency = LatencyTracker()
+        self.counters = {"requests": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0}
+
+    def chain(self, name: str) -> list[str]:
+        """The model followed by its available fallbacks."""
+        return [name] + [fallback for fallback in self.fallbacks.get(name, [])
+                         if fallback != name and fallback in self.registry]
+
+    def hedge_delay(self, name: str) -> float:
+        """Seconds to wait for the first token of `name` before starting the next tier."""
+        if self.latency.count(name) < self.hedge_min_samples:
+            return self.hedge_max_ms / 1000
+        delay_ms = self.latency.percentile(name, self.hedge_percentile) * 1000
+        return min(self.hedge_max_ms, max(self.hedge_min_ms, delay_ms)) / 1000
+
+    def for_model(self, name: str) -> "RoutedChatModel":
+        """Chat model that answers with `name`, falling back (and hedging) along its chain."""
+        return RoutedChatModel(router=self, chain=self.chain(name))
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "hedging": self.hedging,
+            "first_token_p95_ms": {
+                name: round(self.latency.percentile(name, 95) * 1000, 1)
+                for name in self.latency._samples
+            },
+        }
+
+
+class _Attempt:
+    """
+    One tier's stream, racing for its first chunk. `open_stream(attempt)`
+    stores its quota reservation on the attempt as soon as it has one.
+    """
+
+    def __init__(self, name: str, open_stream, limiter=None, hedge: bool = False):
+        self.name = name
+        self.hedge = hedge
+        self.limiter = limiter
+        self.stream = None
+        self.reservation = None
+        self.started = time.perf_counter()
+        self.first = asyncio.ensure_future(self._first_chunk(open_stream))
+
+    async def _first_chunk(self, open_stream):
+        self.stream = await open_stream(self)
+        return await self.stream.__anext__()
+
+    async def close(self):
+        """Stops an attempt that did not win and gives its reserved tokens back."""
+        if not self.first.done():
+            self.first.cancel()
+        try:
+            await self.first
+        except BaseException:
+            pass
+        if self.stream is not None:
+            await self.stream.aclose()
+        if self.limiter is not None and self.reservation is not None:
+            reservation, self.reservation = self.reservation, None
+            try:
+                await self.limiter.release(reservation)
+            except Exception as e:
+                logger.error(f"Error releasing quota for {self.name}: {type(e).__name__}")
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model facade over one fallback chain of a ModelRouter.
+
+    The tiers run without the caller's callbacks; only the winning tier's
+    chunks are yielded from here, so the client stream (stream_mode="messages")
+    never mixes tokens from two models.
+    """
+
+    router: Any
+    chain: list[str]
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat-model"
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        """Sync path: plain fallback, one tier after another (no hedging, no quota limiter)."""
+        self.router.counters["requests"] += 1
+        error = None
+        for i, name in enumerate(self.chain):
+            if i:
+                self.router.counters["fallbacks"] += 1
+                logger.warning(f"Model {self.chain[i - 1]} failed ({type(error).__name__}). Falling back to {name}")
+            try:
+                message = self.router.registry[name].invoke(messages, {"callbacks": []}, stop=stop, **kwargs)
+                return ChatResult(generations=[ChatGeneration(message=message)])
+            except Exception as e:
+                record_error("model", e)
+                error = e
+        raise error
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # Merged on the loop: agenerate_from_stream would hop to a worker thread for it
+        chunks = [chunk async for chunk in self._astream(messages, stop=stop, **kwargs)]
+        return generate_from_stream(iter(chunks))
+
+    def _start(self, name: str, messages: list[BaseMessage], stop, kwargs, hedge: bool = False) -> _Attempt:
+        async def open_stream(attempt: _Attempt):
+            # Quota and building the client count as part of the attempt, failing either falls back too
+            if self.router.limiter is not None:
+                estimate = sum(estimate_tokens(message) for message in messages) + QUOTA_OUTPUT_TOKENS
+                attempt.reservation = await self.router.limiter.reserve(name, estimate)
+            model = await self.router.registry.aget(name)
+            return model.astream(messages, {"callbacks": []}, stop=stop, **kwargs)
+
+        return _Attempt(name, open_stream, limiter=self.router.limiter, hedge=hedge)
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any):
+        router = self.router
+        router.counters["requests"] += 1
+        pending = list(self.chain)
+        attempts = []
+        winner = None
+        chunk = None
+        error = None
+
+        try:
+            while winner is None:
+                if not attempts:
+                    if not pending:
+                        raise error
+                    if error is not None:
+                        router.counters["fallbacks"] += 1
+                        logger.info(f"Falling back to {pending[0]}")
+                    attempts.append(self._start(pending.pop(0), messages, stop, kwargs))
+
+                timeout = None
+                if router.hedging and pending:
+                    latest = attempts[-1]
+                    timeout = max(0.0, latest.started + router.hedge_delay(latest.name) - time.perf_counter())
+
+                done, _ = await asyncio.wait([a.first for a in attempts], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # No first token within the deadline: race the next tier as well
+                    router.counters["hedges"] += 1
+                    logger.info(f"Model {attempts[-1].name} is slow to respond. Hedging with {pending[0]}")
+                    attempts.append(self._start(pending.pop(0), messages, stop, kwargs, hedge=True))
+                    continue
+
+                for attempt in list(attempts):
+                    if attempt.first not in done:
+                        continue
+                    try:
+                        chunk = attempt.first.result()
+                    except StopAsyncIteration:
+                        error = ValueError(f"Model {attempt.name} returned an empty response")
+                    except Exception as e:
+                        error = e
+                    else:
+                        winner = attempt
+                        break
+                    record_error("model", error)
+                    logger.warning(f"Model {attempt.name} failed before its first token: {type(error).__name__}")
+                    attempts.remove(attempt)
+                    await attempt.close()
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    await attempt.close()
+
+        router.latency.record(winner.name, time.perf_counter() - winner.started)
+        if winner.hedge:
+            router.counters["hedge_wins"] += 1
+
+        # Usage is reported per chunk (usually only on the last ones)
+        used_tokens = None
+        try:
+            while True:
+                if chunk.usage_metadata:
+                    used_tokens = (used_tokens or 0) + chunk.usage_metadata.get("total_tokens", 0)
+                    MODEL_TOKENS.inc(winner.name, "input", amount=chunk.usage_metadata.get("input_tokens", 0))
+                    MODEL_TOKENS.inc(winner.name, "output", amount=chunk.usage_metadata.get("output_tokens", 0))
+                yield ChatGenerationChunk(message=chunk)
+                chunk = await winner.stream.__anext__()
+        except StopAsyncIteration:
+            pass
+        finally:
+            await winner.stream.aclose()
+            if router.limiter is not None:
+                try:
+                    await router.limiter.settle(winner.reservation, used_tokens)
+                except Exception as e:
+                    logger.error(f"Error settling quota for {winner.name}: {type(e).__name__}")
@@ -0,0 +1,109 @@
+import os
+import logging
+
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, ToolMessage
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Rough token budget for everything we send to the model (system prompt included)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+
+# Old tool results bigger than this are replaced by a short placeholder
+TOOL_MESSAGE_MAX_CHARS = int(os.getenv("PROMPT_TOOL_MESSAGE_MAX_CHARS", "1000"))
+
+# ~4 characters per token is close enough for budgeting Gemini prompts
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def content_text(content) -> str:
+    """Flattens a message content (string or list of parts) into plain text."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict):
+            parts.append(str(part.get("text", "")))
+    return "".join(parts)
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """
+    Cheap token estimate for a single message.
+    Counts the text content plus any tool call arguments the message carries.
+    """
+    chars = len(content_text(message.content))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        chars += len(tool_call.get("name", "")) + len(str(tool_call.get("args", "")))
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def split_turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """
+    Groups the history into turns. A turn starts at a HumanMessage and holds
+    every AI / tool message that followed it, so tool calls and their results
+    always stay together.
+    """
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _shrink_tool_message(message: ToolMessage) -> ToolMessage:
+    text = content_text(message.content)
+    if len(text) <= TOOL_MESSAGE_MAX_CHARS:
+        return message
+    placeholder = f"[tool result of {len(text)} chars omitted from earlier turn]"
+    return message.model_copy(update={"content": placeholder})
+
+
+def build_prompt(system_prompt: str, messages: list[BaseMessage], max_tokens: int = None) -> list[BaseMessage]:
+    """
+    Builds the message list sent to the model.
+
+    The typed history is passed through as-is and trimmed to the token budget:
+    large ToolMessage bodies from earlier turns are elided first, then the
+    oldest turns are dropped. The latest turn is always kept.
+    A conversation summary kept in the history (SystemMessage, see
+    summarizer.py) is folded into the system prompt.
+    """
+    budget = max_tokens or PROMPT_TOKEN_BUDGET
+    summaries = [content_text(m.content) for m in messages if isinstance(m, SystemMessage)]
+    if summaries:
+        system_prompt += "\n\nSummary of the earlier conversation:\n" + "\n".join(summaries)
+        messages = [m for m in messages if not isinstance(m, SystemMessage)]
+    system = SystemMessage(content=system_prompt)
+    turns = split_turns(messages)
+
+    def turn_tokens(turn):
+        return sum(estimate_tokens(m) for m in turn)
+
+    used = estimate_tokens(system)
+    sizes = [turn_tokens(turn) for turn in turns]
+
+    if turns and used + sum(sizes) > budget:
+        turns = [
+            [_shrink_tool_message(m) if isinstance(m, ToolMessage) else m for m in turn]
+            for turn in turns[:-1]
+        ] + [turns[-1]]
+        sizes = [turn_tokens(turn) for turn in turns]
+
+    # Drop the oldest turns until the rest fits
+    remaining = sum(sizes)
+    dropped = 0
+    while dropped < len(turns) - 1 and used + remaining > budget:
+        remaining -= sizes[dropped]
+        dropped += 1
+    turns = turns[dropped:]
+
+    if dropped:
+        logger.info(f"Prompt trimmed: dropped {dropped} oldest turns")
+
+    return [system] + [m for turn in turns for m in turn]
@@ -0,0 +1,261 @@
+import os
+import copy
+import json
+import queue
+import random
+import logging
+import threading
+import logging.handlers
+
+from datetime import datetime, timezone
+
+from tracing import current_trace_id
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Console / file writes of the logging.yaml handlers happen on a background thread (LOG_QUEUE=0 writes inline)
+LOG_QUEUE = os.getenv("LOG_QUEUE", "1") == "1"
+
+# Opt-in: one JSON object per line instead of the logging.yaml text formats (LOG_JSON=1, queued logging only)
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+
+# Share of INFO / DEBUG records kept per logger, like "agent=0.1,uvicorn.access=0.05"
+# (a logger's children inherit its rate; warnings and errors are always kept; queued logging only)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+# Records waiting for the writer thread; when it falls this far behind, new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# The writer thread wakes this often and writes everything queued (waking per record costs the loop GIL switches)
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", "0.05"))
+
+
+def parse_rates(spec: str) -> dict[str, float]:
+    """Parses per-logger sample rates like "agent=0.1,uvicorn.access=0.05"."""
+    rates = {}
+    for item in (spec or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time (UTC), level, logger, message, trace_id, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of the INFO / DEBUG records of the loggers in `rates` (a
+    logger without an entry uses its closest parent's). Records of one chat
+    request are kept or dropped together: the decision comes from their
+    trace id, falling back to a coin flip for records outside a request.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: dict[str, float] = {}
+        self.dropped = 0
+
+    def rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, parent = 1.0, name
+            while parent:
+                if parent in self.rates:
+                    rate = self.rates[parent]
+                    break
+                parent = parent.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        trace_id = getattr(record, "trace_id", None)
+        keep = int(trace_id[:8], 16) < rate * 0x100000000 if trace_id else random.random() < rate
+        if not keep:
+            self.dropped += 1
+        return keep
+
+
+def stamp_trace_id(record: logging.LogRecord) -> bool:
+    """Handler filter: copies the request's trace id onto the record while its context is still current."""
+    record.trace_id = current_trace_id()
+    return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the event loop: past `max_queue` waiting
+    records, new ones are dropped (counted) instead of waiting for the writer.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_queue: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_queue = max_queue
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the args now (they may change later) but keep the exception
+        # apart, so the target handlers' formatters still lay it out
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class BatchingQueueListener:
+    """
+    Writes the records of a queue to `handlers` from a thread of its own,
+    which wakes every `interval` seconds and writes out everything queued
+    rather than waking up for each record. On stop it writes what is left.
+
+    Works like logging.handlers.QueueListener (respecting handler levels)
+    but owns its thread, so it doesn't depend on QueueListener internals.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, *handlers, interval: float = LOG_FLUSH_SECONDS):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._writer: threading.Thread = None
+
+    def start(self):
+        if self._writer is None:
+            self._stopping.clear()
+            self._writer = threading.Thread(target=self._monitor, name="log-writer", daemon=True)
+            self._writer.start()
+
+    def stop(self):
+        if self._writer is not None:
+            self._stopping.set()
+            self._writer.join()
+            self._writer = None
+
+    def _monitor(self):
+        while not self._stopping.wait(self.interval):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.handle(record)
+
+    def handle(self, record: logging.LogRecord):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class QueueLogging:
+    """
+    Moves the handlers uvicorn's dictConfig attached (logging.yaml) behind a
+    NonBlockingQueueHandler: the event loop only formats the message and
+    enqueues it, a BatchingQueueListener thread does the console and file writes.
+
+    Loggers sharing the same handlers share one queue and one writer thread
+    (with logging.yaml that is a single thread). `install` must run after
+    logging is configured, i.e. in the app lifespan rather than at import.
+    """
+
+    def __init__(self, json_output: bool = LOG_JSON, rates: dict[str, float] = None,
+                 max_queue: int = LOG_QUEUE_SIZE):
+        self.json_output = json_output
+        self.sampler = SamplingFilter(parse_rates(LOG_SAMPLE_RATES) if rates is None else rates)
+        self.max_queue = max(1, max_queue)
+        self._handlers: list[NonBlockingQueueHandler] = []
+        self._listeners: list[BatchingQueueListener] = []
+        # logger -> handlers it had before install
+        self._original: dict[logging.Logger, list[logging.Handler]] = {}
+
+    @property
+    def installed(self) -> bool:
+        return bool(self._original)
+
+    def install(self):
+        if self.installed:
+            return
+        loggers = [logging.getLogger()] + [
+            item for item in logging.Logger.manager.loggerDict.values() if isinstance(item, logging.Logger)]
+        by_targets: dict[tuple, NonBlockingQueueHandler] = {}
+        for item in loggers:
+            # Libraries' NullHandlers write nothing, they need no thread
+            targets = tuple(h for h in item.handlers
+                            if not isinstance(h, (logging.handlers.QueueHandler, logging.NullHandler)))
+            if not targets:
+                continue
+            handler = by_targets.get(targets)
+            if handler is None:
+                handler = by_targets[targets] = self._start(targets)
+            self._original[item] = list(item.handlers)
+            item.handlers = [handler]
+        logger.info(f"Queued logging: {len(self._listeners)} writer thread(s) for {len(self._original)} logger(s)"
+                    f"{', JSON' if self.json_output else ''}"
+                    f"{', sampled ' + str(self.sampler.rates) if self.sampler.rates else ''}")
+
+    def _start(self, targets: tuple) -> NonBlockingQueueHandler:
+        if self.json_output:
+            for target in targets:
+                target.setFormatter(JsonFormatter())
+        handler = NonBlockingQueueHandler(queue.SimpleQueue(), self.max_queue)
+        # Records no target would write are not even queued
+        handler.setLevel(min(target.level for target in targets))
+        handler.addFilter(stamp_trace_id)
+        if self.sampler.rates:
+            handler.addFilter(self.sampler)
+        listener = BatchingQueueListener(handler.queue, *targets)
+        listener.start()
+        self._handlers.append(handler)
+        self._listeners.append(listener)
+        return handler
+
+    def stop(self):
+        """Writes out what is queued and gives the loggers their handlers back."""
+        for listener in self._listeners:
+            listener.stop()
+        for item, handlers in self._original.items():
+            item.handlers = handlers
+        self._handlers, self._listeners, self._original = [], [], {}
+
+    def stats(self) -> dict:
+        return {
+            "queued": sum(handler.queue.qsize() for handler in self._handlers),
+            "dropped": sum(handler.dropped for handler in self._handlers),
+            "sampled_out": self.sampler.dropped,
+        }
@@ -0,0 +1,212 @@
+import os
+import time
+import asyncio
+import logging
+
+from typing import Callable, NamedTuple, Optional
+
+import aiosqlite
+
+from db import BUSY_TIMEOUT_MS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Upstream quotas per model as "requests per minute/tokens per minute", e.g.
+# "pro=5/250000,fast=10/250000,unlimited=15/250000,flash=15/1000000".
+# Models not listed (and everything when unset) are not limited.
+MODEL_QUOTAS = os.getenv("MODEL_QUOTAS", "")
+
+# Bucket state shared by every worker on the host
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "rate_limits.sqlite")
+
+# Output tokens reserved on top of the prompt estimate (settled against real usage later)
+QUOTA_OUTPUT_TOKENS = int(os.getenv("QUOTA_OUTPUT_TOKENS", "500"))
+
+# Longest a call waits for quota before it gives up (and the router falls back)
+QUOTA_MAX_WAIT_SECONDS = float(os.getenv("QUOTA_MAX_WAIT_SECONDS", "20"))
+
+
+class Quota(NamedTuple):
+    rpm: int
+    tpm: int
+
+
+def parse_quotas(spec: str) -> dict[str, Quota]:
+    """Parses "pro=5/250000,fast=10/250000" into {model: Quota(rpm, tpm)}."""
+    quotas = {}
+    for item in (spec or "").split(","):
+        name, _, limits = item.partition("=")
+        rpm, _, tpm = limits.partition("/")
+        if name.strip() and rpm.strip() and tpm.strip():
+            quotas[name.strip()] = Quota(int(rpm), int(tpm))
+    return quotas
+
+
+class RateLimited(Exception):
+    """No quota for this model within the allowed wait."""
+
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f"Quota for {model_name} exhausted, retry after {retry_after:.1f}s")
+        self.model_name = model_name
+        self.retry_after = retry_after
+
+
+class Reservation(NamedTuple):
+    model_name: str
+    tokens: int
+
+
+class TokenBucketLimiter:
+    """
+    Client-side token buckets for the upstream quotas, one request bucket
+    and one token bucket per model. Each bucket holds a minute of quota and
+    refills continuously, so a burst is spread out instead of turning into
+    a storm of upstream 429s.
+
+    `reserve` takes one request and the estimated tokens of a call, waiting
+    (up to `max_wait`) until both buckets have them; `settle` corrects the
+    token bucket by the difference to the usage the model reported. The
+    buckets live in SQLite and every update is one BEGIN IMMEDIATE
+    transaction, so all workers on the host share the same quota.
+
+    `clock` and `sleep` are injectable so tests can run on simulated time.
+    """
+
+    def __init__(self, quotas: dict[str, Quota] = None, db_path: str = RATE_LIMIT_DB,
+                 max_wait: float = QUOTA_MAX_WAIT_SECONDS, clock: Callable[[], float] = time.time,
+                 sleep: Callable = asyncio.sleep):
+        self.quotas = parse_quotas(MODEL_QUOTAS) if quotas is None else quotas
+        self.db_path = db_path
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._conn: aiosqlite.Connection = None
+        self._lock: asyncio.Lock = None
+        self.counters = {"reservations": 0, "waits": 0, "wait_seconds": 0.0, "rejected": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    async def open(self):
+        if not self.quotas:
+            return
+        # Autocommit mode, transactions are explicit
+        self._conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+        self._lock = asyncio.Lock()
+        await self._conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA busy_timeout={BUSY_TIMEOUT_MS};
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                level REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (model, kind)
+            );
+            """
+        )
+        logger.info(f"Rate limiter opened at {self.db_path} for {', '.join(self.quotas)}")
+
+    async def close(self):
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+
+    async def _levels(self, model_name: str, now: float) -> dict[str, float]:
+        """Current level of both buckets, refilled up to `now` (inside a transaction)."""
+        quota = self.quotas[model_name]
+        capacity = {"requests": quota.rpm, "tokens": quota.tpm}
+        levels = dict(capacity)
+        query = await self._conn.execute(
+            "SELECT kind, level, updated_at FROM rate_buckets WHERE model = ?", (model_name,)
+        )
+        for kind, level, updated_at in await query.fetchall():
+            refill = max(0.0, now - updated_at) * capacity[kind] / 60
+            levels[kind] = min(capacity[kind], level + refill)
+        return levels
+
+    async def _store(self, model_name: str, levels: dict[str, float], now: float):
+        await self._conn.executemany(
+            "INSERT OR REPLACE INTO rate_buckets (model, kind, level, updated_at) VALUES (?, ?, ?, ?)",
+            [(model_name, kind, level, now) for kind, level in levels.items()],
+        )
+
+    async def _try_reserve(self, model_name: str, tokens: int) -> float:
+        """Takes the quota if available and returns 0, else returns the seconds to wait."""
+        quota = self.quotas[model_name]
+        async with self._lock:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.clock()
+                levels = await self._levels(model_name, now)
+                if levels["requests"] >= 1 and levels["tokens"] >= tokens:
+                    levels["requests"] -= 1
+                    levels["tokens"] -= tokens
+                    await self._store(model_name, levels, now)
+                    await self._conn.execute("COMMIT")
+                    return 0.0
+                await self._conn.execute("ROLLBACK")
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+        return max((1 - levels["requests"]) * 60 / quota.rpm,
+                   (tokens - levels["tokens"]) * 60 / quota.tpm, 0.001)
+
+    async def reserve(self, model_name: str, estimated_tokens: int) -> Optional[Reservation]:
+        """
+        Reserves one request and `estimated_tokens` for a call to `model_name`,
+        waiting for the buckets to refill if needed. Returns None when the model
+        is not limited; raises RateLimited when the wait would exceed `max_wait`.
+        """
+        if not self.enabled or model_name not in self.quotas:
+            return None
+
+        # A prompt bigger than the whole bucket could never fit, cap it at the bucket size
+        tokens = min(estimated_tokens, self.quotas[model_name].tpm)
+        waited = 0.0
+        while True:
+            wait = await self._try_reserve(model_name, tokens)
+            if not wait:
+                self.counters["reservations"] += 1
+                if waited:
+                    self.counters["waits"] += 1
+                    self.counters["wait_seconds"] += waited
+                return Reservation(model_name, tokens)
+            if waited + wait > self.max_wait:
+                self.counters["rejected"] += 1
+                raise RateLimited(model_name, wait)
+            await self.sleep(wait)
+            waited += wait
+
+    async def settle(self, reservation: Optional[Reservation], actual_tokens: Optional[int]):
+        """Returns unused tokens to the bucket (or takes the overrun) once real usage is known."""
+        if reservation is None or actual_tokens is None or not self.enabled:
+            return
+        difference = reservation.tokens - actual_tokens
+        if not difference:
+            return
+        async with self._lock:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self.clock()
+                levels = await self._levels(reservation.model_name, now)
+                levels["tokens"] = min(self.quotas[reservation.model_name].tpm, levels["tokens"] + difference)
+                await self._store(reservation.model_name, levels, now)
+                await self._conn.execute("COMMIT")
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+
+    async def release(self, reservation: Optional[Reservation]):
+        """
+        Gives back all reserved tokens of a call that produced no answer (a
+        hedge that lost, a tier that failed before its first token). The
+        request itself stays counted.
+        """
+        await self.settle(reservation, 0)
+
+    def stats(self) -> dict:
+        return {**self.counters, "wait_seconds": round(self.counters["wait_seconds"], 3)}
@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import time
+import logging
+
+import xxhash
+import aiosqlite
+from cachetools import TTLCache
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+# Optional on-disk tier (e.g. "response_cache.sqlite"); memory only when unset
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB")
+
+# Models whose answers are not reproducible (pro runs at temperature 1)
+UNCACHEABLE_MODELS = {"pro"}
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Case- and whitespace-insensitive form of a message used for the cache key."""
+    return _whitespace.sub(" ", text).strip().lower()
+
+
+def cache_key(model_name: str, history: list[str], user_input: str) -> str:
+    """Key = model name + xxh3 hash of the normalized history and new input."""
+    digest = xxhash.xxh3_128()
+    for text in history + [user_input]:
+        digest.update(normalize(text).encode("utf-8"))
+        digest.update(b"\x1e")
+    return f"{model_name}:{digest.hexdigest()}"
+
+
+class ResponseCache:
+    """
+    Cache of complete model answers, stored as the list of streamed chunks so
+    a hit can be replayed as the same SSE stream as a live answer.
+    Memory tier: LRU with TTL (cachetools TTLCache). Optional SQLite disk tier
+    shared by all workers on the host.
+    """
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE_ENABLED, ttl: int = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, db_path: str = RESPONSE_CACHE_DB):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._conn: aiosqlite.Connection = None
+        self.hits = 0
+        self.misses = 0
+
+    async def open(self):
+        if not (self.enabled and self.db_path):
+            return
+        self._conn = await aiosqlite.connect(self.db_path)
+        await self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                chunks TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+        await self._conn.commit()
+        logger.info(f"Response cache disk tier opened at {self.db_path}")
+
+    async def close(self):
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+
+    def enabled_for(self, model_name: str) -> bool:
+        return self.enabled and model_name not in UNCACHEABLE_MODELS
+
+    async def get(self, key: str):
+        """Returns the cached chunk list, or None on a miss."""
+        chunks = self._memory.get(key)
+        if chunks is None and self._conn:
+            cursor = await self._conn.execute(
+                "SELECT chunks FROM response_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl),
+            )
+            row = await cursor.fetchone()
+            if row:
+                chunks = json.loads(row[0])
+                self._memory[key] = chunks
+
+        if chunks is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return chunks
+
+    async def put(self, key: str, chunks: list[str]):
+        self._memory[key] = chunks
+        if self._conn:
+            await self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, chunks, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(chunks), time.time()),
+            )
+            await self._conn.execute("DELETE FROM response_cache WHERE created_at <= ?", (time.time() - self.ttl,))
+            await self._conn.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._memory)}
@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+import logging
+
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from sse import encode_event
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Frames kept per run for replay; a client further behind than this cannot resume
+STREAM_BUFFER_FRAMES = int(os.getenv("STREAM_BUFFER_FRAMES", "2000"))
+
+# How long a finished run stays available for a late reconnect
+STREAM_BUFFER_TTL_SECONDS = float(os.getenv("STREAM_BUFFER_TTL_SECONDS", "120"))
+
+# Runs kept per worker (finished runs are evicted first, oldest first), see run_manager.py
+STREAM_BUFFER_MAX_RUNS = int(os.getenv("STREAM_BUFFER_MAX_RUNS", "1000"))
+
+
+class RunBuffer:
+    """
+    The SSE frames of one chat run, numbered 1, 2, 3... and prefixed with
+    their `id:` line, in a bounded ring buffer.
+
+    The generation writes with `append` and `finish`; any number of
+    readers follow it with `subscribe(last_event_id)`, which replays what
+    they missed and then waits for new frames until the run is finished.
+    """
+
+    def __init__(self, run_id: str, thread_id: str, max_frames: int = STREAM_BUFFER_FRAMES):
+        self.run_id = run_id
+        self.thread_id = thread_id
+        self.frames = deque(maxlen=max_frames)
+        self.last_id = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def first_id(self) -> int:
+        """Id of the oldest frame still buffered."""
+        return self.last_id - len(self.frames) + 1
+
+    def append(self, frame: bytes) -> int:
+        self.last_id += 1
+        self.frames.append(b"id: %d\n" % self.last_id + frame)
+        self._wake()
+        return self.last_id
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._wake()
+
+    def _wake(self):
+        # Readers wait on the current event, a fresh one is armed for the next frame
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def can_resume(self, last_event_id: int) -> bool:
+        """False if frames after `last_event_id` already fell out of the buffer."""
+        return 0 <= last_event_id <= self.last_id and last_event_id + 1 >= self.first_id
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncIterator[bytes]:
+        """Frames after `last_event_id`, live until the run is finished."""
+        while True:
+            while last_event_id < self.last_id:
+                if last_event_id + 1 < self.first_id:
+                    # This reader fell too far behind, the frames it needs are gone
+                    logger.warning(f"Stream reader of run {self.run_id} fell behind the buffer")
+                    yield encode_event({'error': 'Stream interrupted, reload the chat'})
+                    return
+                last_event_id += 1
+                yield self.frames[last_event_id - self.first_id]
+            if self.done:
+                return
+            await self._changed.wait()
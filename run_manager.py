@@ -0,0 +1,283 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+from sse import encode_event
+from resumable import RunBuffer, STREAM_BUFFER_FRAMES, STREAM_BUFFER_TTL_SECONDS, STREAM_BUFFER_MAX_RUNS
+from run_store import RunStore, RemoteRun, RUNS_DB, RUNS_SYNC_SECONDS, WORKER_TIMEOUT_SECONDS, VIEWED_EVERY_SECONDS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Runs executing at once across all workers (counted in RUNS_DB), queued ones included (above it
+# /chat/ answers 429). Keep it above ADMISSION_MAX_ACTIVE + workers x ADMISSION_QUEUE_SIZE so
+# admission does the queueing.
+RUNS_MAX_ACTIVE = int(os.getenv("RUNS_MAX_ACTIVE", "128"))
+
+# A run nobody has watched for this long is cancelled to save upstream tokens
+# (longer than a client needs to reconnect; 0 lets abandoned runs finish)
+RUN_ABANDON_SECONDS = float(os.getenv("RUN_ABANDON_SECONDS", "30"))
+
+
+class RunLimitReached(Exception):
+    """Too many runs active."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Run limit reached, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RunManager:
+    """
+    Chat runs as tracked background tasks, independent of HTTP connections.
+
+    `start` launches a generation into a new RunBuffer, up to `max_active`
+    runs at a time. HTTP streams are viewers: `view` follows a run's buffer,
+    so a run can have zero, one or several viewers and survives all of them
+    disconnecting. A run left without viewers for `abandon_after` seconds is
+    cancelled, as is any run passed to `cancel`; viewers then get a
+    {'cancelled': True} frame.
+
+    Once `open` has run, the runs are shared with the other workers through
+    a RunStore (`db_path`): `max_active` counts the runs of every worker,
+    `lookup` finds a run another worker executes and `view` follows it from
+    the store, and `request_cancel` flags it for its worker, which checks
+    the flags (and whether someone watches its runs from elsewhere) every
+    `sync_interval`. Without `open` (or without a `db_path`) runs are only
+    known to the worker that started them.
+    """
+
+    def __init__(self, max_active: int = RUNS_MAX_ACTIVE, abandon_after: float = RUN_ABANDON_SECONDS,
+                 max_frames: int = STREAM_BUFFER_FRAMES, ttl: float = STREAM_BUFFER_TTL_SECONDS,
+                 max_runs: int = STREAM_BUFFER_MAX_RUNS, db_path: Optional[str] = RUNS_DB,
+                 sync_interval: float = RUNS_SYNC_SECONDS):
+        self.max_active = max(1, max_active)
+        self.abandon_after = abandon_after
+        self.max_frames = max_frames
+        self.ttl = ttl
+        self.max_runs = max(1, max_runs)
+        self.db_path = db_path
+        self.sync_interval = sync_interval
+        self._runs: OrderedDict[str, RunBuffer] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._viewers: dict[str, int] = {}
+        self._abandon_timers: dict[str, asyncio.TimerHandle] = {}
+        # Last time a viewer on another worker polled one of our runs
+        self._viewed_elsewhere: dict[str, float] = {}
+        self.store: RunStore = None
+        self._sync_task: asyncio.Task = None
+        self.counters = {"started": 0, "rejected": 0, "cancelled": 0, "abandoned": 0}
+
+    # ---------------------------------
+    # Shared runs
+    # ---------------------------------
+
+    async def open(self):
+        if not self.db_path:
+            return
+        self.store = RunStore(self.db_path, f"{os.getpid()}-{uuid.uuid4().hex[:8]}", self.max_frames, self.ttl,
+                              self.sync_interval)
+        await self.store.open()
+        self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def close(self):
+        """Writes out the last frames of this worker's runs (after `drain`) and closes the store."""
+        if self._sync_task:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        if self.store:
+            await self.store.sync(self._runs)
+            await self.store.close()
+            self.store = None
+
+    async def _sync_loop(self):
+        beat_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                for flags in await self.store.sync(self._runs):
+                    if flags.viewed_at:
+                        self._viewed_elsewhere[flags.run_id] = flags.viewed_at
+                    if flags.cancel_requested:
+                        self.cancel(flags.run_id)
+                if time.monotonic() - beat_at > WORKER_TIMEOUT_SECONDS / 3:
+                    beat_at = time.monotonic()
+                    await self.store.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error syncing chat runs: {type(e).__name__}")
+
+    # ---------------------------------
+    # Runs
+    # ---------------------------------
+
+    async def start(self, thread_id: str, generate: Callable[[RunBuffer], Awaitable[None]]) -> RunBuffer:
+        """Starts `generate(run)` as a tracked task; raises RunLimitReached when full."""
+        run = RunBuffer(uuid.uuid4().hex, thread_id, self.max_frames)
+        if len(self._tasks) >= self.max_active or (self.store and not await self.store.register(run, self.max_active)):
+            self.counters["rejected"] += 1
+            raise RunLimitReached(retry_after=5)
+
+        self._expire()
+        self._runs[run.run_id] = run
+        self._viewers[run.run_id] = 0
+        task = asyncio.ensure_future(self._execute(run, generate))
+        self._tasks[run.run_id] = task
+        task.add_done_callback(lambda _: self._finished(run))
+        self.counters["started"] += 1
+        # Nobody is watching until the first viewer attaches
+        self._arm_abandon(run)
+        return run
+
+    async def _execute(self, run: RunBuffer, generate):
+        try:
+            await generate(run)
+        except asyncio.CancelledError:
+            run.append(encode_event({'cancelled': True}))
+            raise
+
+    def _finished(self, run: RunBuffer):
+        # Also runs for a task cancelled before it started, whose body never ran
+        self._tasks.pop(run.run_id, None)
+        self._viewed_elsewhere.pop(run.run_id, None)
+        self._disarm_abandon(run)
+        run.finish()
+
+    def get(self, run_id: str) -> Optional[RunBuffer]:
+        """A run of this worker, else None."""
+        self._expire()
+        return self._runs.get(run_id)
+
+    async def lookup(self, run_id: str) -> Union[RunBuffer, RemoteRun, None]:
+        """A run of this worker, else one another worker runs (or ran), else None."""
+        run = self.get(run_id)
+        if run is None and self.store:
+            run = await self.store.lookup(run_id)
+        return run
+
+    def task(self, run: RunBuffer) -> Optional[asyncio.Task]:
+        """The task of a run still executing, else None."""
+        return self._tasks.get(run.run_id)
+
+    def cancel(self, run_id: str, reason: str = "cancelled") -> bool:
+        """Cancels a running run; False if it is unknown or already finished."""
+        task = self._tasks.get(run_id)
+        if task is None or task.done():
+            return False
+        logger.info(f"Run {run_id} {reason}")
+        self.counters[reason] += 1
+        task.cancel()
+        return True
+
+    async def request_cancel(self, run_id: str) -> Optional[bool]:
+        """
+        Cancels a run wherever it runs: at once on this worker, else by
+        flagging it for its worker (within `sync_interval`). False if it
+        already finished, None if it is unknown.
+        """
+        if self.get(run_id) is not None:
+            return self.cancel(run_id)
+        if self.store and await self.store.lookup(run_id) is not None:
+            return await self.store.request_cancel(run_id)
+        return None
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: float):
+        """Shutdown: lets the runs finish for `timeout` seconds, then cancels the rest."""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks.values()), timeout=timeout)
+        cancelled = list(self._tasks.values())
+        for task in cancelled:
+            task.cancel()
+        # Let the cancelled runs unwind (and start their partial saves)
+        if cancelled:
+            await asyncio.wait(cancelled, timeout=1.0)
+
+    # ---------------------------------
+    # Viewers
+    # ---------------------------------
+
+    async def view(self, run: Union[RunBuffer, RemoteRun], last_event_id: int = 0) -> AsyncIterator[bytes]:
+        """One viewer of a run: its frames after `last_event_id`, live until the run ends."""
+        if isinstance(run, RemoteRun):
+            async for frame in self.store.subscribe(run.run_id, last_event_id):
+                yield frame
+            return
+
+        self._viewers[run.run_id] = self._viewers.get(run.run_id, 0) + 1
+        self._disarm_abandon(run)
+        try:
+            async for frame in run.subscribe(last_event_id):
+                yield frame
+        finally:
+            self._viewers[run.run_id] -= 1
+            if not self._viewers[run.run_id]:
+                if not run.done:
+                    self._arm_abandon(run)
+                elif run.run_id not in self._runs:
+                    del self._viewers[run.run_id]
+
+    def viewers(self, run: RunBuffer) -> int:
+        return self._viewers.get(run.run_id, 0)
+
+    def _arm_abandon(self, run: RunBuffer):
+        if self.abandon_after > 0 and run.run_id not in self._abandon_timers:
+            loop = asyncio.get_running_loop()
+            self._abandon_timers[run.run_id] = loop.call_later(self.abandon_after, self._abandon, run)
+
+    def _disarm_abandon(self, run: RunBuffer):
+        timer = self._abandon_timers.pop(run.run_id, None)
+        if timer:
+            timer.cancel()
+
+    def _abandon(self, run: RunBuffer):
+        self._abandon_timers.pop(run.run_id, None)
+        if self.viewers(run):
+            return
+        if time.time() - self._viewed_elsewhere.get(run.run_id, 0) < 3 * VIEWED_EVERY_SECONDS:
+            # Watched from another worker (its viewer marks the run every second), check again later
+            self._arm_abandon(run)
+            return
+        self.cancel(run.run_id, reason="abandoned")
+
+    # ---------------------------------
+    # Finished runs
+    # ---------------------------------
+
+    def _expire(self):
+        """Drops finished runs older than `ttl`, and the oldest finished ones over `max_runs`."""
+        now = time.monotonic()
+        for run_id, run in list(self._runs.items()):
+            if run.done and now - run.finished_at > self.ttl:
+                self._forget(run_id)
+        for run_id, run in list(self._runs.items()):
+            if len(self._runs) < self.max_runs:
+                break
+            if run.done:
+                self._forget(run_id)
+
+    def _forget(self, run_id: str):
+        del self._runs[run_id]
+        if not self._viewers.get(run_id):
+            self._viewers.pop(run_id, None)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "active": self.active,
+            "buffered": len(self._runs),
+            "viewers": sum(self._viewers.values()),
+        }
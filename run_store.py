@@ -0,0 +1,290 @@
+import os
+import time
+import asyncio
+import logging
+
+from typing import AsyncIterator, Iterable, NamedTuple, Optional
+
+import aiosqlite
+
+from db import BUSY_TIMEOUT_MS
+from sse import encode_event
+from resumable import RunBuffer, STREAM_BUFFER_FRAMES, STREAM_BUFFER_TTL_SECONDS
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Runs, their cancel flags and their frames, shared by every worker on the host
+# (empty: runs are only known to the worker that started them, see run_manager.py)
+RUNS_DB = os.getenv("RUNS_DB", "runs.sqlite")
+
+# How often a worker writes its runs' new frames and reads their cancel flags, and how often a
+# viewer on another worker polls for frames (the lag of a stream resumed on another worker)
+RUNS_SYNC_SECONDS = float(os.getenv("RUNS_SYNC_SECONDS", "0.1"))
+
+# A worker that stopped refreshing its heartbeat this long ago is presumed dead, its runs are ended
+WORKER_TIMEOUT_SECONDS = 15
+
+# A viewer on another worker marks the run as watched at most this often
+VIEWED_EVERY_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run_workers (
+    worker TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    viewed_at REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_worker ON runs (worker, finished_at);
+CREATE TABLE IF NOT EXISTS run_frames (
+    run_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    frame BLOB NOT NULL,
+    PRIMARY KEY (run_id, id)
+) WITHOUT ROWID;
+"""
+
+
+class RemoteRun(NamedTuple):
+    """A run executing (or finished) on another worker, as last written to the store."""
+    run_id: str
+    thread_id: str
+    first_id: int
+    last_id: int
+    done: bool
+
+    def can_resume(self, last_event_id: int) -> bool:
+        """False if frames after `last_event_id` already fell out of the ring."""
+        # The owner may have sent frames it hasn't written yet, so last_event_id can be ahead of last_id
+        return last_event_id >= 0 and last_event_id + 1 >= self.first_id
+
+
+class RunFlags(NamedTuple):
+    run_id: str
+    cancel_requested: bool
+    viewed_at: Optional[float]
+
+
+class RunStore:
+    """
+    The runs of every worker in one SQLite file, so a stream can be resumed
+    and a run cancelled from any worker.
+
+    The worker running a run registers it (`register`, which also enforces
+    the deployment-wide cap on running runs) and every `RUNS_SYNC_SECONDS`
+    writes its new frames in one transaction (`sync`), keeping the last
+    `max_frames` per run, like RunBuffer. The same pass reads back the
+    cancel flags and the "viewed" marks other workers set. Another worker
+    replays and follows a run with `subscribe` by polling the frames table.
+
+    Finished runs stay for `ttl` seconds for late reconnects, then their
+    frames are deleted; the runs of a worker that stopped heartbeating are
+    ended with an error frame.
+    """
+
+    def __init__(self, db_path: str = RUNS_DB, worker: str = None, max_frames: int = STREAM_BUFFER_FRAMES,
+                 ttl: float = STREAM_BUFFER_TTL_SECONDS, poll_interval: float = RUNS_SYNC_SECONDS):
+        self.db_path = db_path
+        self.worker = worker or f"{os.getpid()}"
+        self.max_frames = max_frames
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._conn: aiosqlite.Connection = None
+        self._lock: asyncio.Lock = None
+        # Frames of this worker's runs written so far
+        self._written: dict[str, int] = {}
+
+    async def open(self):
+        # Autocommit mode, transactions are explicit
+        self._conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+        self._lock = asyncio.Lock()
+        await self._conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA busy_timeout={BUSY_TIMEOUT_MS};
+            {SCHEMA}
+            """
+        )
+        await self.heartbeat()
+        logger.info(f"Chat runs shared through {self.db_path}")
+
+    async def close(self):
+        if self._conn:
+            async with self._lock:
+                await self._conn.execute("DELETE FROM run_workers WHERE worker = ?", (self.worker,))
+            await self._conn.close()
+            self._conn = None
+
+    async def _transaction(self, statements: Iterable[tuple[str, list]]):
+        """Runs (sql, rows) pairs with executemany in one BEGIN IMMEDIATE transaction."""
+        async with self._lock:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    if rows:
+                        await self._conn.executemany(sql, rows)
+                await self._conn.execute("COMMIT")
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+
+    # ---------------------------------
+    # The worker running a run
+    # ---------------------------------
+
+    async def register(self, run: RunBuffer, max_active: int) -> bool:
+        """Records a new run of this worker; False when `max_active` runs already run on the host."""
+        now = time.time()
+        async with self._lock:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                query = await self._conn.execute(
+                    """
+                    SELECT COUNT(*) FROM runs WHERE finished_at IS NULL
+                    AND worker IN (SELECT worker FROM run_workers WHERE heartbeat >= ?)
+                    """,
+                    (now - WORKER_TIMEOUT_SECONDS,),
+                )
+                if (await query.fetchone())[0] >= max_active:
+                    await self._conn.execute("ROLLBACK")
+                    return False
+                await self._conn.execute(
+                    "INSERT INTO runs (run_id, thread_id, worker, started_at) VALUES (?, ?, ?, ?)",
+                    (run.run_id, run.thread_id, self.worker, now),
+                )
+                await self._conn.execute("COMMIT")
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+        self._written[run.run_id] = 0
+        return True
+
+    async def sync(self, runs: dict[str, RunBuffer]) -> list[RunFlags]:
+        """
+        Writes the new frames of this worker's `runs` (and the end of the
+        finished ones), trims each run to its last `max_frames`, and returns
+        the flags of the runs still running.
+        """
+        frames, progress, trims, finished = [], [], [], []
+        now = time.time()
+        for run_id, written in list(self._written.items()):
+            run = runs.get(run_id)
+            if run is None:
+                # Evicted locally before its end was written
+                finished.append((now, run_id))
+                del self._written[run_id]
+                continue
+            # Frames that already fell out of the local ring are skipped, the ring here keeps as many
+            for event_id in range(max(written + 1, run.first_id), run.last_id + 1):
+                frames.append((run_id, event_id, run.frames[event_id - run.first_id]))
+            if run.last_id > written:
+                progress.append((run.last_id, run_id))
+                if run.last_id > self.max_frames:
+                    trims.append((run_id, run.last_id - self.max_frames))
+                self._written[run_id] = run.last_id
+            if run.done:
+                finished.append((now, run_id))
+                del self._written[run_id]
+
+        if frames or finished:
+            await self._transaction([
+                ("INSERT OR IGNORE INTO run_frames (run_id, id, frame) VALUES (?, ?, ?)", frames),
+                ("UPDATE runs SET last_id = ? WHERE run_id = ?", progress),
+                ("DELETE FROM run_frames WHERE run_id = ? AND id <= ?", trims),
+                ("UPDATE runs SET finished_at = ? WHERE run_id = ?", finished),
+            ])
+
+        query = await self._conn.execute(
+            "SELECT run_id, cancel_requested, viewed_at FROM runs WHERE worker = ? AND finished_at IS NULL",
+            (self.worker,),
+        )
+        return [RunFlags(run_id, bool(cancel), viewed_at) for run_id, cancel, viewed_at in await query.fetchall()]
+
+    async def heartbeat(self):
+        """Marks this worker alive, ends the runs of dead workers and deletes expired runs."""
+        now = time.time()
+        query = await self._conn.execute(
+            """
+            SELECT run_id, last_id FROM runs WHERE finished_at IS NULL
+            AND worker NOT IN (SELECT worker FROM run_workers WHERE heartbeat >= ?) AND worker != ?
+            """,
+            (now - WORKER_TIMEOUT_SECONDS, self.worker),
+        )
+        orphans = await query.fetchall()
+        if orphans:
+            logger.warning(f"Ending {len(orphans)} run(s) of workers that stopped")
+        error = encode_event({'error': 'Stream interrupted, reload the chat'})
+        expired = [(now - self.ttl,)]
+        await self._transaction([
+            ("INSERT OR REPLACE INTO run_workers (worker, heartbeat) VALUES (?, ?)", [(self.worker, now)]),
+            ("DELETE FROM run_workers WHERE heartbeat < ?", [(now - WORKER_TIMEOUT_SECONDS,)]),
+            ("INSERT OR IGNORE INTO run_frames (run_id, id, frame) VALUES (?, ?, ?)",
+             [(run_id, last_id + 1, b"id: %d\n" % (last_id + 1) + error) for run_id, last_id in orphans]),
+            ("UPDATE runs SET last_id = ?, finished_at = ? WHERE run_id = ?",
+             [(last_id + 1, now, run_id) for run_id, last_id in orphans]),
+            ("DELETE FROM run_frames WHERE run_id IN (SELECT run_id FROM runs WHERE finished_at < ?)", expired),
+            ("DELETE FROM runs WHERE finished_at < ?", expired),
+        ])
+
+    # ---------------------------------
+    # Any worker
+    # ---------------------------------
+
+    async def lookup(self, run_id: str) -> Optional[RemoteRun]:
+        query = await self._conn.execute(
+            """
+            SELECT thread_id, last_id, finished_at, (SELECT MIN(id) FROM run_frames WHERE run_id = runs.run_id)
+            FROM runs WHERE run_id = ?
+            """,
+            (run_id,),
+        )
+        row = await query.fetchone()
+        if row is None:
+            return None
+        thread_id, last_id, finished_at, first_id = row
+        return RemoteRun(run_id, thread_id, first_id or last_id + 1, last_id, finished_at is not None)
+
+    async def request_cancel(self, run_id: str) -> bool:
+        """Flags a running run for its worker to cancel; False if it already finished."""
+        async with self._lock:
+            cursor = await self._conn.execute(
+                "UPDATE runs SET cancel_requested = 1 WHERE run_id = ? AND finished_at IS NULL", (run_id,))
+        return cursor.rowcount > 0
+
+    async def subscribe(self, run_id: str, last_event_id: int = 0) -> AsyncIterator[bytes]:
+        """Frames of a run after `last_event_id`, polled from the store until the run is finished."""
+        viewed = 0.0
+        while True:
+            query = await self._conn.execute(
+                "SELECT id, frame FROM run_frames WHERE run_id = ? AND id > ? ORDER BY id", (run_id, last_event_id))
+            rows = await query.fetchall()
+            if rows and rows[0][0] > last_event_id + 1:
+                # This reader fell too far behind, the frames it needs are gone
+                logger.warning(f"Stream reader of run {run_id} fell behind the buffer")
+                yield encode_event({'error': 'Stream interrupted, reload the chat'})
+                return
+            for event_id, frame in rows:
+                last_event_id = event_id
+                yield frame
+
+            query = await self._conn.execute("SELECT finished_at, last_id FROM runs WHERE run_id = ?", (run_id,))
+            state = await query.fetchone()
+            if state is None or (state[0] is not None and last_event_id >= state[1]):
+                return
+
+            # Tells the run's worker someone is still watching (see RunManager._abandon)
+            now = time.time()
+            if now - viewed >= VIEWED_EVERY_SECONDS:
+                viewed = now
+                async with self._lock:
+                    await self._conn.execute("UPDATE runs SET viewed_at = ? WHERE run_id = ?", (now, run_id))
+            await asyncio.sleep(self.poll_interval)
@@ -153,9 +153,24 @@ async function loadChat(chatId) {
         // Load from backend if thread exists but no local messages
         if (chat.threadId && chat.messages.length === 0) {
             await loadChatHistoryFromBackend(chat.threadId, chatId);
-            return; // loadChatHistoryFromBackend will call loadChat again
+            return; // loadChatHistoryFromBackend renders the messages as they arrive
         }
     
+        resetChatWindow();
+    
+        chat.messages.forEach(msg => {
+            addMessage(msg.sender, msg.content, false);
+        });
+        
+        updateChatHistory();
+        closeMobileSidebar();
+    } catch (error) {
+        console.error('Error loading chat:', error);
+    }
+}
+
+// Clear the chat window back to the greeting message
+function resetChatWindow() {
     const container = chatWindow.querySelector('.max-w-3xl');
     container.innerHTML = `
         <div class="message-animation flex gap-4 mb-6">
@@ -169,16 +184,6 @@ async function loadChat(chatId) {
             </div>
         </div>
     `;
-    
-        chat.messages.forEach(msg => {
-            addMessage(msg.sender, msg.content, false);
-        });
-        
-        updateChatHistory();
-        closeMobileSidebar();
-    } catch (error) {
-        console.error('Error loading chat:', error);
-    }
 }
 
 // Update chat history sidebar
@@ -212,11 +217,8 @@ function addChatItemToHistory(chat) {
     
     chatItem.addEventListener('click', async (e) => {
         if (!e.target.closest('.delete-chat')) {
-            if (chat.threadId && chat.messages.length === 0) {
-                await loadChatHistoryFromBackend(chat.threadId, chat.id);
-            } else {
-                loadChat(chat.id);
-            }
+            // loadChat fetches the history from the backend when needed
+            loadChat(chat.id);
         }
     });
     
@@ -338,26 +340,35 @@ async function loadChatHistoryFromBackend(threadId, chatId) {
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
         const chat = chats[chatId];
+        let pending = '';
         
         if (chat) {
             chat.messages = [];
+            resetChatWindow();
             
             while (true) {
                 const {done, value} = await reader.read();
                 if (done) break;
                 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
+                // Frames can be split across reads, keep the incomplete tail
+                pending += decoder.decode(value, {stream: true});
+                const lines = pending.split('\n');
+                pending = lines.pop();
                 
                 for (const line of lines) {
                     if (line.startsWith('data: ')) {
                         const data = JSON.parse(line.slice(6));
                         if (data.done) {
-                            loadChat(chatId);
+                            updateChatHistory();
+                            closeMobileSidebar();
                             return;
                         }
-                        if (data.sender && data.content) {
-                            chat.messages.push({sender: data.sender, content: data.content});
+                        // Render each batch as soon as it arrives
+                        for (const msg of data.messages || []) {
+                            if (msg.sender && msg.content) {
+                                chat.messages.push({sender: msg.sender, content: msg.content});
+                                addMessage(msg.sender, msg.content, false);
+                            }
                         }
                     }
                 }
@@ -368,24 +379,35 @@ async function loadChatHistoryFromBackend(threadId, chatId) {
     }
 }
 
-async function loadAllChatsFromBackend() {
+let nextChatsCursor = null;
+let isLoadingChats = false;
+
+async function loadAllChatsFromBackend(cursor = null) {
+    if (isLoadingChats) return;
+    isLoadingChats = true;
     try {
-        const response = await fetch('/all-chats');
+        const url = cursor ? `/all-chats?cursor=${encodeURIComponent(cursor)}` : '/all-chats';
+        const response = await fetch(url);
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
+        let pending = '';
         let index = 0;
         
         while (true) {
             const {done, value} = await reader.read();
             if (done) break;
             
-            const chunk = decoder.decode(value);
-            const lines = chunk.split('\n');
+            pending += decoder.decode(value, {stream: true});
+            const lines = pending.split('\n');
+            pending = lines.pop();
             
             for (const line of lines) {
                 if (line.startsWith('data: ')) {
                     const data = JSON.parse(line.slice(6));
-                    if (data.done) return;
+                    if (data.done) {
+                        nextChatsCursor = data.next_cursor || null;
+                        return;
+                    }
                     
                     if (data.thread_id) {
                         const chatId = 'chat_' + data.thread_id;
@@ -416,9 +438,20 @@ async function loadAllChatsFromBackend() {
         }
     } catch (error) {
         console.error('Error loading all chats:', error);
+    } finally {
+        isLoadingChats = false;
     }
 }
 
+// Load the next page of chats when the sidebar is scrolled to the bottom
+const chatHistoryScroller = chatHistory.parentElement;
+chatHistoryScroller.addEventListener('scroll', () => {
+    const nearBottom = chatHistoryScroller.scrollTop + chatHistoryScroller.clientHeight >= chatHistoryScroller.scrollHeight - 50;
+    if (nextChatsCursor && nearBottom) {
+        loadAllChatsFromBackend(nextChatsCursor);
+    }
+});
+
 async function handleSubmit(e) {
     e.preventDefault();
     
@@ -481,15 +514,21 @@ async function handleSubmit(e) {
             })
         });
 
+        if (response.status === 429) {
+            const retryAfter = response.headers.get('Retry-After') || 'a few';
+            throw new Error(`HTTP error! status: 429, retry after ${retryAfter}`);
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
         let newThreadId = null;
         let buffer = '';
         let isStreaming = false;
+        // Run to re-attach to if the connection drops, and the last event we handled
+        let runId = null;
+        let lastEventId = 0;
+        let finished = false;
 
         // Function to stream buffered text character by character
         const streamBuffer = async () => {
@@ -511,50 +550,112 @@ async function handleSubmit(e) {
             isStreaming = false;
         };
 
-        while (true) {
-            const {done, value} = await reader.read();
-            if (done) break;
+        const handleData = async (data) => {
+            if (data.thread_id) {
+                newThreadId = data.thread_id;
+                currentThreadId = data.thread_id;
+                chat.threadId = data.thread_id;
+            }
+
+            if (data.run_id) {
+                runId = data.run_id;
+            }
+            
+            if (data.queue_position) {
+                // Server is busy: show our place until the answer starts
+                assistantMessageDiv.textContent = `Waiting in queue (position ${data.queue_position})...`;
+            }
 
-            const chunk = decoder.decode(value);
-            const lines = chunk.split('\n');
+            if (data.chunk) {
+                buffer += data.chunk;
+                if (!isStreaming) streamBuffer();
+            }
+            
+            if (data.done) {
+                finished = true;
+                // Wait for buffer to finish
+                while (buffer.length > 0 || isStreaming) {
+                    await new Promise(resolve => setTimeout(resolve, 50));
+                }
+                chat.messages.push({ sender: 'assistant', content: fullResponse });
+                chat.timestamp = Date.now();
+            }
+            
+            if (data.cancelled) {
+                // The run was stopped on the server, keep what was streamed
+                finished = true;
+                buffer += '\n\n*(stopped)*';
+                if (!isStreaming) streamBuffer();
+            }
+            
+            if (data.error) {
+                finished = true;
+                fullResponse = `**Error:** ${data.error}`;
+                const parsedResponse = marked.parse(fullResponse);
+                assistantMessageDiv.innerHTML = window.DOMPurify ? DOMPurify.sanitize(parsedResponse) : parsedResponse;
+            }
+        };
 
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    const data = JSON.parse(line.slice(6));
-                    
-                    if (data.thread_id) {
-                        newThreadId = data.thread_id;
-                        currentThreadId = data.thread_id;
-                        chat.threadId = data.thread_id;
-                    }
-                    
-                    if (data.chunk) {
-                        buffer += data.chunk;
-                        if (!isStreaming) streamBuffer();
-                    }
-                    
-                    if (data.done) {
-                        // Wait for buffer to finish
-                        while (buffer.length > 0 || isStreaming) {
-                            await new Promise(resolve => setTimeout(resolve, 50));
-                        }
-                        chat.messages.push({ sender: 'assistant', content: fullResponse });
-                        chat.timestamp = Date.now();
-                    }
-                    
-                    if (data.error) {
-                        fullResponse = `**Error:** ${data.error}`;
-                        const parsedResponse = marked.parse(fullResponse);
-                        assistantMessageDiv.innerHTML = window.DOMPurify ? DOMPurify.sanitize(parsedResponse) : parsedResponse;
+        const readFrames = async (stream) => {
+            const reader = stream.body.getReader();
+            const decoder = new TextDecoder();
+            let pending = '';
+            let eventId = null;
+
+            while (true) {
+                const {done, value} = await reader.read();
+                if (done) break;
+
+                // Frames can be split across reads, keep the incomplete tail
+                pending += decoder.decode(value, {stream: true});
+                const lines = pending.split('\n');
+                pending = lines.pop();
+
+                for (const line of lines) {
+                    if (line.startsWith('id: ')) {
+                        eventId = parseInt(line.slice(4), 10);
+                    } else if (line.startsWith('data: ')) {
+                        await handleData(JSON.parse(line.slice(6)));
+                        // Only count the event once it has been handled
+                        if (eventId !== null) lastEventId = eventId;
                     }
                 }
             }
+        };
+
+        try {
+            await readFrames(response);
+        } catch (err) {
+            console.warn('Stream dropped:', err);
+        }
+
+        // Connection dropped before the answer finished: re-attach to the same run,
+        // the server replays what we missed instead of generating the answer again
+        for (let attempt = 1; !finished && runId && attempt <= 5; attempt++) {
+            await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+            try {
+                const resumed = await fetch(`/chat-stream/${runId}`, {
+                    headers: { 'Last-Event-ID': String(lastEventId) }
+                });
+                if (resumed.status === 404 || resumed.status === 410) break;
+                if (!resumed.ok) continue;
+                await readFrames(resumed);
+            } catch (err) {
+                console.warn('Resume failed:', err);
+            }
+        }
+
+        if (!finished) {
+            throw new Error('Stream interrupted');
         }
         
     } catch (err) {
         console.error('Fetch error:', err);
         if (err.message.includes('403')) {
             fullResponse = '**Error:** Session expired. Please refresh the page.';
+        } else if (err.message.includes('429')) {
+            const seconds = err.message.split('retry after ')[1];
+            fullResponse = `**Server is busy.** Please try again in ${seconds} seconds.`;
         } else if (err.message.includes('422')) {
             fullResponse = '**Error:** Invalid request format.';
         } else {
@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import asyncio
+import logging
+import threading
+
+from typing import Any
+
+import xxhash
+from cachetools import TTLCache
+from langchain_core.tools import BaseTool
+from pydantic import PrivateAttr
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+
+_whitespace = re.compile(r"\s+")
+
+# Cache lookup result for "not cached" (None is a valid search result)
+_MISSING = object()
+
+
+def search_key(args: dict) -> str:
+    """Cache key: the normalized query plus every other argument, order-independent."""
+    normalized = dict(args)
+    if isinstance(normalized.get("query"), str):
+        normalized["query"] = _whitespace.sub(" ", normalized["query"]).strip().lower()
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    return xxhash.xxh3_128_hexdigest(payload.encode("utf-8"))
+
+
+class CachedSearchTool(BaseTool):
+    """
+    Wraps a search tool (TavilySearch) with a TTL cache keyed by the normalized
+    query, and singleflight coalescing: concurrent identical queries share one
+    in-flight request to the backend. The model sees the same name, description
+    and arguments as the wrapped tool.
+    """
+
+    inner: BaseTool
+
+    _cache: TTLCache = PrivateAttr()
+    _inflight: dict = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _counters: dict = PrivateAttr(default_factory=lambda: {"hits": 0, "misses": 0, "coalesced": 0})
+
+    def __init__(self, inner: BaseTool, ttl: int = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_MAX_ENTRIES, **kwargs: Any):
+        super().__init__(
+            name=inner.name,
+            description=inner.description,
+            args_schema=inner.args_schema,
+            response_format=inner.response_format,
+            inner=inner,
+            **kwargs,
+        )
+        self._cache = TTLCache(maxsize=max_entries, ttl=ttl)
+
+    @staticmethod
+    def _cacheable(result) -> bool:
+        # Tavily reports failures as {"error": ...}; don't pin those for the TTL
+        return not (isinstance(result, dict) and "error" in result)
+
+    # _run (worker threads) and _arun (event loop) share the TTLCache and the
+    # counters; a TTLCache isn't thread-safe, so every access takes the lock
+    def _get(self, key: str):
+        with self._lock:
+            result = self._cache.get(key, _MISSING)
+            if result is not _MISSING:
+                self._counters["hits"] += 1
+            return result
+
+    def _put(self, key: str, result):
+        if self._cacheable(result):
+            with self._lock:
+                self._cache[key] = result
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _run(self, run_manager=None, **kwargs: Any):
+        key = search_key(kwargs)
+        result = self._get(key)
+        if result is not _MISSING:
+            return result
+        self._count("misses")
+
+        result = self.inner._run(**kwargs)
+        self._put(key, result)
+        return result
+
+    async def _arun(self, run_manager=None, **kwargs: Any):
+        key = search_key(kwargs)
+        while True:
+            result = self._get(key)
+            if result is not _MISSING:
+                return result
+
+            # Someone is already fetching this query: wait for their result
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self._count("coalesced")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The leader was cancelled (e.g. tool timeout), not us: fetch again
+                if not inflight.cancelled():
+                    raise
+
+        self._count("misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self.inner._arun(**kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            self._put(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "entries": len(self._cache)}
@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import math
+import time
+import logging
+
+import xxhash
+import aiosqlite
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+
+# Stored next to checkpoints.sqlite by default
+SEMANTIC_CACHE_DB = os.getenv("SEMANTIC_CACHE_DB", "semantic_cache.sqlite")
+
+# Minimum cosine similarity for a cached answer to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+
+_words = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder: hashed word unigrams and bigrams, L2-normalized.
+    Needs no model download and gives the same vector for the same text on
+    every worker, which is enough to catch rephrasings of FAQ questions.
+    Any object with `dimensions` and `embed(text) -> list[float]` can replace it.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def embed(self, text: str) -> list[float]:
+        words = _words.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+        vector = [0.0] * self.dimensions
+        for feature in features:
+            h = xxhash.xxh64_intdigest(feature.encode("utf-8"))
+            sign = 1.0 if h & 1 else -1.0
+            vector[(h >> 1) % self.dimensions] += sign
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+def _serialize(vector: list[float]) -> bytes:
+    import sqlite_vec
+    return sqlite_vec.serialize_float32(vector)
+
+
+class SemanticCache:
+    """
+    Answer cache for near-duplicate questions, backed by a sqlite-vec vec0 table.
+    A lookup embeds the question and runs a KNN query; the closest prior answer
+    from the same model above the similarity threshold is replayed instead of
+    calling the model.
+
+    The vectors are partitioned by model and carry their creation time as a
+    metadata column, so the KNN itself only looks at live rows of the
+    requested model (other models' copies of a question can't crowd it out).
+    """
+
+    def __init__(self, enabled: bool = SEMANTIC_CACHE_ENABLED, db_path: str = SEMANTIC_CACHE_DB,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: int = SEMANTIC_CACHE_TTL, embedder=None):
+        self.enabled = enabled
+        self.db_path = db_path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.embedder = embedder or HashingEmbedder()
+        self._conn: aiosqlite.Connection = None
+
+        # Metrics
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_ms = 0.0
+        self.saved_ms = 0.0
+
+    async def open(self):
+        if not self.enabled:
+            return
+        try:
+            import sqlite_vec
+            self._conn = await aiosqlite.connect(self.db_path)
+            await self._conn.enable_load_extension(True)
+            await self._conn.load_extension(sqlite_vec.loadable_path())
+            await self._conn.enable_load_extension(False)
+        except (ImportError, AttributeError, aiosqlite.Error) as e:
+            logger.warning(f"sqlite-vec could not be loaded ({type(e).__name__}). Semantic cache will not be available.")
+            if self._conn:
+                await self._conn.close()
+                self._conn = None
+            self.enabled = False
+            return
+
+        # The cache is disposable: vectors from before the model partition are dropped with their answers
+        cursor = await self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'semantic_vectors'")
+        row = await cursor.fetchone()
+        if row and "partition key" not in row[0]:
+            logger.info("Rebuilding the semantic cache with per-model vector partitions")
+            await self._conn.executescript("DROP TABLE semantic_vectors; DELETE FROM semantic_answers;")
+
+        await self._conn.executescript(
+            f"""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS semantic_answers (
+                id INTEGER PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                question TEXT NOT NULL,
+                chunks TEXT NOT NULL,
+                generation_ms REAL NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS semantic_vectors USING vec0(
+                model_name text partition key,
+                embedding float[{self.embedder.dimensions}] distance_metric=cosine,
+                created_at float
+            );
+            """
+        )
+        await self._conn.commit()
+        logger.info(f"Semantic cache opened at {self.db_path}")
+
+    async def close(self):
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+
+    async def lookup(self, model_name: str, question: str):
+        """Returns the chunk list of a similar earlier answer, or None."""
+        if not self._conn:
+            return None
+        started = time.perf_counter()
+        self.lookups += 1
+
+        cursor = await self._conn.execute(
+            """
+            SELECT a.chunks, a.generation_ms, v.distance
+            FROM (
+                SELECT rowid, distance FROM semantic_vectors
+                WHERE embedding MATCH ? AND k = 1 AND model_name = ? AND created_at > ?
+            ) v
+            JOIN semantic_answers a ON a.id = v.rowid
+            """,
+            (_serialize(self.embedder.embed(question)), model_name, time.time() - self.ttl),
+        )
+        row = await cursor.fetchone()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.lookup_ms += elapsed_ms
+        if row and 1.0 - row[2] >= self.threshold:
+            self.hits += 1
+            self.saved_ms += max(0.0, row[1] - elapsed_ms)
+            return json.loads(row[0])
+        return None
+
+    async def store(self, model_name: str, question: str, chunks: list[str], generation_ms: float):
+        if not self._conn:
+            return
+        # Drop expired answers so the KNN index stays small
+        expired = time.time() - self.ttl
+        await self._conn.execute(
+            "DELETE FROM semantic_vectors WHERE rowid IN (SELECT id FROM semantic_answers WHERE created_at <= ?)",
+            (expired,),
+        )
+        await self._conn.execute("DELETE FROM semantic_answers WHERE created_at <= ?", (expired,))
+        now = time.time()
+        cursor = await self._conn.execute(
+            "INSERT INTO semantic_answers (model_name, question, chunks, generation_ms, created_at) VALUES (?, ?, ?, ?, ?)",
+            (model_name, question, json.dumps(chunks), generation_ms, now),
+        )
+        await self._conn.execute(
+            "INSERT INTO semantic_vectors (rowid, model_name, embedding, created_at) VALUES (?, ?, ?, ?)",
+            (cursor.lastrowid, model_name, _serialize(self.embedder.embed(question)), now),
+        )
+        await self._conn.commit()
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "avg_lookup_ms": self.lookup_ms / self.lookups if self.lookups else 0.0,
+            "latency_saved_ms": self.saved_ms,
+        }
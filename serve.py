@@ -0,0 +1,86 @@
+# serve.py
+# Production entry point: `python serve.py` (main.py's __main__ stays the single-worker --reload dev server).
+import os
+import logging
+import secrets
+import importlib.util
+
+import uvicorn
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+# Worker processes, one per core by default
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0")) or os.cpu_count() or 1
+
+# Idle keep-alive connections are kept longer than a typical load balancer idle timeout (60s),
+# so the balancer never reuses a connection the server has just closed
+KEEPALIVE_SECONDS = int(os.getenv("KEEPALIVE_SECONDS", "75"))
+
+# On SIGTERM, in-flight chat streams get this long to finish before they are cancelled
+# (a cancelled stream checkpoints its partial answer, see main.py)
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "60"))
+
+# Pending connections the kernel queues for us
+BACKLOG = int(os.getenv("BACKLOG", "2048"))
+
+# Addresses of the load balancer / reverse proxy (comma-separated IPs or CIDRs, "*" for any) whose
+# X-Forwarded-For is trusted. request.client, and so the per-client admission caps, then see the
+# real client instead of every user sharing the proxy's IP (see ADMISSION_MAX_PER_CLIENT)
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+
+def event_loop() -> str:
+    """uvloop when it is installed, else the stdlib asyncio loop."""
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    """httptools (C parser) when it is installed, else h11."""
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def share_worker_state(workers: int):
+    """
+    Worker processes share nothing in memory. The checkpoints, the thread index,
+    the caches, the upstream quotas and the admission slots live in SQLite
+    (WAL, one writer per worker) and work as is;
+    CSRF tokens must verify on any worker, so they are HMAC-signed with a
+    secret every worker inherits from here (their spent nonces are shared
+    through CSRF_DB, see csrf.py).
+    """
+    if workers > 1 and os.getenv("CSRF_STORE") == "memory":
+        logger.warning("CSRF_STORE=memory with several workers: tokens only verify on the worker that issued them.")
+    if not os.getenv("CSRF_SECRET"):
+        os.environ["CSRF_SECRET"] = secrets.token_urlsafe(32)
+        logger.warning("CSRF_SECRET not set. Generated one for this run, CSRF tokens will not survive a restart.")
+
+
+def run():
+    share_worker_state(WEB_WORKERS)
+    loop, http = event_loop(), http_protocol()
+    logger.info(f"Starting {WEB_WORKERS} worker(s) on {HOST}:{PORT} (loop={loop}, http={http}, "
+                f"trusted proxies={FORWARDED_ALLOW_IPS})")
+
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_WORKERS,
+        loop=loop,
+        http=http,
+        backlog=BACKLOG,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+        timeout_keep_alive=KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT_SECONDS,
+        log_config="logging.yaml",
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    run()
@@ -0,0 +1,112 @@
+import os
+import asyncio
+
+from collections import deque
+from typing import AsyncIterator
+
+import orjson
+
+# Tokens are grouped into one frame until this much text is buffered...
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "512"))
+
+# ...or the oldest buffered token has waited this long (milliseconds)
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "20"))
+
+# Pre-encoded fixed parts of the frames
+_EVENT_PREFIX = b"data: "
+_EVENT_SUFFIX = b"\n\n"
+_CHUNK_PREFIX = b'data: {"chunk":'
+_CHUNK_SUFFIX = b"}\n\n"
+
+
+def encode_event(payload: dict) -> bytes:
+    """One SSE frame carrying a JSON object."""
+    return _EVENT_PREFIX + orjson.dumps(payload) + _EVENT_SUFFIX
+
+
+def encode_chunk(text: str) -> bytes:
+    """SSE frame for streamed answer text, same shape as {'chunk': text}."""
+    return _CHUNK_PREFIX + orjson.dumps(text) + _CHUNK_SUFFIX
+
+
+_END = object()
+
+
+async def coalesce_tokens(tokens: AsyncIterator[str], max_bytes: int = SSE_COALESCE_BYTES,
+                          max_delay_ms: float = SSE_COALESCE_MS) -> AsyncIterator[str]:
+    """
+    Groups a token stream into larger pieces: a piece is emitted once
+    `max_bytes` of text are buffered or the oldest buffered token is
+    `max_delay_ms` old, whichever comes first. A pause in the model output
+    never holds back buffered text for longer than the delay.
+
+    A producer task drains `tokens` into a deque, so tokens that arrive
+    back to back are grouped without a timer per token; a timed wait only
+    happens when the buffer is non-empty and no token is ready.
+    Items that are not strings (event dicts) flush the buffer and are
+    passed through unchanged, in order.
+    """
+    loop = asyncio.get_running_loop()
+    max_delay = max_delay_ms / 1000
+    ready = asyncio.Event()
+    queue = deque()
+    error = None
+
+    async def produce():
+        nonlocal error
+        try:
+            async for token in tokens:
+                queue.append(token)
+                ready.set()
+        except Exception as e:
+            error = e
+        queue.append(_END)
+        ready.set()
+
+    producer = asyncio.ensure_future(produce())
+    buffer = []
+    size = 0
+    deadline = 0.0
+
+    try:
+        while True:
+            if not queue:
+                ready.clear()
+                if not buffer:
+                    await ready.wait()
+                    continue
+                timeout = deadline - loop.time()
+                if timeout > 0:
+                    try:
+                        await asyncio.wait_for(ready.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                if not queue:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                    continue
+
+            token = queue.popleft()
+            if token is _END:
+                break
+            if not isinstance(token, str):
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                yield token
+                continue
+            if not buffer:
+                deadline = loop.time() + max_delay
+            buffer.append(token)
+            size += len(token)
+            if size >= max_bytes or loop.time() >= deadline:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+        if error is not None:
+            raise error
+    finally:
+        if not producer.done():
+            producer.cancel()
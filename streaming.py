@@ -0,0 +1,50 @@
+import logging
+
+from typing import AsyncIterator, Union
+
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+from prompt_builder import content_text
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Only tokens from this graph node are sent to the client
+ANSWER_NODE = "agent"
+
+
+async def stream_tokens(app, inputs: dict, config: dict) -> AsyncIterator[Union[str, dict]]:
+    """
+    Lean streaming path built on stream_mode="messages": LangGraph only hands
+    over message chunks, so no chain / node / tool start-end events are built.
+    Yields answer text from the agent node, and a {'tool_end': ...} dict for
+    each tool result so callers know the turn used tools.
+    """
+    async for chunk, metadata in app.astream(inputs, config=config, stream_mode="messages"):
+        if isinstance(chunk, AIMessageChunk):
+            if metadata.get("langgraph_node") == ANSWER_NODE:
+                text = content_text(chunk.content)
+                if text:
+                    yield text
+        elif isinstance(chunk, ToolMessage):
+            yield {'tool_end': chunk.name, 'status': chunk.status}
+
+
+async def stream_events(app, inputs: dict, config: dict) -> AsyncIterator[Union[str, dict]]:
+    """
+    Debug streaming path built on astream_events(version="v2"). Every event is
+    materialized, which costs more CPU, but tool starts and ends are reported
+    as they happen.
+    """
+    async for event in app.astream_events(inputs, config=config, version="v2"):
+        kind = event.get("event")
+
+        if kind == "on_chat_model_stream":
+            if event.get("metadata", {}).get("langgraph_node") == ANSWER_NODE:
+                text = content_text(event.get("data", {}).get("chunk", {}).content)
+                if text:
+                    yield text
+        elif kind == "on_tool_start":
+            yield {'tool_start': event.get("name")}
+        elif kind == "on_tool_end":
+            yield {'tool_end': event.get("name")}
@@ -0,0 +1,106 @@
+import os
+import logging
+
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, RemoveMessage
+
+from prompt_builder import content_text, estimate_tokens, split_turns
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Opt-in (CONVERSATION_SUMMARY=1): older turns are folded into a rolling summary
+SUMMARY_ENABLED = os.getenv("CONVERSATION_SUMMARY", "0") == "1"
+
+# A thread is summarized once it holds more messages or (estimated) tokens than this
+SUMMARY_MAX_MESSAGES = int(os.getenv("SUMMARY_MAX_MESSAGES", "40"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "6000"))
+
+# Latest turns kept verbatim next to the summary
+SUMMARY_KEEP_TURNS = max(1, int(os.getenv("SUMMARY_KEEP_TURNS", "4")))
+
+# Model writing the summaries (through the router, so it falls back like chat calls)
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "fast")
+
+# Summary message kept in the state; a new summary replaces it (same id)
+SUMMARY_MESSAGE_ID = "conversation-summary"
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the conversation below for your own later use. Keep names, facts, numbers, "
+    "decisions and open questions; drop small talk and raw search results. Answer with the summary only."
+)
+
+
+def is_summary(message: BaseMessage) -> bool:
+    return isinstance(message, SystemMessage) and message.id == SUMMARY_MESSAGE_ID
+
+
+def transcript(messages: list[BaseMessage]) -> str:
+    """Plain-text transcript of the turns to summarize (tool calls by name, tool results cut short)."""
+    lines = []
+    for message in messages:
+        text = content_text(message.content)
+        if message.type == "tool":
+            text = text[:500]
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            text += f" [called {tool_call.get('name')}]"
+        if text:
+            lines.append(f"{message.type}: {text}")
+    return "\n".join(lines)
+
+
+class ModelSummarizer:
+    """Writes the rolling summary with a chat model taken from the router."""
+
+    def __init__(self, router, model_name: str = SUMMARY_MODEL):
+        self.router = router
+        self.model_name = model_name
+
+    def _prompt(self, previous: str, messages: list[BaseMessage]) -> list[BaseMessage]:
+        text = transcript(messages)
+        if previous:
+            text = f"Summary so far:\n{previous}\n\nNewer messages:\n{text}"
+        return [SystemMessage(content=SUMMARY_INSTRUCTIONS), HumanMessage(content=text)]
+
+    def summarize(self, previous: str, messages: list[BaseMessage]) -> str:
+        response = self.router.for_model(self.model_name).invoke(self._prompt(previous, messages), {"callbacks": []})
+        return content_text(response.content)
+
+    async def asummarize(self, previous: str, messages: list[BaseMessage]) -> str:
+        # No callbacks: the summary must not stream into the chat window
+        response = await self.router.for_model(self.model_name).ainvoke(self._prompt(previous, messages), {"callbacks": []})
+        return content_text(response.content)
+
+
+def plan_summary(messages: list[BaseMessage], max_messages: int = None, max_tokens: int = None,
+                 keep_turns: int = None) -> tuple[str, list[BaseMessage]]:
+    """
+    Decides whether a thread needs summarizing. Returns the previous summary
+    text and the messages to fold into the new one (empty if under the
+    thresholds). Whole turns are folded so tool calls stay with their results.
+    """
+    max_messages = max_messages or SUMMARY_MAX_MESSAGES
+    max_tokens = max_tokens or SUMMARY_MAX_TOKENS
+    keep_turns = keep_turns or SUMMARY_KEEP_TURNS
+
+    previous = ""
+    history = []
+    for message in messages:
+        if is_summary(message):
+            previous = content_text(message.content)
+        else:
+            history.append(message)
+
+    if len(history) <= max_messages and sum(estimate_tokens(m) for m in history) <= max_tokens:
+        return previous, []
+
+    turns = split_turns(history)
+    if len(turns) <= keep_turns:
+        return previous, []
+    return previous, [m for turn in turns[:-keep_turns] for m in turn]
+
+
+def summary_update(summary: str, folded: list[BaseMessage]) -> dict:
+    """State update: remove the folded messages, put the new summary in place of the old one."""
+    logger.info(f"Conversation summarized: {len(folded)} messages folded into {len(summary)} chars")
+    removals = [RemoveMessage(id=m.id) for m in folded]
+    return {"messages": removals + [SystemMessage(content=summary, id=SUMMARY_MESSAGE_ID)]}
@@ -0,0 +1,21 @@
+# tests/conftest.py
+# Puts the repo root on sys.path (the modules are flat), keeps the SQLite files of the app in a temp
+# dir (read when the modules are imported) and runs async tests on asyncio.
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DB_DIR = tempfile.mkdtemp()
+for name, filename in (("CHECKPOINT_DB", "checkpoints.sqlite"), ("ADMISSION_DB", "admission.sqlite"),
+                       ("CSRF_DB", "csrf.sqlite"), ("RUNS_DB", "runs.sqlite"),
+                       ("RATE_LIMIT_DB", "rate_limits.sqlite"), ("SEMANTIC_CACHE_DB", "semantic_cache.sqlite")):
+    os.environ.setdefault(name, os.path.join(DB_DIR, filename))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,97 @@
+# tests/test_model_router.py
+# Fallback, hedging and quota handling of ModelRouter with fake model tiers (see bench_router.py).
+import os
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from fake_models import FakeChatModel
+from model_registry import ModelRegistry
+from model_router import ModelRouter, parse_fallbacks
+from rate_limiter import TokenBucketLimiter, Quota
+
+QUESTION = [HumanMessage(content="question")]
+
+
+def make_registry(pro: FakeChatModel, fast: FakeChatModel = None) -> ModelRegistry:
+    registry = ModelRegistry()
+    registry["pro"] = pro
+    registry["fast"] = fast or FakeChatModel(reply="fast answer")
+    return registry
+
+
+async def answer(model) -> str:
+    return "".join([chunk.content async for chunk in model.astream(QUESTION)])
+
+
+def test_parse_fallbacks():
+    assert parse_fallbacks("pro>fast>unlimited,flash>unlimited") == {
+        "pro": ["fast", "unlimited"], "fast": ["unlimited"], "unlimited": [], "flash": ["unlimited"]}
+    assert parse_fallbacks("") == {}
+
+
+def test_chain_skips_unknown_models():
+    router = ModelRouter(make_registry(FakeChatModel()), fallbacks={"pro": ["fast", "missing", "pro"]})
+    assert router.chain("pro") == ["pro", "fast"]
+
+
+@pytest.mark.anyio
+async def test_primary_answers():
+    router = ModelRouter(make_registry(FakeChatModel(reply="pro answer")), fallbacks={"pro": ["fast"]}, hedging=False)
+    assert await answer(router.for_model("pro")) == "pro answer"
+    assert router.counters["fallbacks"] == 0
+
+
+@pytest.mark.anyio
+async def test_failing_tier_falls_back():
+    router = ModelRouter(make_registry(FakeChatModel(failure_rate=1.0)), fallbacks={"pro": ["fast"]}, hedging=False)
+    assert await answer(router.for_model("pro")) == "fast answer"
+    assert router.counters["fallbacks"] == 1
+    # The sync path falls back too
+    assert router.for_model("pro").invoke(QUESTION).content == "fast answer"
+
+
+@pytest.mark.anyio
+async def test_last_tier_error_is_raised():
+    registry = make_registry(FakeChatModel(failure_rate=1.0), FakeChatModel(failure_rate=1.0))
+    router = ModelRouter(registry, fallbacks={"pro": ["fast"]}, hedging=False)
+    with pytest.raises(Exception, match="injected failure"):
+        await answer(router.for_model("pro"))
+
+
+@pytest.mark.anyio
+async def test_slow_tier_is_hedged():
+    router = ModelRouter(make_registry(FakeChatModel(reply="pro answer", latency=2.0)), fallbacks={"pro": ["fast"]},
+                         hedging=True, hedge_min_samples=1000, hedge_max_ms=50)
+    start_time = time.perf_counter()
+    assert await answer(router.for_model("pro")) == "fast answer"
+    assert time.perf_counter() - start_time < 1.0
+    assert router.counters["hedges"] == 1
+    assert router.counters["hedge_wins"] == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("pro, hedging", [(FakeChatModel(failure_rate=1.0), False),
+                                          (FakeChatModel(latency=0.3), True)])
+async def test_quota_of_losing_tier_is_given_back(tmp_path, pro, hedging):
+    # Frozen clock: nothing refills, so only released reservations bring tokens back
+    limiter = TokenBucketLimiter({"pro": Quota(1000, 100_000), "fast": Quota(1000, 100_000)},
+                                 db_path=os.path.join(tmp_path, "quota.sqlite"), clock=lambda: 0.0)
+    await limiter.open()
+    try:
+        router = ModelRouter(make_registry(pro, FakeChatModel(reply="fast answer", usage_tokens=100)),
+                             fallbacks={"pro": ["fast"]}, limiter=limiter, hedging=hedging,
+                             hedge_min_samples=1000, hedge_max_ms=50)
+        for _ in range(5):
+            assert await answer(router.for_model("pro")) == "fast answer"
+        async with limiter._lock:
+            pro_levels = await limiter._levels("pro", 0.0)
+            fast_levels = await limiter._levels("fast", 0.0)
+    finally:
+        await limiter.close()
+
+    assert pro_levels["tokens"] == 100_000
+    assert pro_levels["requests"] == 1000 - 5
+    # The winner is settled against its reported usage
+    assert fast_levels["tokens"] == 100_000 - 5 * 100
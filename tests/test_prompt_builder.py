@@ -0,0 +1,65 @@
+# tests/test_prompt_builder.py
+# build_prompt() keeps a long thread under the token budget (see bench_prompt.py).
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from prompt_builder import TOOL_MESSAGE_MAX_CHARS, build_prompt, estimate_tokens
+
+SYSTEM_PROMPT = "You are an AI agent named CORE."
+BUDGET = 8000
+TURNS = 200
+
+
+def synthetic_turn(i):
+    """One user question answered with a web search (large tool payload)."""
+    call_id = f"call_{i}"
+    return [
+        HumanMessage(content=f"Question {i}: what happened in the news today about topic {i}?"),
+        AIMessage(content="", tool_calls=[{"name": "tavily_search", "args": {"query": f"topic {i}"}, "id": call_id}]),
+        ToolMessage(content="search result " * 800, tool_call_id=call_id),
+        AIMessage(content=f"Here is a short summary of topic {i}. " * 10),
+    ]
+
+
+def prompt_tokens(prompt):
+    return sum(estimate_tokens(m) for m in prompt)
+
+
+def test_long_thread_stays_under_budget():
+    history = []
+    sizes = []
+    for i in range(TURNS):
+        history.extend(synthetic_turn(i))
+        sizes.append(prompt_tokens(build_prompt(SYSTEM_PROMPT, history, max_tokens=BUDGET)))
+
+    assert max(sizes) <= BUDGET
+    # Flat once the budget is reached, not growing with the thread
+    assert max(sizes[50:]) - min(sizes[50:]) < BUDGET * 0.1
+    assert sizes[-1] <= sizes[50] + BUDGET * 0.1
+
+
+def test_old_tool_results_are_elided():
+    history = [m for i in range(TURNS) for m in synthetic_turn(i)]
+    prompt = build_prompt(SYSTEM_PROMPT, history, max_tokens=BUDGET)
+
+    tool_messages = [m for m in prompt if isinstance(m, ToolMessage)]
+    assert len(tool_messages) > 1
+    # Earlier turns carry a placeholder, the latest turn its full result
+    for message in tool_messages[:-1]:
+        assert len(message.content) <= TOOL_MESSAGE_MAX_CHARS
+        assert message.content.startswith("[tool result of")
+    assert tool_messages[-1].content == history[-2].content
+    # The latest turn is kept whole, the oldest ones dropped
+    assert prompt[-4:] == history[-4:]
+    assert prompt[1].content != history[0].content
+
+
+def test_summary_is_folded_into_system_prompt():
+    summary = SystemMessage(content="The user asked about topics 0 to 149.")
+    history = [summary] + [m for i in range(150, TURNS) for m in synthetic_turn(i)]
+    prompt = build_prompt(SYSTEM_PROMPT, history, max_tokens=BUDGET)
+
+    assert isinstance(prompt[0], SystemMessage)
+    assert prompt[0].content.startswith(SYSTEM_PROMPT)
+    assert summary.content in prompt[0].content
+    assert not any(isinstance(m, SystemMessage) for m in prompt[1:])
+    assert prompt_tokens(prompt) <= BUDGET
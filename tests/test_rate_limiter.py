@@ -0,0 +1,144 @@
+# tests/test_rate_limiter.py
+# TokenBucketLimiter against a quota-enforcing fake upstream on a simulated clock (see bench_rate_limiter.py).
+import os
+import heapq
+import asyncio
+import itertools
+
+import pytest
+
+from rate_limiter import TokenBucketLimiter, Quota, RateLimited, Reservation, parse_quotas
+
+QUOTA = Quota(rpm=10, tpm=20_000)
+BURST = 30
+ESTIMATED_TOKENS = 1_500
+ACTUAL_TOKENS = 800
+CALL_SECONDS = 3.0
+
+
+class SimulatedClock:
+    """Virtual time: sleepers wake in order, time jumps straight to the next wake-up."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._sleepers = []
+        self._seq = itertools.count()
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + seconds, next(self._seq), future))
+        await future
+
+    async def run(self, coroutines):
+        """Runs the coroutines to completion, advancing time whenever all of them are asleep."""
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        while not all(task.done() for task in tasks):
+            running = sum(1 for task in tasks if not task.done())
+            if self._sleepers and len(self._sleepers) >= running:
+                wake, _, future = heapq.heappop(self._sleepers)
+                self.now = max(self.now, wake)
+                future.set_result(None)
+            await asyncio.sleep(0.0005)  # real time: lets SQLite calls in worker threads finish
+        return [task.result() for task in tasks]
+
+
+class Upstream:
+    """Fake Gemini endpoint enforcing RPM/TPM like a bucket refilled over each minute."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.levels = {"requests": QUOTA.rpm, "tokens": QUOTA.tpm}
+        self.updated_at = 0.0
+
+    async def call(self) -> bool:
+        elapsed, self.updated_at = self.clock() - self.updated_at, self.clock()
+        self.levels["requests"] = min(QUOTA.rpm, self.levels["requests"] + elapsed * QUOTA.rpm / 60)
+        self.levels["tokens"] = min(QUOTA.tpm, self.levels["tokens"] + elapsed * QUOTA.tpm / 60)
+        if self.levels["requests"] < 1 or self.levels["tokens"] < ACTUAL_TOKENS:
+            return False  # 429
+        self.levels["requests"] -= 1
+        self.levels["tokens"] -= ACTUAL_TOKENS
+        await self.clock.sleep(CALL_SECONDS)
+        return True
+
+
+async def call(upstream, limiter):
+    if limiter is not None:
+        try:
+            reservation = await limiter.reserve("pro", ESTIMATED_TOKENS)
+        except RateLimited:
+            return "gave up"
+    ok = await upstream.call()
+    if limiter is not None:
+        await limiter.settle(reservation, ACTUAL_TOKENS if ok else 0)
+    return "ok" if ok else "429"
+
+
+async def burst(db_path, workers, max_wait=600):
+    """BURST calls at t=0 spread over `workers` limiters sharing one file; (results, simulated seconds)."""
+    clock = SimulatedClock()
+    upstream = Upstream(clock)
+    limiters = []
+    for _ in range(workers):
+        limiter = TokenBucketLimiter({"pro": QUOTA}, db_path=db_path, max_wait=max_wait, clock=clock, sleep=clock.sleep)
+        await limiter.open()
+        limiters.append(limiter)
+    try:
+        results = await clock.run(call(upstream, limiters[i % workers] if workers else None) for i in range(BURST))
+    finally:
+        for limiter in limiters:
+            await limiter.close()
+    return results, clock.now
+
+
+def test_parse_quotas():
+    assert parse_quotas("pro=5/250000, fast=10/250000,broken=3") == {
+        "pro": Quota(5, 250_000), "fast": Quota(10, 250_000)}
+    assert parse_quotas("") == {}
+
+
+@pytest.mark.anyio
+async def test_burst_without_limiter_hits_upstream_429s(tmp_path):
+    results, _ = await burst(os.path.join(tmp_path, "rate_limits.sqlite"), workers=0)
+    assert results.count("ok") == QUOTA.rpm
+    assert results.count("429") == BURST - QUOTA.rpm
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("workers", [1, 2])
+async def test_burst_is_spread_over_the_quota(tmp_path, workers):
+    results, seconds = await burst(os.path.join(tmp_path, "rate_limits.sqlite"), workers)
+    assert results == ["ok"] * BURST
+    # A minute of quota up front, then one request every 60 / rpm seconds
+    assert seconds >= (BURST - QUOTA.rpm) * 60 / QUOTA.rpm
+
+
+@pytest.mark.anyio
+async def test_wait_over_max_wait_is_rejected(tmp_path):
+    results, _ = await burst(os.path.join(tmp_path, "rate_limits.sqlite"), workers=1, max_wait=30)
+    assert "429" not in results
+    assert results.count("gave up") > 0
+    assert results.count("ok") + results.count("gave up") == BURST
+
+
+@pytest.mark.anyio
+async def test_settle_and_release_give_tokens_back(tmp_path):
+    limiter = TokenBucketLimiter({"pro": QUOTA}, db_path=os.path.join(tmp_path, "rate_limits.sqlite"), clock=lambda: 0.0)
+    await limiter.open()
+    try:
+        settled = await limiter.reserve("pro", ESTIMATED_TOKENS)
+        released = await limiter.reserve("pro", ESTIMATED_TOKENS)
+        await limiter.settle(settled, ACTUAL_TOKENS)
+        await limiter.release(released)
+        async with limiter._lock:
+            levels = await limiter._levels("pro", 0.0)
+        # Models without a quota are not limited
+        assert await limiter.reserve("fast", ESTIMATED_TOKENS) is None
+    finally:
+        await limiter.close()
+
+    assert settled == Reservation("pro", ESTIMATED_TOKENS)
+    assert levels == {"requests": QUOTA.rpm - 2, "tokens": QUOTA.tpm - ACTUAL_TOKENS}
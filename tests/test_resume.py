@@ -0,0 +1,101 @@
+# tests/test_resume.py
+# A /chat/ stream resumed through /chat-stream/{run_id} with Last-Event-ID (see bench_resume.py).
+import os
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import agent
+import main
+from fake_models import FakeChatModel
+from run_manager import RunManager
+from run_store import RemoteRun
+
+TOKENS = 200
+TOKEN_DELAY = 0.005
+RESUME_AFTER = 5
+
+
+def parse(body: str) -> list[tuple[int, dict]]:
+    """(event id, payload) pairs of an SSE body."""
+    frames, event_id = [], None
+    for line in body.splitlines():
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            frames.append((event_id, json.loads(line[6:])))
+    return frames
+
+
+def answer(frames) -> str:
+    return "".join(payload.get("chunk", "") for _, payload in frames)
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    agent.available_models["fast"] = FakeChatModel(reply="word " * TOKENS, chunks=TOKENS, token_delay=TOKEN_DELAY)
+    monkeypatch.setattr(agent, "default_model", "fast")
+    # ASGITransport doesn't run the lifespan
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            yield client
+
+
+async def start_chat(client) -> tuple[asyncio.Task, str]:
+    """Starts a /chat/ request and waits for its run to be a few frames in."""
+    token = (await client.get("/csrf-token")).json()["csrf_token"]
+    known = set(main.run_manager._runs)
+    body = {"input": "tell me a long story", "model_name": "fast", "csrf_token": token}
+    chat = asyncio.create_task(client.post("/chat/", json=body))
+    while True:
+        runs = [run for run_id, run in main.run_manager._runs.items() if run_id not in known]
+        if runs and runs[0].last_id >= RESUME_AFTER:
+            return chat, runs[0].run_id
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.anyio
+async def test_resume_replays_and_follows_the_run(client):
+    requests_before = agent.model_router.stats()["requests"]
+    chat, run_id = await start_chat(client)
+
+    # The client "dropped" after RESUME_AFTER frames: resume from there while the run goes on
+    resumed = await client.get(f"/chat-stream/{run_id}", headers={"Last-Event-ID": str(RESUME_AFTER)})
+    assert resumed.status_code == 200
+    first = parse((await chat).text)
+    frames = first[:RESUME_AFTER] + parse(resumed.text)
+
+    ids = [event_id for event_id, _ in frames]
+    assert ids == list(range(1, len(ids) + 1))
+    assert frames[-1][1].get("done")
+    assert answer(frames) == "word " * TOKENS
+    assert frames == first
+    assert agent.model_router.stats()["requests"] - requests_before == 1
+
+
+@pytest.mark.anyio
+async def test_resume_on_another_worker(client):
+    chat, run_id = await start_chat(client)
+
+    # A second worker sharing RUNS_DB finds the run and follows it from the store
+    other = RunManager(db_path=os.environ["RUNS_DB"])
+    await other.open()
+    try:
+        run = await other.lookup(run_id)
+        assert isinstance(run, RemoteRun)
+        body = b"".join([frame async for frame in other.view(run, RESUME_AFTER)])
+    finally:
+        await other.close()
+
+    first = parse((await chat).text)
+    assert first[:RESUME_AFTER] + parse(body.decode()) == first
+    assert answer(first) == "word " * TOKENS
+
+
+@pytest.mark.anyio
+async def test_unknown_run_is_404(client):
+    assert (await client.get("/chat-stream/unknown-run")).status_code == 404
+    assert (await client.post("/runs/unknown-run/cancel")).status_code == 404
@@ -0,0 +1,90 @@
+# tests/test_summary.py
+# A long thread through the agent and summarize nodes stays bounded (see bench_summary.py).
+import os
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+import agent
+import summarizer
+from db import SqlitePool
+from fake_models import FakeChatModel, FakeSummarizer
+
+TURNS = 120
+MAX_MESSAGES = 20
+CONFIG = {"configurable": {"thread_id": "long-thread", "model_name": "fast"}}
+
+
+def summarized_graph():
+    """agent -> summarize, as agent.py builds it with CONVERSATION_SUMMARY=1 (read at import time)."""
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", RunnableLambda(agent.agent_node, afunc=agent.aagent_node, name="agent"))
+    graph.add_node("summarize", RunnableLambda(agent.summarize_node, afunc=agent.asummarize_node, name="summarize"))
+    graph.add_edge(START, "agent")
+    graph.add_edge("agent", "summarize")
+    graph.add_edge("summarize", END)
+    return graph
+
+
+async def checkpoint_bytes(pool) -> int:
+    query = await pool.writer.execute(
+        "SELECT length(checkpoint) FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT 1",
+        ("long-thread",),
+    )
+    return (await query.fetchone())[0]
+
+
+@pytest.fixture
+async def pool(tmp_path):
+    pool = SqlitePool(os.path.join(tmp_path, "checkpoints.sqlite"))
+    await pool.open()
+    yield pool
+    await pool.close()
+
+
+@pytest.mark.anyio
+async def test_long_thread_is_summarized(pool, monkeypatch):
+    agent.available_models["fast"] = FakeChatModel(reply="A fairly detailed fake answer from the model. " * 10)
+    fake_summarizer = FakeSummarizer()
+    monkeypatch.setattr(agent, "summarizer", fake_summarizer)
+    monkeypatch.setattr(summarizer, "SUMMARY_MAX_MESSAGES", MAX_MESSAGES)
+    app = summarized_graph().compile(checkpointer=pool.checkpointer)
+
+    sizes = []
+    for turn in range(1, TURNS + 1):
+        message = f"Turn {turn}: tell me more about topic {turn} " + "please " * 30
+        await app.ainvoke({"messages": [HumanMessage(content=message)]}, CONFIG)
+        sizes.append(await checkpoint_bytes(pool))
+
+    messages = (await app.aget_state(CONFIG)).values["messages"]
+    summaries = [m for m in messages if summarizer.is_summary(m)]
+
+    assert fake_summarizer.calls > 0
+    assert len(summaries) == 1
+    # Never more than the threshold plus the turn that crossed it
+    assert len(messages) <= MAX_MESSAGES + 2 + 1
+    # The summary picks up right where the verbatim turns start, the latest turn is kept
+    first_kept = next(m for m in messages if isinstance(m, HumanMessage))
+    first_kept_turn = int(first_kept.content.split(":")[0].split()[1])
+    assert f"Turn {first_kept_turn - 1}:" in summaries[0].content
+    assert messages[-2].content.startswith(f"Turn {TURNS}:")
+    assert not any(isinstance(m, SystemMessage) for m in messages if not summarizer.is_summary(m))
+    # The checkpoint stops growing with the thread
+    assert max(sizes[TURNS // 2:]) < 2 * max(sizes[:TURNS // 4])
+
+
+@pytest.mark.anyio
+async def test_short_thread_is_left_alone(pool, monkeypatch):
+    agent.available_models["fast"] = FakeChatModel()
+    fake_summarizer = FakeSummarizer()
+    monkeypatch.setattr(agent, "summarizer", fake_summarizer)
+    app = summarized_graph().compile(checkpointer=pool.checkpointer)
+
+    for turn in range(3):
+        await app.ainvoke({"messages": [HumanMessage(content=f"Turn {turn}")]}, CONFIG)
+
+    messages = (await app.aget_state(CONFIG)).values["messages"]
+    assert fake_summarizer.calls == 0
+    assert len(messages) == 6
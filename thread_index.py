@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import logging
+
+from datetime import datetime
+
+import aiosqlite
+
+from db import connect, take_lease
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+TITLE_LENGTH = 30
+
+# The one-off backfill indexes legacy threads this many per query / transaction, pausing between
+# batches so chat requests never wait long behind it
+BACKFILL_BATCH_THREADS = 200
+BACKFILL_PAUSE_SECONDS = 0.02
+
+# One worker runs the backfill at a time; the lease is given back when it is done
+BACKFILL_LEASE_JOB = "thread_index_backfill"
+BACKFILL_LEASE_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_by_updated_at ON threads (updated_at DESC, thread_id DESC);
+"""
+
+
+def make_title(text: str) -> str:
+    """Sidebar title for a thread, taken from its first user message."""
+    return text[:TITLE_LENGTH] + ('...' if len(text) > TITLE_LENGTH else '')
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def encode_cursor(updated_at: int, thread_id: str) -> str:
+    return f"{updated_at}:{thread_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, str]:
+    """Splits a cursor from encode_cursor, ValueError if it isn't one."""
+    updated_at, sep, thread_id = cursor.partition(":")
+    if not sep or not thread_id:
+        raise ValueError(f"Malformed cursor: {cursor!r}")
+    return int(updated_at), thread_id
+
+
+async def setup(conn: aiosqlite.Connection):
+    """Creates the threads table and its index if they don't exist yet."""
+    await conn.executescript(SCHEMA)
+    await conn.commit()
+
+
+async def record_turn(conn: aiosqlite.Connection, thread_id: str, user_input: str):
+    """
+    Records a completed chat turn. The first turn of a thread sets its title
+    and created_at, every turn bumps updated_at.
+    """
+    ts = now_ms()
+    await conn.execute(
+        """
+        INSERT INTO threads (thread_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at
+        """,
+        (thread_id, make_title(user_input), ts, ts),
+    )
+    await conn.commit()
+
+
+async def list_threads(conn: aiosqlite.Connection, limit: int,
+                       after: tuple[int, str] = None) -> tuple[list[dict], str]:
+    """
+    Returns one page of threads, most recently updated first, plus the cursor
+    for the next page (None on the last page). `after` is the decoded cursor
+    of the previous page. Uses the updated_at index only.
+    """
+    if after:
+        updated_at, thread_id = after
+        query = await conn.execute(
+            """
+            SELECT thread_id, title, created_at, updated_at FROM threads
+            WHERE (updated_at, thread_id) < (?, ?)
+            ORDER BY updated_at DESC, thread_id DESC LIMIT ?
+            """,
+            (updated_at, thread_id, limit + 1),
+        )
+    else:
+        query = await conn.execute(
+            "SELECT thread_id, title, created_at, updated_at FROM threads ORDER BY updated_at DESC, thread_id DESC LIMIT ?",
+            (limit + 1,),
+        )
+    rows = await query.fetchall()
+
+    threads = [
+        {'thread_id': row[0], 'title': row[1], 'created_at': row[2], 'timestamp': row[3]}
+        for row in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = threads[-1]
+        next_cursor = encode_cursor(last['timestamp'], last['thread_id'])
+    return threads, next_cursor
+
+
+def checkpoint_ms(checkpoint: dict) -> int:
+    """A checkpoint's ts (ISO 8601) in epoch milliseconds."""
+    return int(datetime.fromisoformat(checkpoint["ts"]).timestamp() * 1000)
+
+
+def title_of(checkpoint: dict) -> str:
+    for msg in checkpoint.get("channel_values", {}).get("messages", []):
+        if msg.__class__.__name__ == 'HumanMessage' and isinstance(msg.content, str):
+            return make_title(msg.content)
+    return "New Chat"
+
+
+async def _legacy_rows(conn: aiosqlite.Connection, serde, thread_ids: list[str]) -> list[tuple]:
+    """(thread_id, title, created_at, updated_at) from the first and latest checkpoint of each thread."""
+    placeholders = ",".join("?" * len(thread_ids))
+    query = await conn.execute(
+        f"""
+        SELECT c.thread_id, c.checkpoint_id = bounds.last_id, c.type, c.checkpoint
+        FROM checkpoints c JOIN (
+            SELECT thread_id, MIN(checkpoint_id) AS first_id, MAX(checkpoint_id) AS last_id FROM checkpoints
+            WHERE checkpoint_ns = '' AND thread_id IN ({placeholders}) GROUP BY thread_id
+        ) bounds ON c.thread_id = bounds.thread_id
+        WHERE c.checkpoint_ns = '' AND c.checkpoint_id IN (bounds.first_id, bounds.last_id)
+        """,
+        thread_ids,
+    )
+    checkpoints = {}
+    for thread_id, latest, type_, blob in await query.fetchall():
+        checkpoints.setdefault(thread_id, {})["latest" if latest else "first"] = serde.loads_typed((type_, blob))
+    rows = []
+    for thread_id, bounds in checkpoints.items():
+        # A thread with a single checkpoint has it as both first and latest
+        latest = bounds["latest"]
+        first = bounds.get("first", latest)
+        rows.append((thread_id, title_of(latest), checkpoint_ms(first), checkpoint_ms(latest), thread_id))
+    return rows
+
+
+async def backfill(db_path: str, serde, owner: str = None) -> int:
+    """
+    One-off migration: indexes threads that only exist in the checkpoints
+    table (written before the threads table existed), with the title of their
+    first user message and the timestamps of their first and latest
+    checkpoints, so the sidebar keeps its order.
+
+    Meant to run as a background task. It works on its own connection, one
+    query and one short transaction per batch of threads, and only in the
+    worker holding the backfill lease. Returns the number of threads indexed.
+    """
+    conn = await connect(db_path)
+    try:
+        if not await take_lease(conn, BACKFILL_LEASE_JOB, owner or f"{os.getpid()}", BACKFILL_LEASE_SECONDS):
+            logger.info("Thread index backfill skipped, another worker holds the lease")
+            return 0
+
+        query = await conn.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id NOT IN (SELECT thread_id FROM threads)"
+        )
+        missing = [row[0] for row in await query.fetchall()]
+        indexed = 0
+        for i in range(0, len(missing), BACKFILL_BATCH_THREADS):
+            rows = await _legacy_rows(conn, serde, missing[i:i + BACKFILL_BATCH_THREADS])
+            # A live turn may have indexed the thread meanwhile (keep its row), compaction may have deleted it
+            cursor = await conn.executemany(
+                """
+                INSERT OR IGNORE INTO threads (thread_id, title, created_at, updated_at)
+                SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM checkpoints WHERE thread_id = ?)
+                """,
+                rows,
+            )
+            await conn.commit()
+            indexed += cursor.rowcount
+            await asyncio.sleep(BACKFILL_PAUSE_SECONDS)
+
+        await conn.execute("DELETE FROM maintenance_leases WHERE job = ?", (BACKFILL_LEASE_JOB,))
+        await conn.commit()
+        if missing:
+            logger.info(f"Backfilled {indexed} threads into the thread index")
+        return indexed
+    except Exception as e:
+        logger.error(f"Error in thread index backfill: {type(e).__name__}")
+        return 0
+    finally:
+        await conn.close()
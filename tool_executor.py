@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from metrics import TOOL_CALLS, TOOL_DURATION, record_error
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Tool calls from one AIMessage that may run at the same time
+TOOL_MAX_PARALLEL = int(os.getenv("TOOL_MAX_PARALLEL", "4"))
+
+# Default deadline per tool call, in seconds
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "15"))
+
+
+def parse_timeouts(spec: str) -> dict[str, float]:
+    """Parses per-tool deadlines like "tavily_search=10,get_current_time_tool=2"."""
+    timeouts = {}
+    for item in (spec or "").split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+TOOL_TIMEOUTS = parse_timeouts(os.getenv("TOOL_TIMEOUTS", ""))
+
+# Characters of an exception's text passed back to the model (enough for a validation error)
+TOOL_ERROR_MESSAGE_CHARS = int(os.getenv("TOOL_ERROR_MESSAGE_CHARS", "1000"))
+
+
+def error_message(tool_call: dict, error: str, **details) -> ToolMessage:
+    """Structured error returned to the model in place of a tool result."""
+    content = json.dumps({"error": error, "tool": tool_call["name"], **details})
+    return ToolMessage(content=content, tool_call_id=tool_call["id"], name=tool_call["name"], status="error")
+
+
+def exception_message(tool_call: dict, e: Exception) -> ToolMessage:
+    """Error ToolMessage for a failed call, with the exception text so the model can fix its arguments."""
+    text = str(e)
+    if len(text) > TOOL_ERROR_MESSAGE_CHARS:
+        text = text[:TOOL_ERROR_MESSAGE_CHARS] + "..."
+    return error_message(tool_call, "tool_error", type=type(e).__name__, message=text)
+
+
+class ConcurrentToolNode:
+    """
+    Graph node that executes every tool call of the last AIMessage concurrently.
+
+    At most `max_parallel` calls run at once and each call has its own deadline
+    (`timeouts[name]`, else `default_timeout`). A call that times out or raises
+    comes back to the model as an error ToolMessage, so one slow web search does
+    not hold up the rest of the turn.
+
+    On the async path a timed-out call is cancelled. On the sync path each turn
+    runs its calls on a thread pool of its own: a thread can't be stopped, so a
+    timed-out call keeps its thread until the tool returns, but it no longer
+    holds a slot later turns need.
+    """
+
+    def __init__(self, tools: list, max_parallel: int = TOOL_MAX_PARALLEL,
+                 default_timeout: float = TOOL_TIMEOUT_SECONDS, timeouts: dict[str, float] = None):
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.max_parallel = max(1, max_parallel)
+        self.default_timeout = default_timeout
+        self.timeouts = TOOL_TIMEOUTS if timeouts is None else timeouts
+
+    def timeout_for(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    @staticmethod
+    def _tool_calls(state) -> list[dict]:
+        last_message = state['messages'][-1]
+        if isinstance(last_message, AIMessage):
+            return last_message.tool_calls
+        return []
+
+    @staticmethod
+    def _record(tool_call: dict, status: str, started: float = None):
+        TOOL_CALLS.inc(tool_call["name"], status)
+        if started is not None:
+            TOOL_DURATION.observe(time.perf_counter() - started, tool_call["name"])
+
+    async def _arun_one(self, tool_call: dict, semaphore: asyncio.Semaphore, config: RunnableConfig) -> ToolMessage:
+        tool = self.tools_by_name.get(tool_call["name"])
+        if tool is None:
+            self._record(tool_call, "unknown")
+            return error_message(tool_call, "unknown_tool")
+
+        timeout = self.timeout_for(tool_call["name"])
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(tool.ainvoke({**tool_call, "type": "tool_call"}, config), timeout)
+                self._record(tool_call, "ok", started)
+                return result
+            except asyncio.TimeoutError:
+                self._record(tool_call, "timeout", started)
+                logger.warning(f"Tool {tool_call['name']} timed out after {timeout}s")
+                return error_message(tool_call, "timeout", timeout_seconds=timeout)
+            except Exception as e:
+                self._record(tool_call, "error", started)
+                record_error("tool", e)
+                logger.error(f"Error in tool {tool_call['name']}: {type(e).__name__}")
+                return exception_message(tool_call, e)
+
+    async def ainvoke(self, state, config: RunnableConfig):
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        results = await asyncio.gather(*[
+            self._arun_one(tool_call, semaphore, config) for tool_call in self._tool_calls(state)
+        ])
+        return {"messages": list(results)}
+
+    def invoke(self, state, config: RunnableConfig):
+        """Sync path: tool calls run on a thread pool of this turn, with the same deadlines."""
+        tool_calls = self._tool_calls(state)
+        if not tool_calls:
+            return {"messages": []}
+        pool = ThreadPoolExecutor(max_workers=min(self.max_parallel, len(tool_calls)), thread_name_prefix="tool")
+        futures = []
+        for tool_call in tool_calls:
+            tool = self.tools_by_name.get(tool_call["name"])
+            if tool is None:
+                futures.append((None, None))
+                continue
+            futures.append((pool.submit(tool.invoke, {**tool_call, "type": "tool_call"}, config), time.perf_counter()))
+
+        results = []
+        try:
+            for tool_call, (future, submitted) in zip(tool_calls, futures):
+                if future is None:
+                    self._record(tool_call, "unknown")
+                    results.append(error_message(tool_call, "unknown_tool"))
+                    continue
+                timeout = self.timeout_for(tool_call["name"])
+                try:
+                    # Deadlines count from each call's submission, not from when we start waiting
+                    remaining = max(0.0, submitted + timeout - time.perf_counter())
+                    results.append(future.result(timeout=remaining))
+                    self._record(tool_call, "ok", submitted)
+                except FutureTimeoutError:
+                    future.cancel()
+                    self._record(tool_call, "timeout", submitted)
+                    logger.warning(f"Tool {tool_call['name']} timed out after {timeout}s")
+                    results.append(error_message(tool_call, "timeout", timeout_seconds=timeout))
+                except Exception as e:
+                    self._record(tool_call, "error", submitted)
+                    record_error("tool", e)
+                    logger.error(f"Error in tool {tool_call['name']}: {type(e).__name__}")
+                    results.append(exception_message(tool_call, e))
+        finally:
+            # Don't wait for timed-out calls: their threads finish (and exit) on their own
+            pool.shutdown(wait=False, cancel_futures=True)
+        return {"messages": results}
@@ -4,6 +4,7 @@ import logging
 from langchain_tavily import TavilySearch
 from langchain_core.tools import tool
 from tool_function import *
+from search_cache import CachedSearchTool
 
 from dotenv import load_dotenv
 
@@ -19,7 +20,8 @@ tools = []
 tavily_tool = None
 if os.getenv("TAVILY_API_KEY"):
     try:
-        tavily_tool = TavilySearch(max_results=3)
+        # Identical queries within the TTL share one Tavily request
+        tavily_tool = CachedSearchTool(TavilySearch(max_results=3))
         logger.info("Tavily Search tool loaded.")
     except Exception as e:
         logger.error(f"Error loading Tavily Search tool: {type(e).__name__}")
@@ -0,0 +1,599 @@
+import os
+import abc
+import sys
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import urllib.request
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Share of /chat/ requests whose spans are recorded and exported (0 turns tracing off, 1 traces all)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACING_ENABLED = TRACE_SAMPLE_RATE > 0
+
+# Where sampled traces go: "jsonl" (one span per line in TRACE_FILE) or "otlp" (OTLP/HTTP JSON)
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+
+# Spans waiting for the export thread; beyond this, traces are dropped rather than slowing requests
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "ai-chat")
+
+# The span new child spans attach to, per task / thread
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+# Trace id of the request being handled, sampled or not (log records carry it, see queue_logging.py)
+_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return "%032x" % random.getrandbits(128)
+
+
+def new_span_id() -> str:
+    return "%016x" % random.getrandbits(64)
+
+
+def parse_traceparent(header: str) -> Optional[tuple[str, str, bool]]:
+    """W3C traceparent "00-<trace id>-<parent id>-<flags>" -> (trace id, parent id, sampled)."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class Span:
+    """One timed operation of a trace. Times are wall-clock nanoseconds, as OTLP wants them."""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "events", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.events: list[tuple[int, str, dict]] = []
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def child(self, name: str, **attributes) -> "Span":
+        return self.trace.start_span(name, self.span_id, attributes)
+
+    def end(self, error: BaseException = None):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if error is not None:
+                self.error = type(error).__name__
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "events": [{"name": name, "time_ns": at, "attributes": attrs} for at, name, attrs in self.events],
+            "error": self.error,
+        }
+
+
+class Trace:
+    """The spans of one sampled request, exported together when the root span ends."""
+
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str] = None, **attributes):
+        self.trace_id = trace_id
+        self.spans: list[Span] = []
+        self.root = self.start_span(name, parent_id, attributes)
+
+    def start_span(self, name: str, parent_id: Optional[str], attributes: dict) -> Span:
+        span = Span(self, name, parent_id, attributes)
+        self.spans.append(span)
+        return span
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Child span of the current one, made current for the block. Outside a
+    sampled trace it yields None and costs a ContextVar lookup.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = parent.child(name, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def bind_trace_id(trace_id: str):
+    """Makes `trace_id` the current request's, for this task and the tasks it starts."""
+    _trace_id.set(trace_id)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+# ---------------------------------
+# Exporters
+# ---------------------------------
+
+class BatchExporter(abc.ABC):
+    """
+    Exports finished traces from a background thread, so the event loop only
+    pays for a queue put. When the queue is full the trace is dropped.
+    Subclasses implement `write`, which runs on that thread.
+    """
+
+    def __init__(self, max_queue: int = TRACE_QUEUE_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"exported": 0, "dropped": 0, "failed": 0}
+
+    def export(self, spans: list[Span]):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait([s.to_dict() for s in spans])
+        except queue.Full:
+            self.counters["dropped"] += len(spans)
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            # Whatever else is waiting goes out in the same write / request
+            stop = False
+            while True:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                batch.extend(more)
+            try:
+                self.write(batch)
+                self.counters["exported"] += len(batch)
+            except Exception as e:
+                self.counters["failed"] += len(batch)
+                logger.warning(f"Trace export failed: {type(e).__name__}")
+            if stop:
+                return
+
+    @abc.abstractmethod
+    def write(self, spans: list[dict]):
+        """Sends one batch of spans (as Span.to_dict()) to the backend."""
+
+    def close(self, timeout: float = 5.0):
+        """Flushes the queued traces and stops the export thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+class JsonlExporter(BatchExporter):
+    """Appends one JSON span per line to a local file."""
+
+    def __init__(self, path: str = TRACE_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def write(self, spans: list[dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(s, default=str) + "\n" for s in spans))
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def otlp_payload(spans: list[dict], service: str = SERVICE_NAME) -> dict:
+    """Spans as an OTLP/HTTP JSON ExportTraceServiceRequest."""
+    otlp_spans = []
+    for s in spans:
+        otlp_span = {
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "name": s["name"],
+            # SPAN_KIND_SERVER for the request, INTERNAL for the rest
+            "kind": 2 if s["parent_id"] is None else 1,
+            "startTimeUnixNano": str(s["start_ns"]),
+            "endTimeUnixNano": str(s["end_ns"] or s["start_ns"]),
+            "attributes": _otlp_attributes(s["attributes"]),
+            "events": [{"timeUnixNano": str(e["time_ns"]), "name": e["name"],
+                        "attributes": _otlp_attributes(e["attributes"])} for e in s["events"]],
+            # STATUS_CODE_ERROR / STATUS_CODE_OK
+            "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+        }
+        if s["parent_id"]:
+            otlp_span["parentSpanId"] = s["parent_id"]
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": service})},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+    }]}
+
+
+class OtlpExporter(BatchExporter):
+    """POSTs spans as OTLP/HTTP JSON to a collector (or to `python tracing.py --collector`)."""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, timeout: float = 5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def write(self, spans: list[dict]):
+        body = json.dumps(otlp_payload(spans), default=str).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def create_exporter(kind: str = TRACE_EXPORTER) -> BatchExporter:
+    if kind == "otlp":
+        return OtlpExporter()
+    if kind != "jsonl":
+        logger.warning(f"Unknown TRACE_EXPORTER {kind!r}, writing traces to {TRACE_FILE}")
+    return JsonlExporter()
+
+
+# ---------------------------------
+# Tracer
+# ---------------------------------
+
+class Tracer:
+    """
+    Per-request traces with head sampling: `start` decides once per request
+    whether its spans are recorded. An unsampled request gets no Trace, so
+    the callback handler is not attached and checkpoint spans are skipped.
+    """
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, exporter: BatchExporter = None):
+        self.sample_rate = sample_rate
+        self._exporter = exporter
+        self.counters = {"traces": 0, "sampled": 0}
+
+    @property
+    def exporter(self) -> BatchExporter:
+        if self._exporter is None:
+            self._exporter = create_exporter()
+        return self._exporter
+
+    def start(self, name: str, trace_id: str, parent_id: str = None, sampled: bool = None, **attributes) -> Optional[Trace]:
+        """
+        Starts the root span of a request and makes it current, or returns None
+        if the request is not sampled. `sampled` carries the caller's decision
+        from a traceparent header; it only applies when tracing is enabled.
+        """
+        self.counters["traces"] += 1
+        if self.sample_rate <= 0:
+            return None
+        if sampled is None:
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        if not sampled:
+            return None
+        self.counters["sampled"] += 1
+        trace = Trace(trace_id, name, parent_id, **attributes)
+        _current_span.set(trace.root)
+        return trace
+
+    def finish(self, trace: Optional[Trace], error: BaseException = None, **attributes):
+        """Ends the root span and hands the trace to the exporter."""
+        if trace is None:
+            return
+        trace.root.set(**attributes)
+        trace.root.end(error=error)
+        for s in trace.spans:
+            if s.end_ns is None:
+                # Cancelled before it could end (a timed-out tool, a cancelled run)
+                s.set(unfinished=True)
+                s.end()
+        self.exporter.export(trace.spans)
+
+    def close(self):
+        if self._exporter is not None:
+            self._exporter.close()
+
+    def stats(self) -> dict:
+        exported = self._exporter.counters if self._exporter else {}
+        return {**self.counters, **exported}
+
+
+# ---------------------------------
+# LangGraph / LangChain spans
+# ---------------------------------
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Turns the callbacks of one graph run into spans: the graph, each node,
+    each model call (with a first_token event) and each tool call. Other
+    runnables (channel writes, routing functions, ...) get no span; their
+    children attach to the closest traced ancestor.
+
+    It runs inline on the event loop (no executor hop per callback) and is
+    only attached to sampled requests.
+    """
+
+    run_inline = True
+
+    def __init__(self, trace: Trace, parent: Span = None):
+        self.trace = trace
+        self.parent = parent or trace.root
+        # run id -> (span, whether this run owns it)
+        self._runs: dict[UUID, tuple[Span, bool]] = {}
+
+    def _parent_of(self, parent_run_id: Optional[UUID]) -> Span:
+        if parent_run_id is not None and parent_run_id in self._runs:
+            return self._runs[parent_run_id][0]
+        return self.parent
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, **attributes):
+        span = self._parent_of(parent_run_id).child(name, **attributes)
+        self._runs[run_id] = (span, True)
+        return span
+
+    def _end(self, run_id: UUID, error: BaseException = None, **attributes) -> Optional[Span]:
+        span, owned = self._runs.pop(run_id, (None, False))
+        if owned:
+            span.set(**attributes)
+            span.end(error=error)
+        return span
+
+    # Chains: the graph itself and its nodes
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID = None,
+                       tags=None, metadata=None, **kwargs: Any):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        name = kwargs.get("name")
+        parent = self._parent_of(parent_run_id)
+        if parent_run_id is None:
+            self._start(run_id, parent_run_id, "graph", graph=name)
+        elif node and name == node and parent.attributes.get("node") != node:
+            # The node's inner callable carries the same name, it stays in the node span
+            self._start(run_id, parent_run_id, f"node {node}", node=node, step=metadata.get("langgraph_step"))
+        else:
+            self._runs[run_id] = (parent, False)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        # GraphInterrupt / ParentCommand also end up here; they are control flow, not failures
+        self._end(run_id, error=error)
+
+    # Model calls
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: UUID = None,
+                            tags=None, metadata=None, **kwargs: Any):
+        metadata = metadata or {}
+        # model_name is the configurable the router picks the tier with
+        model = metadata.get("model_name") or metadata.get("ls_model_name") or kwargs.get("name")
+        self._start(run_id, parent_run_id, "model", model=model, messages=len(messages[0]) if messages else 0)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: UUID = None, **kwargs: Any):
+        self._start(run_id, parent_run_id, "model", model=kwargs.get("name") or (serialized or {}).get("name"))
+
+    def on_llm_new_token(self, token, *, run_id: UUID, **kwargs: Any):
+        span, owned = self._runs.get(run_id, (None, False))
+        if owned and "first_token_ms" not in span.attributes:
+            span.event("first_token")
+            span.set(first_token_ms=round((time.time_ns() - span.start_ns) / 1e6, 3))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        attributes = {}
+        try:
+            usage = getattr(response.generations[0][0].message, "usage_metadata", None) or {}
+            if usage:
+                attributes = {"input_tokens": usage.get("input_tokens"), "output_tokens": usage.get("output_tokens")}
+        except (IndexError, AttributeError):
+            pass
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=error)
+
+    # Tools
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: UUID = None, **kwargs: Any):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start(run_id, parent_run_id, f"tool {name}", tool=name)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, status=getattr(output, "status", None))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=error)
+
+
+class TracedSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver with checkpoint put / get spans in sampled traces."""
+
+    async def aget_tuple(self, config):
+        with span("checkpoint.get", thread_id=config["configurable"].get("thread_id")):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with span("checkpoint.put", step=metadata.get("step"), source=metadata.get("source")):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with span("checkpoint.put_writes", writes=len(writes)):
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+
+# ---------------------------------
+# Reading traces
+# ---------------------------------
+
+def format_tree(spans: list[dict]) -> str:
+    """The spans of one trace as an indented tree, children in start order."""
+    children: dict[Optional[str], list[dict]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in sorted(spans, key=lambda s: s["start_ns"]):
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+    start = min((s["start_ns"] for s in spans), default=0)
+
+    lines = []
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            attributes = {k: v for k, v in s["attributes"].items() if v is not None}
+            details = " ".join(f"{k}={v}" for k, v in attributes.items())
+            error = f" ERROR {s['error']}" if s["error"] else ""
+            lines.append(f"{'  ' * depth}{s['name']:<{max(1, 28 - 2 * depth)}} "
+                         f"+{(s['start_ns'] - start) / 1e6:8.2f} ms {s['duration_ms'] or 0:8.2f} ms  {details}{error}")
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def read_traces(path: str) -> dict[str, list[dict]]:
+    traces: dict[str, list[dict]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                s = json.loads(line)
+                traces.setdefault(s["trace_id"], []).append(s)
+    return traces
+
+
+def otlp_spans(payload: dict) -> list[dict]:
+    """OTLP/HTTP JSON back into the flat span dicts of the JSONL exporter."""
+    def value(v):
+        return next(iter(v.values()), None) if v else None
+
+    spans = []
+    for resource in payload.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for s in scope.get("spans", []):
+                start_ns, end_ns = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                spans.append({
+                    "trace_id": s["traceId"],
+                    "span_id": s["spanId"],
+                    "parent_id": s.get("parentSpanId") or None,
+                    "name": s["name"],
+                    "start_ns": start_ns,
+                    "end_ns": end_ns,
+                    "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                    "attributes": {a["key"]: value(a["value"]) for a in s.get("attributes", [])},
+                    "events": [{"name": e["name"], "time_ns": int(e["timeUnixNano"]), "attributes": {}}
+                               for e in s.get("events", [])],
+                    "error": s.get("status", {}).get("message"),
+                })
+    return spans
+
+
+def run_collector(port: int = 4318, out_path: str = "traces-otlp.jsonl"):
+    """
+    Minimal OTLP/HTTP JSON collector for local runs: accepts POST /v1/traces
+    and appends the spans to `out_path` in the JSONL exporter's format.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            try:
+                spans = otlp_spans(json.loads(body))
+            except (ValueError, KeyError):
+                self.send_response(400)
+                self.end_headers()
+                return
+            with lock, open(out_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(s) + "\n" for s in spans))
+            print(f"Received {len(spans)} span(s) from {len({s['trace_id'] for s in spans})} trace(s)")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"OTLP collector stub on http://127.0.0.1:{port}/v1/traces, writing {out_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    # python tracing.py --collector [PORT]       run the OTLP collector stub
+    # python tracing.py [FILE] [TRACE_ID]        print the last (or given) trace as a tree
+    if len(sys.argv) > 1 and sys.argv[1] == "--collector":
+        run_collector(int(sys.argv[2]) if len(sys.argv) > 2 else 4318)
+    else:
+        traces = read_traces(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE)
+        trace_id = sys.argv[2] if len(sys.argv) > 2 else next(reversed(traces), None)
+        if trace_id in traces:
+            print(f"trace {trace_id}")
+            print(format_tree(traces[trace_id]))
+        else:
+            print("No trace found")